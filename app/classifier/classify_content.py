@@ -1,11 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import pickle
+from functools import lru_cache
 from urllib.error import URLError
+from paragraph_pipeline import load_pipeline, PIPELINE_FILEPATH
 from classifier.get_contributing import get_contributing_file
 from classifier.get_features import convert_paragraphs_into_features
 
+@lru_cache(maxsize=1)
+def load_classification_model():
+    """Loads the classification model once per process.
+
+    Returns:
+        The fitted pipeline and True if it is available, or the classification
+        model and False otherwise. In the last case, the paragraphs must be
+        converted into features before prediction (See get_features.py).
+    """
+    if os.path.isfile(PIPELINE_FILEPATH):
+        return load_pipeline(PIPELINE_FILEPATH), True
+
+    return pickle.load(open('classifier/classification_model.sav', 'rb')), False
+
+def predict_paragraphs(paragraphs):
+    """Predicts the categories of a list of paragraphs.
+
+    Args:
+        paragraphs (List of strings): Raw paragraphs of a documentation file.
+    Returns:
+        Array of strings: The category predicted for each paragraph.
+    """
+    model, is_pipeline = load_classification_model()
+
+    if is_pipeline:
+        return model.predict(paragraphs)
+
+    return model.predict(convert_paragraphs_into_features(paragraphs))
+
 def get_contributing_predictions(page, repository_url):
 
     try:
@@ -16,11 +48,8 @@ def get_contributing_predictions(page, repository_url):
             paragraphs = get_contributing_file(repository_url)
 
             if paragraphs:
-                # Loads the classification model.
-                model = pickle.load(open('classifier/classification_model.sav', 'rb'))
-
                 # Using the estimator, predicts the classes for the paragraphs in the file
-                predictions = model.predict(convert_paragraphs_into_features(paragraphs))
+                predictions = predict_paragraphs(paragraphs)
 
                 return paragraphs, predictions
     except Exception as e:
@@ -95,8 +95,19 @@ def split_file_into_paragraphs(content):
             github.github.com/gfm
     """
 
-    lines = content.splitlines()
-    text = []
+    return list(iter_paragraphs(content.splitlines()))
+
+def iter_paragraphs(lines):
+    """Splits the lines of a documentation file into paragraphs, as they are read.
+
+    It applies the rules described in split_file_into_paragraphs. Since it works
+    line by line, files of any size can be split without being loaded in memory.
+
+    Args:
+        lines: Iterable of strings (e.g. a file opened in text mode).
+    Returns:
+        Generator of strings, where each string represents a paragraph.
+    """
     paragraph = []
 
     for line in lines:
@@ -105,26 +116,23 @@ def split_file_into_paragraphs(content):
         # If line is empty, create a new paragraph
         if not line:
             if len(paragraph) > 0:
-                text.append('\n'.join(paragraph))
+                yield '\n'.join(paragraph)
                 paragraph = []
         # If line is a list item, create a new paragraph:
         elif line.startswith(('-','+','*'))\
              or re.match(r"\d{1,9}\..*", line)\
              or re.match(r"\d{1,9}\).*", line):
-             
+
             if len(paragraph) > 0:
-                text.append('\n'.join(paragraph))
-                paragraph = []                
+                yield '\n'.join(paragraph)
+                paragraph = []
             paragraph.append(line)
         # Else, append line to paragraph
         else:
             paragraph.append(line)
-    
-    if len(paragraph) > 0:
-        text.append('\n'.join(paragraph))
-        paragraph = []
 
-    return text
+    if len(paragraph) > 0:
+        yield '\n'.join(paragraph)
 
 def escape_markdown_from_file(project_filepath):
     """ Escape the markdown syntax and leave only plaintext. 
@@ -174,11 +174,13 @@ def convert_paragraphs_into_features(paragraphs):
     preprocessing_techniques = ['remove-stopwords', 'remove-punctuations', 'lemmatization']
     paragraphs = text_preprocessing(dataframe, preprocessing_techniques)
 
+    # The features are created from the preprocessed paragraphs,
+    # as in training (See import_sets in scripts/classifier).
     # print("Converting paragraphs into statistic features.")
-    statistic_features = create_statistic_features(dataframe)
+    statistic_features = create_statistic_features(paragraphs)
 
     # print("Converting paragraphs into heuristic features.")
-    heuristic_features = create_heuristic_features(dataframe)
+    heuristic_features = create_heuristic_features(paragraphs)
 
     # print("Selecting features with SelectPercentile (chi2).")
     best_features = select_features(pandas.concat([statistic_features, heuristic_features], axis=1))
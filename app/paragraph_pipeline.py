@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+# Attention:
+# This file is shared by the training scripts (scripts/classifier) and the
+# web application (app), including the text preprocessing and the matching
+# of heuristics used to create the features. The training scripts import it
+# from this folder (See scripts/classifier/main.py), since pickled pipelines
+# refer to the classes below by the module name `paragraph_pipeline`.
+
+import os
+import json
+import pickle
+import string
+import numpy
+import pandas
+import sklearn
+from scipy.sparse import csr_matrix
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.pipeline import Pipeline, FeatureUnion
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_selection import SelectPercentile, chi2
+
+# File of the pipeline trained by the training scripts (See train_final_pipeline
+# in scripts/classifier/main.py) and loaded by the web application.
+PIPELINE_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classifier', 'classification_pipeline.sav')
+
+# Version of the structure of the pipeline. Pipelines saved
+# with a different version can not be loaded.
+PIPELINE_VERSION = 1
+
+# Text preprocessing techniques applied on paragraphs before generating features
+PREPROCESSING_TECHNIQUES = ['remove-stopwords', 'remove-punctuations', 'lemmatization']
+
+# Arguments of the TF-IDF vectorizer used to create statistic features
+VECTORIZER_ARGS = {
+    'ngram_range': (1, 2),  # Google recomends: 1-gram + 2-grams
+    'strip_accents': 'unicode',
+    'decode_error': 'replace',
+    'stop_words': 'english',
+    'analyzer': 'word',
+}
+
+def text_preprocessing(X, techniques):
+    """Applies text processing techniques to a column of strings (paragraphs).
+
+    Before converting paragraphs into features, a good starting point may be to apply
+    pre-processing techniques that will remove unwanted information. This method contains
+    a series of submethods that represent common preprocessing techniques used in
+    machine learning.
+
+    Missing paragraphs (e.g. NaN) become empty strings, so the number of
+    paragraphs never changes and they stay aligned with their labels. Rows
+    without paragraphs must be removed beforehand, together with their labels.
+
+    X (Series or list): Strings with raw text for classification.
+    techniques (List of strings): Techniques to be applied in the text processing
+        process ('lowercase', 'remove-punctuations', 'remove-stopwords', 'stemming'
+        and 'lemmatization').
+
+    Returns:
+        Series: Column of strings updated with the values formated by the preprocessing
+        techniques defined as input.
+    """
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    from nltk.stem.porter import PorterStemmer
+
+    X = pandas.Series(X, dtype=object) if not isinstance(X, pandas.Series) else X
+    X = X.apply(lambda paragraph: paragraph if isinstance(paragraph, str) else '')
+
+    # The resources of each technique (e.g. stopwords) are created
+    # once, and only if the technique is applied.
+
+    def lowercase(paragraph):
+        # Transforms uppercase characters into lowercase
+        return paragraph.lower()
+
+    def remove_punctuations(paragraph):
+        # Removes all the punctuations of the text, including: !"#$%&'()*+, -./:;<=>?@[\]^_`{|}~
+        return paragraph.translate(punctuations)
+
+    def remove_stopwords(paragraph):
+        # Removes all the stopwords of the paragraph, such as: "the, for, but, nor"
+        return " ".join([word for word in paragraph.split() if word not in stop_words])
+
+    def stemming(paragraph):
+        # Applies a stemmer technique for each word
+        # Read about stemming at:
+        # nlp.stanford.edu/IR-book/html/htmledition/stemming-and-lemmatization-1.html
+        return " ".join([stemmer.stem(word) for word in paragraph.split()])
+
+    def lemmatization(paragraph):
+        # Applies a lemattizer for each word
+        # Read about lemmatization at:
+        # nlp.stanford.edu/IR-book/html/htmledition/stemming-and-lemmatization-1.html
+        return " ".join([lemmatizer.lemmatize(word) for word in paragraph.split()])
+
+    if 'lowercase' in techniques:
+        X = X.apply(lowercase)
+
+    if 'remove-punctuations' in techniques:
+        punctuations = str.maketrans('', '', string.punctuation)
+        X = X.apply(remove_punctuations)
+
+    if 'remove-stopwords' in techniques:
+        stop_words = set(stopwords.words('english'))
+        X = X.apply(remove_stopwords)
+
+    if 'stemming' in techniques:
+        stemmer = PorterStemmer()
+        X = X.apply(stemming)
+
+    if 'lemmatization' in techniques:
+        lemmatizer = WordNetLemmatizer()
+        X = X.apply(lemmatization)
+
+    return X
+
+def match_heuristics(nlp, X, heuristics):
+    """Applies the rules of a spaCy pipeline over paragraphs.
+
+    Args:
+        nlp: A spaCy pipeline containing an entity ruler.
+        X: A string column containing paragraphs.
+        heuristics: A list of strings representing the ids of the rules.
+
+    Returns:
+        A sparse matrix (CSR) where the value of a row (paragraph) and
+        column (rule) is 1 if the rule matches the paragraph or 0 otherwise.
+    """
+
+    columns = {heuristic: index for index, heuristic in enumerate(heuristics)}
+    rows, cols = [], []
+
+    for row, doc in enumerate(nlp.pipe(X, batch_size=256)):
+        for column in set(columns[heuristic.ent_id_] for heuristic in doc.ents):
+            rows.append(row)
+            cols.append(column)
+
+    data = numpy.ones(len(rows), dtype=numpy.int8)
+
+    return csr_matrix((data, (rows, cols)), shape=(len(X), len(heuristics)))
+
+class TextPreprocessor(BaseEstimator, TransformerMixin):
+    def __init__(self, techniques=None):
+        """Applies text processing techniques to paragraphs (See text_preprocessing).
+
+        Args:
+            techniques (List of strings, optional): Techniques to be applied.
+                If None, PREPROCESSING_TECHNIQUES are applied.
+        """
+        self.techniques = techniques
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        techniques = self.techniques if self.techniques is not None else PREPROCESSING_TECHNIQUES
+        return text_preprocessing(X, techniques)
+
+class HeuristicFeatures(BaseEstimator, TransformerMixin):
+    def __init__(self, patterns=None):
+        """Creates a set of features using a rule-based matching approach over paragraphs.
+
+        Each rule defines a column, set to 1 if the rule matches a paragraph
+        or 0 otherwise (See match_heuristics). The rules are kept inside the
+        object, so a saved pipeline does not depend on the `patterns.jsonl` file.
+
+        Args:
+            patterns (List of dictionaries): spaCy entity ruler patterns,
+                as loaded by load_patterns.
+        """
+        self.patterns = patterns
+
+    def fit(self, X, y=None):
+        # Different patterns may define the same rule, so each
+        # rule is a column, in the order they first appear.
+        self.heuristics_ = list(dict.fromkeys(pattern['id'] for pattern in self.patterns))
+        return self
+
+    def transform(self, X):
+        return match_heuristics(self._get_nlp(), X, self.heuristics_)
+
+    def get_feature_names(self):
+        return list(self.heuristics_)
+
+    def _get_nlp(self):
+        # The spaCy pipeline is created once per process, and it is
+        # not saved with the object (See __getstate__).
+        if getattr(self, '_nlp', None) is None:
+            from spacy.lang.en import English
+            self._nlp = English()
+            self._nlp.add_pipe("entity_ruler").add_patterns(self.patterns)
+
+        return self._nlp
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_nlp', None)
+        return state
+
+def load_patterns(filepath):
+    """Loads the rules used by HeuristicFeatures from a JSON Lines file.
+
+    Args:
+        filepath (String): Path to a `patterns.jsonl` file.
+    Returns:
+        List of dictionaries: spaCy entity ruler patterns.
+    """
+    with open(filepath, 'r', encoding='utf-8') as patterns_file:
+        return [json.loads(line) for line in patterns_file if line.strip()]
+
+def build_pipeline(estimator, patterns, techniques=None,
+                   vectorizer_args=VECTORIZER_ARGS, percentile=15):
+    """Creates the whole classification process as a single scikit-learn pipeline.
+
+    The pipeline receives raw paragraphs and applies, in sequence, the text
+    preprocessing techniques, the statistic (TF-IDF) and heuristic features,
+    the feature selection (SelectPercentile with chi2) and the estimator.
+
+    Args:
+        estimator: A scikit-learn classifier (e.g. OneVsRestClassifier(LinearSVC())).
+        patterns (List of dictionaries): Rules of the heuristic features (See load_patterns).
+        techniques (List of strings, optional): Text preprocessing techniques.
+            If None, PREPROCESSING_TECHNIQUES are applied.
+        vectorizer_args (Dictionary, optional): Arguments of the TF-IDF vectorizer.
+        percentile (Integer, optional): Percentile of features selected.
+    Returns:
+        Pipeline: The pipeline, not fitted.
+    """
+    features = FeatureUnion([
+        ('stat', TfidfVectorizer(**vectorizer_args)),
+        ('heur', HeuristicFeatures(patterns))
+    ])
+
+    return Pipeline([
+        ('preprocessing', TextPreprocessor(techniques)),
+        ('features', features),
+        ('selection', SelectPercentile(chi2, percentile=percentile)),
+        ('estimator', estimator)
+    ])
+
+def get_selected_feature_names(pipeline):
+    """Returns the names of the features used by the estimator of a fitted pipeline.
+
+    Args:
+        pipeline (Pipeline): A pipeline created by build_pipeline and fitted.
+    Returns:
+        Array of strings: Names of the features, with the `stat_` and `heur_` prefixes.
+    """
+    features = pipeline.named_steps['features']
+    names = []
+
+    for prefix, transformer in features.transformer_list:
+        names.extend(prefix + '_' + name for name in transformer.get_feature_names())
+
+    return numpy.array(names, dtype=object)[pipeline.named_steps['selection'].get_support()]
+
+def save_pipeline(pipeline, filepath, metadata=None):
+    """Saves a fitted pipeline, with its version, to a file.
+
+    Args:
+        pipeline (Pipeline): A fitted pipeline (See build_pipeline).
+        filepath (String): Path where the pipeline will be saved.
+        metadata (Dictionary, optional): Information about the training
+            (e.g. number of paragraphs used).
+    """
+    artifact = {
+        'version': PIPELINE_VERSION,
+        'sklearn_version': sklearn.__version__,
+        'metadata': metadata or {},
+        'pipeline': pipeline
+    }
+
+    with open(filepath, 'wb') as pipeline_file:
+        pickle.dump(artifact, pipeline_file)
+
+def load_pipeline(filepath):
+    """Loads a pipeline saved by save_pipeline.
+
+    Args:
+        filepath (String): Path where the pipeline was saved.
+    Returns:
+        Pipeline: The fitted pipeline.
+    """
+    with open(filepath, 'rb') as pipeline_file:
+        artifact = pickle.load(pipeline_file)
+
+    if artifact['version'] != PIPELINE_VERSION:
+        raise ValueError('The pipeline in {} has version {}, but version {} is expected.'.format(
+                         filepath, artifact['version'], PIPELINE_VERSION))
+
+    return artifact['pipeline']
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import tempfile
+import tracemalloc
+import pandas
+from scipy.sparse import hstack
+from sklearn.feature_selection import SelectPercentile, chi2
+
+from repository_paths import add_repository_paths, data_dir
+
+add_repository_paths()
+
+from data_preparation.generate_features import create_statistic_features, create_heuristic_features
+from paragraph_pipeline import PREPROCESSING_TECHNIQUES, text_preprocessing
+
+def measure_peak_memory(function, *args):
+    """Executes a function measuring its peak memory usage and execution time.
+
+    As in MemoryTracker.stage (See data_preparation/track_memory.py), a tracing
+    already active is not stopped, and the peak is measured above the memory
+    allocated before the function.
+
+    Args:
+        function: The function to be executed.
+        args: Arguments of the function.
+    Returns:
+        The result of the function, the peak of memory allocated during its
+        execution (in bytes) and its execution time (in seconds).
+    """
+    started_tracing = not tracemalloc.is_tracing()
+
+    if started_tracing:
+        tracemalloc.start()
+
+    # Without reset_peak (Python < 3.9), the peak is the
+    # highest one since the tracing started.
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+    before, _ = tracemalloc.get_traced_memory()
+
+    try:
+        started_at = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - started_at
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    return result, max(peak - before, 0), elapsed
+
+def sparse_features(X_train, y_train, X_test, heuristic_features, models_dir):
+    """Generates and selects the training features as sparse matrices (current implementation)."""
+    train_statistic, test_statistic, _ = create_statistic_features(X_train, X_test, models_dir=models_dir)
+    train_heuristic, test_heuristic = heuristic_features
+
+    train_features = hstack([train_statistic, train_heuristic], format='csr')
+    test_features = hstack([test_statistic, test_heuristic], format='csr')
+
+    selector = SelectPercentile(chi2, percentile=15).fit(train_features, y_train)
+    return selector.transform(train_features), selector.transform(test_features)
+
+def dense_features(X_train, y_train, X_test, heuristic_features, models_dir):
+    """Generates and selects the training features as dataframes (previous implementation)."""
+    train_statistic, test_statistic, statistic_names = create_statistic_features(X_train, X_test, models_dir=models_dir)
+    train_heuristic, test_heuristic = heuristic_features
+
+    train_statistic = pandas.DataFrame(train_statistic.toarray(), columns=statistic_names)
+    test_statistic = pandas.DataFrame(test_statistic.toarray(), columns=statistic_names)
+    train_heuristic = pandas.DataFrame(train_heuristic.toarray())
+    test_heuristic = pandas.DataFrame(test_heuristic.toarray())
+
+    train_features = pandas.concat([train_statistic, train_heuristic], axis=1)
+    test_features = pandas.concat([test_statistic, test_heuristic], axis=1)
+
+    selector = SelectPercentile(chi2, percentile=15).fit(train_features.values, y_train)
+    return selector.transform(train_features.values), selector.transform(test_features.values)
+
+def benchmark_features_memory(train_filepath, test_filepath, n_samples=None):
+    """Compares the peak memory of the sparse and dense training feature paths.
+
+    The heuristic features are generated once, before the measurements, since
+    both paths use them in the same way.
+
+    Args:
+        train_filepath (String): Filepath of the train set (CSV).
+        test_filepath (String): Filepath of the test set (CSV).
+        n_samples (Integer, optional): Number of training paragraphs used. 
+            Defaults to None (all paragraphs).
+    Returns:
+        List of dictionaries: Peak memory and time of each path.
+    """
+    train_data = pandas.read_csv(train_filepath)
+    test_data = pandas.read_csv(test_filepath)
+
+    if n_samples is not None:
+        train_data = train_data.sample(n=min(n_samples, len(train_data)), random_state=42)
+
+    X_train = text_preprocessing(train_data['Paragraph'], PREPROCESSING_TECHNIQUES)
+    X_test = text_preprocessing(test_data['Paragraph'], PREPROCESSING_TECHNIQUES)
+    y_train = train_data.loc[X_train.index, 'Label']
+
+    train_heuristic, test_heuristic, _ = create_heuristic_features(X_train, X_test)
+    heuristic_features = (train_heuristic, test_heuristic)
+
+    results = []
+
+    # The fitted vectorizers are not used after the benchmark.
+    with tempfile.TemporaryDirectory() as models_dir:
+        for name, function in [('sparse', sparse_features), ('dense', dense_features)]:
+            (train_features, _), peak, elapsed = measure_peak_memory(function, X_train, y_train, X_test,
+                                                                     heuristic_features, models_dir)
+            results.append({'path': name, 'paragraphs': len(X_train), 'selected_features': train_features.shape[1],
+                            'peak_memory_mb': round(peak / 2 ** 20, 1), 'seconds': round(elapsed, 2)})
+
+    for result in results:
+        print('{path}: {paragraphs} paragraphs, {selected_features} features selected, '
+              'peak memory {peak_memory_mb} MB, {seconds} s.'.format(**result))
+
+    return results
+
+if __name__ == '__main__':
+    train_filepath = os.path.join(data_dir, 'train.csv')
+    test_filepath = os.path.join(data_dir, 'test.csv')
+
+    benchmark_features_memory(train_filepath, test_filepath)
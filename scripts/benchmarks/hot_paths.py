@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import json
+import time
+import shutil
+import statistics
+import subprocess
+from datetime import datetime
+import pandas
+from scipy.sparse import hstack
+from sklearn.svm import LinearSVC
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from repository_paths import add_repository_paths, app_dir, data_dir, results_dir, working_directory
+
+add_repository_paths()
+
+from features_memory import measure_peak_memory
+from paragraph_pipeline import PREPROCESSING_TECHNIQUES, text_preprocessing
+from data_preparation.generate_features import VECTORIZER_ARGS, create_heuristic_features
+from data_preparation.select_features import compute_chi2_scores, create_selector
+from data_preparation.read_documents import list_documentation_files, iter_docx_lines
+
+# Techniques measured one by one (See text_preprocessing in paragraph_pipeline.py)
+TECHNIQUES = ['lowercase', 'remove-punctuations', 'remove-stopwords', 'stemming', 'lemmatization']
+
+# A benchmark is reported as a slowdown when it is this many
+# times slower than in the last run of a different commit.
+SLOWDOWN_THRESHOLD = 1.2
+
+def load_fixtures(data_dir, n_paragraphs=1000, n_documents=20):
+    """Loads the inputs of the benchmarks from the data of the repository.
+
+    Args:
+        data_dir (String): The data folder of the repository.
+        n_paragraphs (Integer, optional): Number of paragraphs sampled from the train set.
+        n_documents (Integer, optional): Number of documentation files read from
+            data/documentation/raw.
+    Returns:
+        Dictionary: Raw and preprocessed paragraphs, labels and documents.
+    """
+    train_data = pandas.read_csv(os.path.join(data_dir, 'train.csv')).dropna(subset=['Paragraph'])
+    train_data = train_data.sample(n=min(n_paragraphs, len(train_data)), random_state=42)
+    test_data = pandas.read_csv(os.path.join(data_dir, 'test.csv')).dropna(subset=['Paragraph'])
+
+    filepaths = list_documentation_files(os.path.join(data_dir, 'documentation', 'raw'))
+
+    return {
+        'paragraphs': train_data['Paragraph'],
+        'labels': train_data['Label'],
+        'preprocessed': text_preprocessing(train_data['Paragraph'], PREPROCESSING_TECHNIQUES),
+        'test_preprocessed': text_preprocessing(test_data['Paragraph'], PREPROCESSING_TECHNIQUES),
+        'documents': ['\n'.join(iter_docx_lines(filepath)) for filepath in filepaths[:n_documents]],
+    }
+
+def measure(function, *args, repeat=5):
+    """Measures a function: the duration of `repeat` executions, and the
+    peak memory of one more execution (tracemalloc slows the execution, so
+    it is not active while the time is measured)."""
+    durations = []
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - started_at)
+
+    _, peak, _ = measure_peak_memory(function, *args)
+
+    return {'seconds_median': round(statistics.median(durations), 6), 'seconds_min': round(min(durations), 6),
+            'peak_memory_mb': round(peak / 2 ** 20, 2)}
+
+class StubGitHubAPI:
+    """Replaces scrap_github_api.Create, answering the requests of
+    get_contributing_file with a local document."""
+    document = ''
+
+    def request(self, url, parameters={}, headers={}, file_type='json'):
+        if url.endswith('/community/profile'):
+            return {'files': {'contributing': {'url': url.replace('community/profile', 'contents/CONTRIBUTING.md')}}}
+        if url.endswith('/contents/CONTRIBUTING.md'):
+            return {'download_url': url + '?raw'}
+
+        return self.document
+
+class StubPage:
+    """Replaces the Streamlit page used to report errors."""
+    def error(self, message):
+        raise RuntimeError(message)
+
+def create_end_to_end_benchmark(document):
+    """Returns a function that runs get_contributing_predictions over a document,
+    without network access. If cmark-gfm is not installed, the markdown is not
+    converted to plaintext."""
+    import classifier.get_contributing as get_contributing
+    from classifier.classify_content import get_contributing_predictions
+
+    StubGitHubAPI.document = document
+
+    def run():
+        original_api, original_escape = get_contributing.scraper.Create, get_contributing.escape_markdown_from_file
+        get_contributing.scraper.Create = StubGitHubAPI
+
+        if shutil.which('cmark-gfm') is None:
+            get_contributing.escape_markdown_from_file = lambda filepath: open(filepath, encoding='utf-8').read()
+
+        try:
+            return get_contributing_predictions(StubPage(), 'https://github.com/owner/repository')
+        finally:
+            get_contributing.scraper.Create, get_contributing.escape_markdown_from_file = original_api, original_escape
+
+    return run
+
+def run_benchmarks(fixtures, repeat=5):
+    """Runs each benchmark over the fixtures.
+
+    Returns:
+        List of dictionaries: Time and peak memory of each benchmark.
+    """
+    from classifier.get_contributing import split_file_into_paragraphs
+
+    paragraphs, labels = fixtures['paragraphs'], fixtures['labels']
+    preprocessed, test_preprocessed = fixtures['preprocessed'], fixtures['test_preprocessed']
+    documents = fixtures['documents']
+    benchmarks = []
+
+    benchmarks.append(('split_file_into_paragraphs', len(documents),
+                       lambda: [split_file_into_paragraphs(document) for document in documents]))
+
+    for technique in TECHNIQUES:
+        benchmarks.append(('text_preprocessing[{}]'.format(technique), len(paragraphs),
+                           lambda technique=technique: text_preprocessing(paragraphs, [technique])))
+
+    vectorizer = TfidfVectorizer(**VECTORIZER_ARGS).fit(preprocessed)
+    benchmarks.append(('tfidf_transform', len(test_preprocessed), lambda: vectorizer.transform(test_preprocessed)))
+
+    benchmarks.append(('heuristic_features', len(preprocessed), lambda: create_heuristic_features(preprocessed, [])))
+
+    train_heuristic, test_heuristic, _ = create_heuristic_features(preprocessed, test_preprocessed)
+    train_features = hstack([vectorizer.transform(preprocessed), train_heuristic], format='csr')
+    test_features = hstack([vectorizer.transform(test_preprocessed), test_heuristic], format='csr')
+
+    benchmarks.append(('feature_selection', len(preprocessed),
+                       lambda: create_selector(*compute_chi2_scores(train_features, labels)).transform(train_features)))
+
+    selector = create_selector(*compute_chi2_scores(train_features, labels))
+    model = OneVsRestClassifier(LinearSVC(tol=0.001, C=1, max_iter=500)).fit(selector.transform(train_features), labels)
+    selected_test_features = selector.transform(test_features)
+    benchmarks.append(('predict', len(test_preprocessed), lambda: model.predict(selected_test_features)))
+
+    end_to_end = create_end_to_end_benchmark(max(documents, key=len))
+    benchmarks.append(('get_contributing_predictions', 1, end_to_end))
+
+    results = []
+
+    # The web application loads its models with paths relative to its folder.
+    with working_directory(app_dir):
+        for name, size, function in benchmarks:
+            result = {'benchmark': name, 'size': size}
+            result.update(measure(function, repeat=repeat))
+            results.append(result)
+            print('{benchmark} ({size}): {seconds_median} s (min. {seconds_min} s), '
+                  'peak memory {peak_memory_mb} MB.'.format(**result))
+
+    return results
+
+def get_commit():
+    """Returns the current commit of the repository, or None outside of git."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_with_history(results, history_filepath, commit):
+    """Compares the results with the last run of a different commit stored in
+    the history, reporting the benchmarks that became slower.
+
+    Returns:
+        List of dictionaries: Benchmarks slower than SLOWDOWN_THRESHOLD times.
+    """
+    previous = {}
+
+    if os.path.isfile(history_filepath):
+        with open(history_filepath, 'r', encoding='utf-8') as history_file:
+            for line in history_file:
+                if line.strip():
+                    record = json.loads(line)
+
+                    if record['commit'] != commit:
+                        previous = {result['benchmark']: dict(result, commit=record['commit'])
+                                    for result in record['results']}
+
+    slowdowns = []
+
+    for result in results:
+        if result['benchmark'] in previous and previous[result['benchmark']]['size'] == result['size']:
+            before = previous[result['benchmark']]
+            ratio = result['seconds_median'] / max(before['seconds_median'], 1e-9)
+
+            if ratio > SLOWDOWN_THRESHOLD:
+                slowdowns.append({'benchmark': result['benchmark'], 'commit': before['commit'], 'ratio': round(ratio, 2)})
+                print('Slowdown: {benchmark} is {ratio}x slower than in {commit}.'.format(**slowdowns[-1]))
+
+    return slowdowns
+
+def benchmark_hot_paths(data_dir, history_filepath, n_paragraphs=1000, n_documents=20, repeat=5):
+    """Measures the time and peak memory of the hot paths of the classifier
+    and of the web application, and saves them in a history file (JSON lines,
+    one line per run) to compare different commits.
+
+    Args:
+        data_dir (String): The data folder of the repository.
+        history_filepath (String): File where the results of each run are appended.
+        n_paragraphs (Integer, optional): Number of paragraphs sampled from the train set.
+        n_documents (Integer, optional): Number of documentation files used by the
+            paragraph splitting benchmark.
+        repeat (Integer, optional): Number of executions timed in each benchmark.
+    Returns:
+        List of dictionaries: Results of the benchmarks.
+    """
+    fixtures = load_fixtures(data_dir, n_paragraphs, n_documents)
+    results = run_benchmarks(fixtures, repeat)
+
+    commit = get_commit()
+    compare_with_history(results, history_filepath, commit)
+
+    if not os.path.isdir(os.path.dirname(history_filepath)):
+        os.makedirs(os.path.dirname(history_filepath))
+
+    with open(history_filepath, 'a', encoding='utf-8') as history_file:
+        record = {'commit': commit, 'date': datetime.now().isoformat(timespec='seconds'), 'results': results}
+        history_file.write(json.dumps(record) + '\n')
+
+    return results
+
+if __name__ == '__main__':
+    benchmark_hot_paths(data_dir, os.path.join(results_dir, 'hot_paths.jsonl'))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import tempfile
+import numpy
+from sklearn.svm import LinearSVC
+from sklearn.metrics import f1_score
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from repository_paths import add_repository_paths, data_dir
+
+add_repository_paths()
+
+from data_preparation.prepare_data import import_sets
+from classification.oversampling import create_classifier, oversample_data
+
+def benchmark_imbalance_strategies(train_filepath, test_filepath, strategies, n_splits=10, cache_dir=None):
+    """Compares the runtime and the F1 weighted of the oversampling strategies.
+
+    Each strategy is evaluated with a stratified cross-validation of the final
+    estimator (LinearSVC, one-vs-rest) over the selected training features. The
+    oversampling is applied only to the training instances of each fold.
+
+    Args:
+        train_filepath (String): Filepath of the train set (CSV).
+        test_filepath (String): Filepath of the test set (CSV).
+        strategies (List): Oversampling strategies (See OVERSAMPLING_STRATEGIES
+            in classification/oversampling.py).
+        n_splits (Integer, optional): Number of folds.
+        cache_dir (String, optional): Folder where the features are cached
+            (See import_sets in prepare_data.py).
+    Returns:
+        List of dictionaries: Time spent oversampling and training, and F1
+            weighted (mean and standard deviation) of each strategy.
+    """
+
+    # The fitted vectorizer and selector are not used after the benchmark.
+    with tempfile.TemporaryDirectory() as models_dir:
+        X_train, y_train, _, _, _, _, _ = import_sets(train_filepath, test_filepath, 'Paragraph', 'Label',
+                                                      cache_dir=cache_dir, models_dir=models_dir)
+
+    y_train = numpy.asarray(y_train)
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42)
+    results = []
+
+    for strategy in strategies:
+        resampling_seconds, training_seconds, scores = 0.0, 0.0, []
+        model = OneVsRestClassifier(create_classifier(LinearSVC(tol=0.001, C=1, max_iter=500), strategy))
+
+        for train_index, test_index in cv.split(X_train, y_train):
+            started_at = time.perf_counter()
+            X_resampled, y_resampled = oversample_data(X_train[train_index], y_train[train_index], strategy)
+            resampling_seconds += time.perf_counter() - started_at
+
+            started_at = time.perf_counter()
+            model.fit(X_resampled, y_resampled)
+            training_seconds += time.perf_counter() - started_at
+
+            scores.append(f1_score(y_train[test_index], model.predict(X_train[test_index]), average='weighted'))
+
+        results.append({'strategy': str(strategy), 'resampling_seconds': round(resampling_seconds, 2),
+                        'training_seconds': round(training_seconds, 2),
+                        'f1_weighted_mean': round(numpy.mean(scores), 4),
+                        'f1_weighted_std': round(numpy.std(scores), 4)})
+
+    for result in results:
+        print('{strategy}: oversampling {resampling_seconds} s, training {training_seconds} s, '
+              'F1 weighted {f1_weighted_mean} (+/- {f1_weighted_std}).'.format(**result))
+
+    return results
+
+if __name__ == '__main__':
+    train_filepath = os.path.join(data_dir, 'train.csv')
+    test_filepath = os.path.join(data_dir, 'test.csv')
+
+    benchmark_imbalance_strategies(train_filepath, test_filepath,
+                                   [False, True, 'class_weight', 'random', 'sparse_smote'],
+                                   cache_dir=os.path.join(data_dir, 'features-cache'))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import tempfile
+import pandas
+
+from repository_paths import add_repository_paths, data_dir, results_dir
+
+add_repository_paths()
+
+import validate
+from langdetect import detect
+from langdetect.lang_detect_exception import LangDetectException
+from export import split_into_paragraphs, write_analysis_file
+from data_preparation.read_documents import list_documentation_files, iter_docx_lines
+
+# Number of documents validated at a time, as in the validate stage of the scraper
+BATCH_SIZE = 16
+
+def load_documents(raw_dir, n_documents=1000):
+    """Reads the content of the first documentation files of the raw folder
+    (data/documentation/raw), in the format returned by scrap_documentation_file."""
+    return [{'filename': 'CONTRIBUTING.md', 'content': '\n'.join(iter_docx_lines(filepath))}
+            for filepath in list_documentation_files(raw_dir)[:n_documents]]
+
+def detect_whole_document(document):
+    """English filter before the validator was bounded: langdetect on the whole content."""
+    try:
+        return detect(document['content']) == 'en'
+    except LangDetectException:
+        return False
+
+def validate_batches(documents):
+    """English filter of the scraper: batches of documents validated in one call each."""
+    return [verdict for start in range(0, len(documents), BATCH_SIZE)
+            for verdict in validate.validate_documentation_contents(documents[start:start + BATCH_SIZE])]
+
+def export_documents(documents, output_dir):
+    """Export step of the scraper, without the conversion to plaintext (cmark-gfm):
+    the paragraphs of each document are written in a spreadsheet."""
+    for index, document in enumerate(documents):
+        write_analysis_file('contributing', split_into_paragraphs(document['content']),
+                            os.path.join(output_dir, '{}.xlsx'.format(index)))
+
+def benchmark_language_validation(raw_dir, output_filepath, n_documents=1000):
+    """Compares the cost of the English filter of the scraper with the previous
+    filter (langdetect on the whole content) and with the export step, over real
+    documentation files. Downloading the files waits for GitHub API, so the fetch
+    step is not measured here. The results are saved in a CSV file.
+
+    Args:
+        raw_dir (String): Folder of the raw documentation files (.docx).
+        output_filepath (String): CSV file where the results are saved.
+        n_documents (Integer, optional): Number of documents used.
+    Returns:
+        Dataframe: Seconds and milliseconds per document of each step.
+    """
+    documents = load_documents(raw_dir, n_documents)
+    steps = [('english_filter_whole_document', lambda: [detect_whole_document(document) for document in documents]),
+             ('english_filter', lambda: validate_batches(documents)),
+             ('english_filter_cached', lambda: validate_batches(documents))]
+    results = []
+
+    # The first execution of the current filter starts with an empty cache.
+    validate._languages_detected.clear()
+
+    for name, function in steps:
+        started_at = time.perf_counter()
+        function()
+        results.append({'step': name, 'seconds': time.perf_counter() - started_at})
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        started_at = time.perf_counter()
+        export_documents(documents, output_dir)
+        results.append({'step': 'export_without_plaintext', 'seconds': time.perf_counter() - started_at})
+
+    results = pandas.DataFrame(results)
+    results['ms_per_document'] = (results['seconds'] * 1000 / len(documents)).round(2)
+    results['seconds'] = results['seconds'].round(2)
+
+    if not os.path.isdir(os.path.dirname(output_filepath)):
+        os.makedirs(os.path.dirname(output_filepath))
+
+    results.to_csv(output_filepath, index=False)
+    print('{} documents:'.format(len(documents)))
+    print(results.to_string(index=False))
+
+    return results
+
+if __name__ == '__main__':
+    benchmark_language_validation(os.path.join(data_dir, 'documentation', 'raw'),
+                                  os.path.join(results_dir, 'language_validation.csv'))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import sys
+from contextlib import contextmanager
+
+# Folders used by the benchmarks:
+# repository/scripts/classifier/
+classifier_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'classifier'))
+# repository/scripts/scraper/
+scraper_dir = os.path.normpath(os.path.join(classifier_dir, '..', 'scraper'))
+# repository/app/
+app_dir = os.path.normpath(os.path.join(classifier_dir, '..', '..', 'app'))
+# repository/data/
+data_dir = os.path.normpath(os.path.join(classifier_dir, '..', '..', 'data'))
+# repository/results/benchmarks/
+results_dir = os.path.normpath(os.path.join(classifier_dir, '..', '..', 'results', 'benchmarks'))
+
+def add_repository_paths():
+    """Adds the folders of the modules used by the benchmarks to the path: the
+    classifier folder, the folder of the web application (e.g. paragraph_pipeline.py,
+    classifier/get_contributing.py) and the scraper folder (e.g. validate.py). It must
+    be called before these modules are imported."""
+    if classifier_dir not in sys.path:
+        sys.path.insert(0, classifier_dir)
+
+    for directory in [app_dir, scraper_dir]:
+        if directory not in sys.path:
+            sys.path.append(directory)
+
+@contextmanager
+def working_directory(directory):
+    """Executes the code inside a `with` block in another working directory,
+    e.g. the web application, which loads its models with paths relative to
+    its folder."""
+    previous_dir = os.getcwd()
+    os.chdir(directory)
+
+    try:
+        yield
+    finally:
+        os.chdir(previous_dir)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import pickle
+import tempfile
+import numpy
+import pandas
+from scipy.sparse import hstack
+
+from repository_paths import add_repository_paths, app_dir, data_dir, results_dir, working_directory
+
+add_repository_paths()
+
+from features_memory import measure_peak_memory
+from synthetic_corpus import load_paragraphs, generate_document, generate_corpus, DOCUMENT_SIZES, CORPUS_SIZES
+from paragraph_pipeline import PREPROCESSING_TECHNIQUES, text_preprocessing
+from data_preparation.generate_features import create_statistic_features, create_heuristic_features
+from data_preparation.select_features import compute_chi2_scores, create_selector
+
+# A stage is flagged when its cost grows faster than size ** SUPERLINEAR_EXPONENT
+SUPERLINEAR_EXPONENT = 1.2
+
+def create_inference_stages():
+    """Returns the stages used by the web application to classify a CONTRIBUTING
+    file with the classification model (See classify_content.py and get_features.py).
+    Each stage receives the outputs of the previous stages. The web application loads
+    its models with paths relative to its folder, so the stages must be executed there."""
+    from classifier.get_contributing import split_file_into_paragraphs
+    import classifier.get_features as app_features
+
+    model = pickle.load(open('classifier/classification_model.sav', 'rb'))
+    techniques = ['remove-stopwords', 'remove-punctuations', 'lemmatization']
+
+    return [
+        ('split', lambda state: pandas.Series(split_file_into_paragraphs(state['input']))),
+        ('preprocessing', lambda state: app_features.text_preprocessing(state['split'], techniques)),
+        ('statistic_features', lambda state: app_features.create_statistic_features(state['preprocessing'])),
+        ('heuristic_features', lambda state: app_features.create_heuristic_features(state['preprocessing'])),
+        ('selection', lambda state: app_features.select_features(
+            pandas.concat([state['statistic_features'], state['heuristic_features']], axis=1))),
+        ('predict', lambda state: model.predict(state['selection'])),
+    ]
+
+def create_training_stages(models_dir):
+    """Returns the stages used to create the training features (See import_sets
+    in prepare_data.py). Each stage receives the outputs of the previous stages.
+    The fitted vectorizer is saved in models_dir."""
+    return [
+        ('preprocessing', lambda state: text_preprocessing(state['input']['Paragraph'], PREPROCESSING_TECHNIQUES)),
+        ('statistic_features', lambda state: create_statistic_features(state['preprocessing'], [], models_dir=models_dir)[0]),
+        ('heuristic_features', lambda state: create_heuristic_features(state['preprocessing'], [])[0]),
+        ('concat', lambda state: hstack([state['statistic_features'], state['heuristic_features']], format='csr')),
+        ('selection', lambda state: create_selector(*compute_chi2_scores(
+            state['concat'], state['input'].loc[state['preprocessing'].index, 'Label'])).transform(state['concat'])),
+    ]
+
+def run_stages(stages, data, measure_memory=True):
+    """Executes the stages over an input, measuring the time of each stage
+    and, in a second execution, its peak memory (tracemalloc slows the
+    execution, so it is not active while the time is measured).
+
+    Returns:
+        List of dictionaries: Time and peak memory of each stage.
+    """
+    results = []
+    state = {'input': data}
+
+    for name, function in stages:
+        started_at = time.perf_counter()
+        state[name] = function(state)
+        results.append({'stage': name, 'seconds': time.perf_counter() - started_at})
+
+    if measure_memory:
+        state = {'input': data}
+
+        for result, (name, function) in zip(results, stages):
+            state[name], peak, _ = measure_peak_memory(function, state)
+            result['peak_memory_mb'] = round(peak / 2 ** 20, 2)
+
+    return results
+
+def estimate_growth(measurements, column):
+    """Fits cost = a * size ** b for each stage, in log-log scale.
+
+    Returns:
+        Dictionary: The exponent b of each stage, or NaN when there are less
+        than three positive measurements.
+    """
+    exponents = {}
+
+    for stage, group in measurements.groupby('stage', sort=False):
+        group = group[group[column] > 0]
+
+        if len(group) < 3:
+            exponents[stage] = numpy.nan
+        else:
+            exponents[stage] = numpy.polyfit(numpy.log(group['size']), numpy.log(group[column]), 1)[0]
+
+    return exponents
+
+def benchmark_scaling(source_filepath, results_dir, document_sizes=DOCUMENT_SIZES, corpus_sizes=CORPUS_SIZES,
+                      measure_memory=True, max_seconds=600):
+    """Measures how the time and the memory of the inference path (web application)
+    and of the training feature path grow with the size of their input.
+
+    The inputs are synthetic CONTRIBUTING documents (inference) and corpora
+    (training) generated from real paragraphs (See synthetic_corpus.py). The growth
+    of each stage is fitted as a power of the input size, and stages growing faster
+    than linearly are reported. The measurements are saved in scaling.csv and the
+    fitted exponents in scaling_growth.csv.
+
+    Args:
+        source_filepath (String): Filepath of an annotated set (e.g. data/train.csv).
+        results_dir (String): Folder where the results are saved.
+        document_sizes (List of integers, optional): Sizes of the documents in bytes.
+        corpus_sizes (List of integers, optional): Sizes of the corpora in paragraphs.
+        measure_memory (Boolean, optional): If the peak memory of each stage is measured.
+        max_seconds (Integer, optional): Larger sizes of a path are skipped once
+            an execution of the path takes longer than this.
+    Returns:
+        Two dataframes: The measurements and the fitted exponents of each stage.
+    """
+    data = load_paragraphs(source_filepath)
+    measurements = []
+
+    # The fitted vectorizers of the training path are not used after the benchmark.
+    with tempfile.TemporaryDirectory() as models_dir:
+        paths = [('inference', app_dir, create_inference_stages, document_sizes,
+                  lambda size: generate_document(data['Paragraph'], size, random_state=42)),
+                 ('training', os.curdir, lambda: create_training_stages(models_dir), corpus_sizes,
+                  lambda size: generate_corpus(data, size, random_state=42))]
+
+        # The web application loads its models with paths relative to its folder.
+        for path, working_dir, create_stages, sizes, generate in paths:
+            with working_directory(working_dir):
+                stages = create_stages()
+
+                for size in sizes:
+                    results = run_stages(stages, generate(size), measure_memory)
+                    elapsed = sum(result['seconds'] for result in results)
+
+                    for result in results:
+                        measurements.append(dict(result, path=path, size=size))
+
+                    print('{} path, size {}: {:.2f} s.'.format(path, size, elapsed))
+
+                    if elapsed > max_seconds:
+                        print('Larger sizes of the {} path are skipped.'.format(path))
+                        break
+
+    measurements = pandas.DataFrame(measurements)
+    growth = []
+
+    for path, group in measurements.groupby('path', sort=False):
+        columns = ['seconds', 'peak_memory_mb'] if measure_memory else ['seconds']
+        exponents = {column: estimate_growth(group, column) for column in columns}
+
+        for stage in exponents['seconds']:
+            row = {'path': path, 'stage': stage}
+            row.update({column + '_exponent': round(exponents[column][stage], 2) for column in columns})
+            row['superlinear'] = any(row[column + '_exponent'] > SUPERLINEAR_EXPONENT for column in columns)
+            growth.append(row)
+
+            if row['superlinear']:
+                print('Superlinear: {}/{} grows as size ** {} (time) and size ** {} (memory).'.format(
+                    path, stage, row['seconds_exponent'], row.get('peak_memory_mb_exponent', numpy.nan)))
+
+    growth = pandas.DataFrame(growth)
+
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+
+    measurements[['path', 'stage', 'size'] + [column for column in ['seconds', 'peak_memory_mb'] if column in measurements]]\
+        .to_csv(os.path.join(results_dir, 'scaling.csv'), index=False)
+    growth.to_csv(os.path.join(results_dir, 'scaling_growth.csv'), index=False)
+
+    return measurements, growth
+
+if __name__ == '__main__':
+    benchmark_scaling(os.path.join(data_dir, 'train.csv'), results_dir)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import numpy
+import pandas
+
+# Sizes of the synthetic CONTRIBUTING documents (bytes)
+DOCUMENT_SIZES = [2 ** 10, 2 ** 13, 2 ** 16, 2 ** 19, 2 ** 22]
+
+# Sizes of the synthetic training corpora (paragraphs)
+CORPUS_SIZES = [500, 2000, 8000, 32000, 128000, 512000]
+
+def load_paragraphs(filepath, text_column='Paragraph', label_column='Label'):
+    """Loads the annotated paragraphs used as source of the synthetic data.
+
+    Args:
+        filepath (String): Filepath of an annotated set (e.g. data/train.csv).
+    Returns:
+        Dataframe: Paragraphs and labels, without empty paragraphs.
+    """
+    data = pandas.read_csv(filepath)
+    data = data[[text_column, label_column]].dropna(subset=[text_column])
+
+    return data.reset_index(drop=True)
+
+def generate_document(paragraphs, size, random_state=None):
+    """Generates a CONTRIBUTING document by resampling real paragraphs.
+
+    The paragraphs are drawn with replacement and separated by blank lines, as
+    in a markdown file, until the document reaches the requested size.
+
+    Args:
+        paragraphs (Series): Source paragraphs (See load_paragraphs).
+        size (Integer): Minimum size of the document in bytes (UTF-8).
+        random_state (Integer, optional): Seed of the resampling.
+    Returns:
+        String: The document.
+    """
+    random_state = numpy.random.RandomState(random_state)
+    paragraphs = paragraphs.tolist()
+
+    # Size of each paragraph, including the blank line that follows it
+    sizes = numpy.array([len(paragraph.encode('utf-8')) + 2 for paragraph in paragraphs])
+    selected = []
+    total = 0
+
+    while total < size:
+        # Paragraphs are drawn in batches, estimated from the mean size
+        batch = random_state.randint(len(paragraphs), size=int((size - total) / sizes.mean()) + 1)
+        cumulative = total + numpy.cumsum(sizes[batch])
+        batch = batch[:numpy.searchsorted(cumulative, size) + 1]
+
+        selected.extend(batch)
+        total += sizes[batch].sum()
+
+    return '\n\n'.join(paragraphs[index] for index in selected) + '\n'
+
+def generate_corpus(data, n_paragraphs, random_state=None, label_column='Label'):
+    """Generates an annotated corpus by resampling real paragraphs, keeping
+    the proportion of each label of the source data.
+
+    The paragraphs of each label are sampled separately (with replacement when
+    the corpus needs more paragraphs of a label than the source data has), and
+    the paragraphs left by rounding the size of each label go to the labels
+    with the largest remainders.
+
+    Args:
+        data (Dataframe): Source paragraphs and labels (See load_paragraphs).
+        n_paragraphs (Integer): Number of paragraphs of the corpus.
+        random_state (Integer, optional): Seed of the resampling.
+        label_column (String, optional): Column containing the labels.
+    Returns:
+        Dataframe: The corpus, shuffled.
+    """
+    expected = data[label_column].value_counts(normalize=True) * n_paragraphs
+    counts = numpy.floor(expected).astype(int)
+    remainders = (expected - counts).sort_values(ascending=False, kind='mergesort')
+    counts[remainders.index[:n_paragraphs - counts.sum()]] += 1
+
+    corpus = pandas.concat([group.sample(n=counts[label], replace=counts[label] > len(group), random_state=random_state)
+                            for label, group in data.groupby(label_column)])
+
+    return corpus.sample(frac=1, random_state=random_state).reset_index(drop=True)
+
+def write_synthetic_data(source_filepath, output_dir, document_sizes=DOCUMENT_SIZES,
+                         corpus_sizes=CORPUS_SIZES, random_state=42):
+    """Writes synthetic documents (documents/<size>.md) and corpora
+    (corpora/<size>.csv) of different sizes in a folder.
+
+    Args:
+        source_filepath (String): Filepath of an annotated set (e.g. data/train.csv).
+        output_dir (String): Folder where the synthetic data is written.
+        document_sizes (List of integers, optional): Sizes of the documents in bytes.
+        corpus_sizes (List of integers, optional): Sizes of the corpora in paragraphs.
+        random_state (Integer, optional): Seed of the resampling.
+    Returns:
+        Two lists of strings: Filepaths of the documents and of the corpora.
+    """
+    data = load_paragraphs(source_filepath)
+    documents, corpora = [], []
+
+    for folder in ['documents', 'corpora']:
+        if not os.path.isdir(os.path.join(output_dir, folder)):
+            os.makedirs(os.path.join(output_dir, folder))
+
+    for size in document_sizes:
+        filepath = os.path.join(output_dir, 'documents', '{}.md'.format(size))
+
+        with open(filepath, 'w', encoding='utf-8') as document_file:
+            document_file.write(generate_document(data['Paragraph'], size, random_state))
+
+        documents.append(filepath)
+
+    for size in corpus_sizes:
+        filepath = os.path.join(output_dir, 'corpora', '{}.csv'.format(size))
+        generate_corpus(data, size, random_state).to_csv(filepath, index=False)
+        corpora.append(filepath)
+
+    return documents, corpora
+
+if __name__ == '__main__':
+    # repository/data/
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data')
+
+    write_synthetic_data(os.path.join(data_dir, 'train.csv'), os.path.join(data_dir, 'synthetic'))
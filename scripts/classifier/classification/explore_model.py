@@ -6,16 +6,19 @@ __contact__ = 'fronchetti@usp.br'
 
 import os
 import json
+import pandas
 import matplotlib.pyplot as plot
-from sklearn.metrics import plot_confusion_matrix
+from matplotlib.figure import Figure
+from sklearn.metrics import plot_confusion_matrix, confusion_matrix, ConfusionMatrixDisplay
 from sklearn.metrics import classification_report
-from sklearn.model_selection import learning_curve
+from sklearn.model_selection import learning_curve, cross_validate, StratifiedKFold
 
 import numpy as np
 import matplotlib.pyplot as plt
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.multiclass import OneVsOneClassifier
-from imblearn.over_sampling import SMOTE
+from .oversampling import create_classifier, oversample_data
+from .train_model import train_classifier
 
 def export_classification_report(model, X_test, y_test, results_dir):
     classes = ['No categories identified.',
@@ -50,30 +53,116 @@ def export_confusion_matrix(model, X_test, y_test):
 
 def export_learning_curve(classifier, strategy, oversample, X_train, y_train):
     plt.figure()
+    classifier = create_classifier(classifier, oversample)
 
     if strategy == 'one_vs_rest':
         estimator = OneVsRestClassifier(classifier)
     if strategy == 'one_vs_one':
         estimator = OneVsOneClassifier(classifier)
 
-    if oversample:
-        X_train, y_train = SMOTE().fit_resample(X_train, y_train)
+    X_train, y_train = oversample_data(X_train, y_train, oversample)
 
     train_sizes, train_scores, test_scores = learning_curve(estimator, X_train, y_train, cv=10, train_sizes=np.linspace(0.1, 1.0, 10), n_jobs=1)
+    draw_learning_curve(plt.gca(), train_sizes, train_scores, test_scores)
+    plt.show()
+
+def draw_learning_curve(axes, train_sizes, train_scores, test_scores):
     train_mean = np.mean(train_scores, axis=1)
     train_std = np.std(train_scores, axis=1)
     test_mean = np.mean(test_scores, axis=1)
     test_std = np.std(test_scores, axis=1)
 
-    plt.plot(train_sizes, train_mean, color="blue", marker="o", markersize=5, label="Training Accuracy")
-    plt.fill_between(train_sizes, train_mean + train_std, train_mean - train_std, alpha=0.15, color='blue')
+    axes.plot(train_sizes, train_mean, color="blue", marker="o", markersize=5, label="Training Accuracy")
+    axes.fill_between(train_sizes, train_mean + train_std, train_mean - train_std, alpha=0.15, color='blue')
+
+    axes.plot(train_sizes, test_mean, color='green', marker='+', markersize=5, linestyle='--', label='Validation Accuracy')
+    axes.fill_between(train_sizes, test_mean + test_std, test_mean - test_std, alpha=0.15, color='green')
+
+    axes.set_xlabel("Trainining Data Size")
+    axes.set_ylabel("Model Accuracy")
+    axes.set_title('Learning Curve')
+    axes.grid()
+    axes.legend(loc="best")
+
+def export_model_diagnostics(classifier, strategy, oversample, X_train, y_train, X_test, y_test,
+                             output_dir, prefix, workers=-1):
+    """Exports the classification report, the confusion matrix and the learning
+    curve of an estimator to files, without opening any window.
+
+    The estimator is trained once, and its predictions on the test set are
+    used by both the report and the confusion matrix. The fits of the learning
+    curve (10 folds x 10 training sizes) run in parallel, and the models fitted
+    with the whole training set of each fold are returned, so the analysis of
+    the feature weights does not train them again (See features_cross_validation
+    in train_model.py).
+
+    Args:
+        classifier: An instance of a scikit-learn classifier.
+        strategy: A string defining the multiclass strategy ('one_vs_rest' or 'one_vs_one').
+        oversample: Defines if and how the classes are balanced (See oversampling.py).
+        X_train, y_train: Training features and labels.
+        X_test, y_test: Test features and labels.
+        output_dir: Folder where the files are saved (e.g. results/classification_analysis).
+        prefix: Prefix of the files (e.g. 'final_model_all_features').
+        workers: Number of processes used by the learning curve (-1 for all CPU cores).
+    Returns:
+        The trained model, and the models fitted in the 10 folds of the learning curve.
+    """
+    # Labels in the order of the report and the matrix
+    labels = ['No categories identified.',
+              'CF – Contribution flow',
+              'CT – Choose a task',
+              'TC – Talk to the community',
+              'BW – Build local workspace',
+              'DC – Deal with the code',
+              'SC – Submit the changes']
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    filepath = os.path.join(output_dir, prefix + '_{}')
+
+    # (1) Classification report and confusion matrix, from the same predictions
+    model = train_classifier(classifier, strategy, oversample, X_train, y_train)
+    y_pred = model.predict(X_test)
+
+    report = classification_report(y_test, y_pred, labels=labels, output_dict=True)
 
-    plt.plot(train_sizes, test_mean, color='green', marker='+', markersize=5, linestyle='--', label='Validation Accuracy')
-    plt.fill_between(train_sizes, test_mean + test_std, test_mean - test_std, alpha=0.15, color='green')
+    with open(filepath.format('classification_report.json'), 'w') as report_file:
+        json.dump(report, report_file, indent=4)
 
-    plt.xlabel("Trainining Data Size")
-    plt.ylabel("Model Accuracy")
-    plt.title('Learning Curve')
-    plt.grid()
-    plt.legend(loc="best")
-    plt.show()
\ No newline at end of file
+    figure = Figure(figsize=(8, 6))
+    matrix = confusion_matrix(y_test, y_pred, labels=labels)
+    ConfusionMatrixDisplay(matrix, display_labels=[label[:2] for label in labels]).plot(ax=figure.subplots(), cmap=plot.cm.Blues)
+    figure.savefig(filepath.format('matrix.png'), bbox_inches='tight')
+
+    # (2) Learning curve
+    classifier = create_classifier(classifier, oversample)
+    estimator = OneVsRestClassifier(classifier) if strategy == 'one_vs_rest' else OneVsOneClassifier(classifier)
+    X_resampled, y_resampled = oversample_data(X_train, y_train, oversample)
+
+    # The folds of cross_validate (cv=10) for classifiers
+    cv = StratifiedKFold(n_splits=10)
+
+    # The last training size (the whole training set of each fold) is
+    # computed by cross_validate, which keeps the models of the folds.
+    train_sizes, train_scores, test_scores = learning_curve(estimator, X_resampled, y_resampled, cv=cv,
+                                                            train_sizes=np.linspace(0.1, 1.0, 10)[:-1], n_jobs=workers)
+    folds = cross_validate(estimator, X_resampled, y_resampled, cv=cv, return_train_score=True,
+                           return_estimator=True, n_jobs=workers)
+
+    train_sizes = np.append(train_sizes, len(next(cv.split(X_resampled, y_resampled))[0]))
+    train_scores = np.vstack([train_scores, folds['train_score']])
+    test_scores = np.vstack([test_scores, folds['test_score']])
+
+    pandas.DataFrame({'train_size': train_sizes,
+                      'train_accuracy_mean': np.mean(train_scores, axis=1),
+                      'train_accuracy_std': np.std(train_scores, axis=1),
+                      'validation_accuracy_mean': np.mean(test_scores, axis=1),
+                      'validation_accuracy_std': np.std(test_scores, axis=1)}).to_csv(filepath.format('learning_curve.csv'), index=False)
+
+    figure = Figure(figsize=(8, 6))
+    draw_learning_curve(figure.subplots(), train_sizes, train_scores, test_scores)
+    figure.savefig(filepath.format('learning_curve.png'), bbox_inches='tight')
+
+    return model, folds['estimator']
\ No newline at end of file
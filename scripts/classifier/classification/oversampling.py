@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import numpy
+from scipy.sparse import csr_matrix, vstack
+from sklearn.base import BaseEstimator, clone
+from sklearn.preprocessing import normalize
+from sklearn.utils import check_random_state
+from imblearn.over_sampling import SMOTE, RandomOverSampler
+
+# Values accepted by the `oversample` argument of the training methods:
+# False for no oversampling,
+# True or 'smote' to apply SMOTE (imblearn),
+# 'class_weight' to weight the classes by their frequency instead of creating samples,
+# 'random' to duplicate random samples of the minority classes,
+# 'sparse_smote' to apply SMOTE with neighbors found by cosine similarity (See SparseSMOTE).
+OVERSAMPLING_STRATEGIES = [False, True, 'class_weight', 'random', 'sparse_smote']
+
+# Number of rows compared at a time when searching neighbors in SparseSMOTE
+NEIGHBORS_BATCH_SIZE = 1024
+
+class SparseSMOTE(BaseEstimator):
+    def __init__(self, k_neighbors=5, random_state=None):
+        """Oversamples the minority classes as SMOTE, working directly on sparse matrices.
+
+        imblearn's SMOTE searches the neighbors of each sample with a k-NN over
+        the euclidean distance, which is slow with thousands of TF-IDF columns.
+        Here the neighbors are found with sparse matrix products over the
+        normalized rows (cosine similarity), and the synthetic samples are
+        interpolated as sparse rows. As in SMOTE, all classes are oversampled
+        until they have as many samples as the majority class.
+
+        Args:
+            k_neighbors (Integer, optional): Number of neighbors used to create samples.
+            random_state (Integer, optional): Seed of the random samples.
+        """
+        self.k_neighbors = k_neighbors
+        self.random_state = random_state
+
+    def fit_resample(self, X, y):
+        X = csr_matrix(X)
+        y = numpy.asarray(y)
+        random_state = check_random_state(self.random_state)
+
+        classes, counts = numpy.unique(y, return_counts=True)
+        rows, labels = [X], [y]
+
+        for label, count in zip(classes, counts):
+            n_samples = counts.max() - count
+
+            if n_samples == 0:
+                continue
+
+            X_class = X[numpy.flatnonzero(y == label)]
+            base = random_state.randint(count, size=n_samples)
+
+            if count == 1:
+                # A single sample has no neighbors, so it is duplicated.
+                samples = X_class[base]
+            else:
+                neighbors = self._find_neighbors(X_class, min(self.k_neighbors, count - 1))
+                neighbor = neighbors[base, random_state.randint(neighbors.shape[1], size=n_samples)]
+                gaps = random_state.uniform(size=(n_samples, 1))
+
+                # Each sample is a random point between a sample and one of its neighbors.
+                samples = X_class[base].multiply(1 - gaps) + X_class[neighbor].multiply(gaps)
+
+            rows.append(csr_matrix(samples))
+            labels.append(numpy.full(n_samples, label, dtype=y.dtype))
+
+        return vstack(rows, format='csr'), numpy.concatenate(labels)
+
+    def _find_neighbors(self, X, k):
+        X = normalize(X)
+        neighbors = numpy.empty((X.shape[0], k), dtype=int)
+
+        for start in range(0, X.shape[0], NEIGHBORS_BATCH_SIZE):
+            similarities = (X[start:start + NEIGHBORS_BATCH_SIZE] @ X.T).toarray()
+
+            # A sample is not a neighbor of itself.
+            similarities[numpy.arange(similarities.shape[0]), numpy.arange(start, start + similarities.shape[0])] = -numpy.inf
+            neighbors[start:start + similarities.shape[0]] = numpy.argpartition(-similarities, k - 1, axis=1)[:, :k]
+
+        return neighbors
+
+def create_sampler(oversample):
+    """Returns the sampler of an oversampling strategy, or None if the strategy does not create samples."""
+
+    if oversample is True or oversample == 'smote':
+        return SMOTE()
+    if oversample == 'random':
+        return RandomOverSampler(random_state=42)
+    if oversample == 'sparse_smote':
+        return SparseSMOTE(random_state=42)
+    if oversample in [False, None, 'class_weight']:
+        return None
+
+    raise ValueError('The oversampling strategy {} does not exist.'.format(oversample))
+
+def supports_oversampling(classifier, oversample):
+    """Checks if a classifier can be trained with an oversampling strategy.
+    Only classifiers with a `class_weight` parameter support 'class_weight'."""
+    return oversample != 'class_weight' or 'class_weight' in classifier.get_params()
+
+def create_classifier(classifier, oversample):
+    """Returns a copy of the classifier prepared for an oversampling strategy.
+
+    With 'class_weight', the errors in each class are weighted by the inverse of
+    its frequency, so no samples are created. Other strategies do not change the
+    classifier.
+    """
+    if oversample != 'class_weight':
+        return clone(classifier)
+
+    if not supports_oversampling(classifier, oversample):
+        raise ValueError('{} does not support class weights.'.format(type(classifier).__name__))
+
+    return clone(classifier).set_params(class_weight='balanced')
+
+def oversample_data(X, y, oversample):
+    """Applies the sampler of an oversampling strategy to a training set.
+
+    Returns:
+        The features and labels resampled, or the same features and labels
+        if the strategy does not create samples.
+    """
+    sampler = create_sampler(oversample)
+
+    if sampler is None:
+        return X, y
+
+    return sampler.fit_resample(X, y)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import shutil
+import pandas
+import tempfile
+from data_preparation.read_documents import iter_docx_lines
+# app/classifier/get_contributing.py (the app folder is added to the path by main.py)
+from classifier.get_contributing import iter_paragraphs
+
+# Extensions of the files read by predict_directory. Files without
+# extension are read as plaintext.
+PREDICTION_EXTENSIONS = ['.xlsx', '.docx', '.md', '.markdown', '.txt', '']
+
+# Number of paragraphs read and predicted at a time
+PREDICTION_CHUNK_SIZE = 1000
+
+# Columns of the predictions file
+PREDICTION_COLUMNS = ['Predicted Class', 'File', 'Paragraph Index', 'Paragraph']
+
+def list_prediction_files(directory):
+    """Lists the files of a directory that can be predicted, sorted by name."""
+    filepaths = []
+
+    for filename in sorted(os.listdir(directory)):
+        filepath = os.path.join(directory, filename)
+
+        if os.path.isfile(filepath) and os.path.splitext(filename)[1].lower() in PREDICTION_EXTENSIONS:
+            filepaths.append(filepath)
+
+    return filepaths
+
+def iter_file_paragraphs(filepath):
+    """Reads the paragraphs of a file, one at a time.
+
+    In spreadsheets, the paragraphs are the cells of the first column of each
+    worksheet, below the header (See parse_spreadsheet_file in transform_data.py),
+    and their index is the position of their row below the header, so empty
+    cells are skipped without changing the index of the next paragraphs.
+    Other files are split into paragraphs as documentation files (See
+    iter_paragraphs in app/classifier/get_contributing.py), and their index
+    is their position in the file.
+
+    Args:
+        filepath (String): A spreadsheet (.xlsx), document (.docx), markdown or plaintext file.
+    Returns:
+        Generator of tuples: The index and the text of each paragraph of the file.
+    """
+    if filepath.lower().endswith('.xlsx'):
+        import openpyxl
+
+        # In read-only mode, the rows are read as they are iterated.
+        workbook = openpyxl.load_workbook(filepath, read_only=True)
+
+        try:
+            for worksheet in workbook.worksheets:
+                for index, (value,) in enumerate(worksheet.iter_rows(min_row=2, max_col=1, values_only=True)):
+                    if value is not None and str(value).strip():
+                        yield index, str(value)
+        finally:
+            workbook.close()
+    elif filepath.lower().endswith('.docx'):
+        yield from enumerate(iter_paragraphs(iter_docx_lines(filepath)))
+    else:
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as document_file:
+            yield from enumerate(iter_paragraphs(document_file))
+
+def iter_paragraph_chunks(filepaths, chunk_size=PREDICTION_CHUNK_SIZE, min_length=0):
+    """Reads the paragraphs of a list of files in chunks.
+
+    Args:
+        filepaths (List of strings): Files to be read (See iter_file_paragraphs).
+        chunk_size (Integer, optional): Maximum number of paragraphs per chunk.
+        min_length (Integer, optional): Paragraphs with fewer characters are skipped.
+    Returns:
+        Generator of dataframes with the file, the index of the paragraph
+        in the file (See iter_file_paragraphs) and the paragraph.
+    """
+    chunk = []
+
+    for filepath in filepaths:
+        for index, paragraph in iter_file_paragraphs(filepath):
+            if len(paragraph) >= min_length:
+                chunk.append((os.path.basename(filepath), index, paragraph))
+
+            if len(chunk) == chunk_size:
+                yield pandas.DataFrame(chunk, columns=PREDICTION_COLUMNS[1:])
+                chunk = []
+
+    if chunk:
+        yield pandas.DataFrame(chunk, columns=PREDICTION_COLUMNS[1:])
+
+def predict_directory(model, directory, output_filepath, chunk_size=PREDICTION_CHUNK_SIZE, min_length=0):
+    """Predicts the classes of all paragraphs of a directory of spreadsheets,
+    documents (.docx), markdown or plaintext files, and saves them in a Parquet file.
+
+    The paragraphs are read and predicted in chunks. The predictions of each
+    class are appended to a temporary file, and at the end these files are
+    concatenated in the order of the classes. So the predictions are grouped
+    by class and sorted by file and paragraph inside each class, while only one
+    chunk is kept in memory at a time.
+
+    Args:
+        model: A fitted model that receives raw paragraphs (See build_pipeline
+            in paragraph_pipeline.py).
+        directory (String): Folder of the files to be predicted.
+        output_filepath (String): Parquet file where the predictions are saved
+            (See PREDICTION_COLUMNS).
+        chunk_size (Integer, optional): Number of paragraphs predicted at a time.
+        min_length (Integer, optional): Paragraphs with fewer characters are not predicted.
+    Returns:
+        Dictionary: Number of files and paragraphs predicted, number of paragraphs
+            of each class, time spent and paragraphs predicted per second.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    filepaths = list_prediction_files(directory)
+    started_at = time.perf_counter()
+    writers = {}
+    class_filepaths = {}
+    counts = {}
+
+    classes_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_filepath)))
+
+    try:
+        for chunk in iter_paragraph_chunks(filepaths, chunk_size, min_length):
+            chunk.insert(0, PREDICTION_COLUMNS[0], model.predict(chunk['Paragraph'].tolist()))
+
+            for predicted_class, group in chunk.groupby(PREDICTION_COLUMNS[0], sort=False):
+                table = pyarrow.Table.from_pandas(group, preserve_index=False)
+
+                if predicted_class not in writers:
+                    class_filepaths[predicted_class] = os.path.join(classes_dir, '{}.parquet'.format(len(writers)))
+                    writers[predicted_class] = pyarrow.parquet.ParquetWriter(class_filepaths[predicted_class], table.schema)
+
+                writers[predicted_class].write_table(table)
+                counts[predicted_class] = counts.get(predicted_class, 0) + len(group)
+
+        for writer in writers.values():
+            writer.close()
+
+        schema = pyarrow.schema([(PREDICTION_COLUMNS[0], pyarrow.string()), (PREDICTION_COLUMNS[1], pyarrow.string()),
+                                 (PREDICTION_COLUMNS[2], pyarrow.int64()), (PREDICTION_COLUMNS[3], pyarrow.string())])
+
+        # The files of each class are concatenated one row group at a time.
+        with pyarrow.parquet.ParquetWriter(output_filepath + '.tmp', schema) as output:
+            for predicted_class in sorted(class_filepaths):
+                class_file = pyarrow.parquet.ParquetFile(class_filepaths[predicted_class])
+
+                for row_group in range(class_file.num_row_groups):
+                    output.write_table(class_file.read_row_group(row_group).cast(schema))
+
+        os.replace(output_filepath + '.tmp', output_filepath)
+    finally:
+        shutil.rmtree(classes_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started_at
+    n_paragraphs = sum(counts.values())
+
+    return {'files': len(filepaths), 'paragraphs': n_paragraphs,
+            'paragraphs_per_class': {predicted_class: counts[predicted_class] for predicted_class in sorted(counts)},
+            'seconds': round(elapsed, 2), 'paragraphs_per_second': round(n_paragraphs / max(elapsed, 1e-9), 1)}
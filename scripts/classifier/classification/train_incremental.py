@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import time
+import pickle
+import pandas
+from scipy.sparse import hstack
+from sklearn.linear_model import SGDClassifier
+from sklearn.feature_extraction.text import HashingVectorizer
+from paragraph_pipeline import TextPreprocessor, HeuristicFeatures, VECTORIZER_ARGS
+
+# Arguments of the hashing vectorizer. Unlike TF-IDF, it has no vocabulary
+# to be fitted, so any number of paragraphs can be converted into features
+# in chunks. The other arguments are the same of VECTORIZER_ARGS.
+HASHING_ARGS = dict(VECTORIZER_ARGS, n_features=2 ** 20, alternate_sign=False)
+
+# Number of paragraphs read and learned at a time
+CHUNK_SIZE = 1000
+
+class IncrementalClassifier:
+    def __init__(self, classes, patterns, estimator=None, techniques=None,
+                 hashing_args=HASHING_ARGS):
+        """Classifies paragraphs with a linear model trained one chunk at a time.
+
+        The paragraphs are preprocessed in the same way as in the other
+        estimators (See paragraph_pipeline.py), and converted into hashed
+        statistic features and heuristic features. None of these steps
+        depends on the training data, so the model never needs the whole
+        corpus in memory and new paragraphs can be learned without a refit.
+
+        Args:
+            classes (List of strings): All labels the model may receive.
+            patterns (List of dictionaries): Rules of the heuristic features
+                (See load_patterns in paragraph_pipeline.py).
+            estimator (optional): A scikit-learn classifier implementing
+                partial_fit. Defaults to a linear SVM trained with SGD.
+            techniques (List of strings, optional): Text preprocessing techniques.
+                If None, PREPROCESSING_TECHNIQUES are applied.
+            hashing_args (Dictionary, optional): Arguments of the hashing vectorizer.
+        """
+        self.classes = list(classes)
+        self.preprocessor = TextPreprocessor(techniques)
+        self.vectorizer = HashingVectorizer(**hashing_args)
+        self.heuristics = HeuristicFeatures(patterns).fit(None)
+        self.estimator = estimator if estimator is not None else \
+            SGDClassifier(loss='hinge', alpha=1e-5, random_state=0)
+        self.n_paragraphs = 0
+
+    def transform(self, paragraphs):
+        paragraphs = self.preprocessor.transform(paragraphs)
+        return hstack([self.vectorizer.transform(paragraphs),
+                       self.heuristics.transform(paragraphs)], format='csr')
+
+    def partial_fit(self, paragraphs, labels):
+        self.estimator.partial_fit(self.transform(paragraphs), labels, classes=self.classes)
+        self.n_paragraphs = self.n_paragraphs + len(labels)
+        return self
+
+    def predict(self, paragraphs):
+        return self.estimator.predict(self.transform(paragraphs))
+
+def iter_annotated_chunks(filepaths, text_column, label_column, chunk_size=CHUNK_SIZE):
+    """Reads annotated paragraphs from CSV or Parquet files, one chunk at a time.
+
+    Args:
+        filepaths (List of strings): Train sets (CSV) or corpus caches
+            (Parquet, see update_corpus_cache in transform_data.py).
+        text_column (String): Column containing the paragraphs.
+        label_column (String): Column containing the label of each paragraph.
+        chunk_size (Integer, optional): Maximum number of paragraphs per chunk.
+    Returns:
+        Generator of dataframes with the text and label columns. Paragraphs
+        without text are removed.
+    """
+    columns = [text_column, label_column]
+
+    for filepath in filepaths:
+        if filepath.endswith('.parquet'):
+            import pyarrow.parquet
+
+            batches = pyarrow.parquet.ParquetFile(filepath).iter_batches(batch_size=chunk_size, columns=columns)
+            chunks = (batch.to_pandas() for batch in batches)
+        else:
+            chunks = pandas.read_csv(filepath, usecols=columns, chunksize=chunk_size)
+
+        for chunk in chunks:
+            chunk = chunk.dropna(subset=[text_column])
+
+            if len(chunk) > 0:
+                yield chunk
+
+def train_incremental_classifier(model, chunks, text_column, label_column):
+    """Trains an incremental classifier with a stream of annotated paragraphs.
+
+    Args:
+        model (IncrementalClassifier): A new model, or a trained one to be updated.
+        chunks: Iterable of dataframes (See iter_annotated_chunks).
+        text_column (String): Column containing the paragraphs.
+        label_column (String): Column containing the label of each paragraph.
+    Returns:
+        IncrementalClassifier, Dictionary: The trained model and the number of
+            paragraphs learned, time spent and paragraphs learned per second.
+    """
+    started_at = time.perf_counter()
+    n_paragraphs = 0
+
+    for chunk in chunks:
+        model.partial_fit(chunk[text_column].tolist(), chunk[label_column].to_numpy())
+        n_paragraphs = n_paragraphs + len(chunk)
+
+    seconds = time.perf_counter() - started_at
+
+    return model, {
+        'n_paragraphs': n_paragraphs,
+        'seconds': round(seconds, 3),
+        'paragraphs_per_second': round(n_paragraphs / seconds, 1) if seconds > 0 else 0.0
+    }
+
+def update_incremental_classifier(model_filepath, spreadsheets_filepaths, text_column, classes_columns, label_column):
+    """Learns the paragraphs of new annotated spreadsheets with a saved model,
+    without training it again with the whole corpus.
+
+    Args:
+        model_filepath (String): File where the model is saved (pickle).
+        spreadsheets_filepaths (List of strings): New annotated spreadsheets.
+        text_column (String): Column containing the paragraphs.
+        classes_columns (List of strings): Columns representing classes
+            in each spreadsheet.
+        label_column (String): Column containing the label of each paragraph.
+    Returns:
+        Dictionary: Statistics of the update (See train_incremental_classifier).
+    """
+    from data_preparation.transform_data import parse_spreadsheet_file
+
+    with open(model_filepath, 'rb') as model_file:
+        model = pickle.load(model_file)
+
+    chunks = (parse_spreadsheet_file(filepath, text_column, classes_columns, label_column).dropna(subset=[text_column])
+              for filepath in spreadsheets_filepaths)
+    model, statistics = train_incremental_classifier(model, (chunk for chunk in chunks if len(chunk) > 0),
+                                                     text_column, label_column)
+
+    # The model is replaced only after being completely written.
+    with open(model_filepath + '.tmp', 'wb') as model_file:
+        pickle.dump(model, model_file)
+
+    os.replace(model_filepath + '.tmp', model_filepath)
+
+    return statistics
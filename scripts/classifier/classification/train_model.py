@@ -5,12 +5,13 @@ __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
 import os
+import numpy
 import pandas
 
 # Classifier training
 from sklearn.multiclass import OneVsRestClassifier
 from sklearn.multiclass import OneVsOneClassifier
-from imblearn.over_sampling import SMOTE
+from .oversampling import create_classifier, oversample_data
 
 # Cross-validation
 from sklearn.model_selection import cross_validate
@@ -21,7 +22,8 @@ def train_classifier(classifier, strategy, oversample, X_train, y_train):
     Args:
         classifier: An instance of a scikit-learn classifier.
         strategy: A string defining which strategies will be used for training.
-        oversample: A boolean variable that defines if SMOTE oversampling should be applied or not.
+        oversample: Defines if and how the classes are balanced (See OVERSAMPLING_STRATEGIES
+            in oversampling.py). True applies SMOTE.
         X_train: A matrix containing features for training.
         X_test: A matrix containing features for testing.
         y_train: A column containing labels for training.
@@ -31,44 +33,92 @@ def train_classifier(classifier, strategy, oversample, X_train, y_train):
         A classification model and its performance report
     """
 
+    classifier = create_classifier(classifier, oversample)
+
     if strategy == 'one_vs_rest':
         model = OneVsRestClassifier(classifier)
     if strategy == 'one_vs_one':
         model = OneVsOneClassifier(classifier)
 
-    if oversample:
-        X_resampled, y_resampled = SMOTE().fit_resample(X_train, y_train)
-        model.fit(X_resampled, y_resampled)
-    else:
-        model.fit(X_train, y_train)
+    X_resampled, y_resampled = oversample_data(X_train, y_train, oversample)
+    model.fit(X_resampled, y_resampled)
 
     return model
 
-def features_cross_validation(classifier, strategy, oversample, X_train, y_train, feature_names, results_dir):
+def get_coefficients(estimator):
+    """Returns the coefficients (classes x features) of a fitted one-vs-rest model."""
+    return numpy.vstack([binary_estimator.coef_ for binary_estimator in estimator.estimators_])
+
+def features_cross_validation(classifier, strategy, oversample, X_train, y_train, feature_names, results_dir,
+                              estimators=None, n_best=5):
+    """Analyzes the weights given to each feature by a linear classifier
+    across the folds of a cross-validation.
+
+    The coefficients of all folds are gathered in a single array (folds x classes
+    x features), from which the mean, the standard deviation and the sign stability
+    (fraction of folds in which a weight has the same sign as its mean) of each
+    feature are computed. The files features_weights.csv, features_weights_mean.csv,
+    features_weights_std.csv, features_sign_stability.csv and best_features_per_class.csv
+    are saved in the results folder.
+
+    Args:
+        classifier: An instance of a scikit-learn linear classifier.
+        strategy: A string defining which strategies will be used for training.
+        oversample: Defines if and how the classes are balanced (See oversampling.py).
+        X_train: A matrix containing features for training.
+        y_train: A column containing labels for training.
+        feature_names: Names of the columns of X_train.
+        results_dir: Folder where the results are saved.
+        estimators (List, optional): One-vs-rest models already fitted on the folds
+            of a cross-validation. If not given, the models are fitted here (10 folds).
+        n_best (Integer, optional): Number of features with the highest mean weight
+            listed for each class.
+
+    Returns:
+        A dictionary with the classes, the coefficients of each fold and their
+        mean, standard deviation and sign stability.
+    """
     print("Getting feature coefficients from LinearSVC")
-    folds = None
 
-    if strategy == 'one_vs_rest':
-        model = OneVsRestClassifier(classifier)
-    if strategy == 'one_vs_one':
-        model = OneVsOneClassifier(classifier)
+    if estimators is None:
+        classifier = create_classifier(classifier, oversample)
 
-    if oversample:
-        X_resampled, y_resampled = SMOTE().fit_resample(X_train, y_train)
+        if strategy == 'one_vs_rest':
+            model = OneVsRestClassifier(classifier)
+        if strategy == 'one_vs_one':
+            model = OneVsOneClassifier(classifier)
+
+        X_resampled, y_resampled = oversample_data(X_train, y_train, oversample)
         folds = cross_validate(model, X_resampled, y_resampled, cv = 10, return_estimator=True)
-    else:
-        folds = cross_validate(model, X_train, y_train, cv = 10, return_estimator=True)
-    
-    folds_concat = pandas.DataFrame()
-
-    for estimator in folds['estimator']:
-        weights = pandas.DataFrame(estimator.coef_, index=estimator.classes_.tolist(), columns=feature_names)
-        folds_concat = pandas.concat((folds_concat, weights))
-    
-    ordered_folds = folds_concat.sort_index()
-    ordered_folds.to_csv(os.path.join(results_dir, 'features_weights.csv'))
-    by_category = folds_concat.groupby(folds_concat.index)
-    weights_mean = by_category.mean()
-    best_features_per_class = weights_mean.apply(lambda s, n: pandas.Series(s.nlargest(n).index), axis=1, n=5)
-    weights_mean.to_csv(os.path.join(results_dir, 'features_weights_mean.csv'))
-    best_features_per_class.to_csv(os.path.join(results_dir, 'best_features_per_class.csv'))
\ No newline at end of file
+        estimators = folds['estimator']
+
+    classes = estimators[0].classes_.tolist()
+    coefficients = numpy.stack([get_coefficients(estimator) for estimator in estimators])
+    n_folds, n_classes, n_features = coefficients.shape
+
+    weights_mean = coefficients.mean(axis=0)
+    weights_std = coefficients.std(axis=0)
+    sign_stability = (numpy.sign(coefficients) == numpy.sign(weights_mean)).mean(axis=0)
+
+    # Top features of each class: a partial sort selects the n best
+    # weights, and only these are sorted.
+    n_best = min(n_best, n_features)
+    best_index = numpy.argpartition(-weights_mean, n_best - 1, axis=1)[:, :n_best]
+    best_order = numpy.argsort(-numpy.take_along_axis(weights_mean, best_index, axis=1), axis=1)
+    best_index = numpy.take_along_axis(best_index, best_order, axis=1)
+
+    # Weights of each fold, grouped by class
+    folds_weights = pandas.DataFrame(coefficients.transpose(1, 0, 2).reshape(n_classes * n_folds, n_features),
+                                     index=numpy.repeat(classes, n_folds), columns=feature_names)
+    folds_weights.to_csv(os.path.join(results_dir, 'features_weights.csv'))
+
+    for filename, values in [('features_weights_mean.csv', weights_mean),
+                             ('features_weights_std.csv', weights_std),
+                             ('features_sign_stability.csv', sign_stability)]:
+        pandas.DataFrame(values, index=classes, columns=feature_names).to_csv(os.path.join(results_dir, filename))
+
+    best_features_per_class = pandas.DataFrame(numpy.asarray(feature_names, dtype=object)[best_index], index=classes)
+    best_features_per_class.to_csv(os.path.join(results_dir, 'best_features_per_class.csv'))
+
+    return {'classes': classes, 'coefficients': coefficients, 'mean': weights_mean,
+            'std': weights_std, 'sign_stability': sign_stability}
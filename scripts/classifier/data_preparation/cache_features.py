@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import json
+import shutil
+import hashlib
+from scipy.sparse import save_npz, load_npz
+
+# Changing how features are generated without changing their inputs
+# (e.g. a new heuristic) requires a new version of the cache.
+FEATURES_CACHE_VERSION = 2
+
+def compute_features_key(filepaths, parameters):
+    """Computes the key identifying a set of features in the cache.
+
+    The key is a hash of everything that defines the features: the content
+    of the input files (e.g. train and test sets, heuristic patterns) and the
+    parameters used to generate them (e.g. preprocessing techniques and
+    vectorizer arguments).
+
+    Args:
+        filepaths (List of strings): Files used to generate the features.
+        parameters (Dictionary): JSON serializable parameters used to generate
+            the features.
+    Returns:
+        String: Hexadecimal hash identifying the features.
+    """
+    sha1 = hashlib.sha1()
+    sha1.update(str(FEATURES_CACHE_VERSION).encode('utf-8'))
+    sha1.update(json.dumps(parameters, sort_keys=True, default=str).encode('utf-8'))
+
+    for filepath in filepaths:
+        sha1.update(os.path.basename(filepath).encode('utf-8'))
+
+        with open(filepath, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                sha1.update(block)
+
+    return sha1.hexdigest()
+
+def load_features(cache_dir, key):
+    """Loads a set of features from the cache.
+
+    Args:
+        cache_dir (String): Folder where the features are cached.
+        key (String): Key of the features (See compute_features_key).
+    Returns:
+        Tuple: A dictionary of sparse matrices, a dictionary of metadata and the
+            folder where the artifacts of the features are saved. If the features
+            are not cached, None is returned.
+    """
+    features_dir = os.path.join(cache_dir, key)
+    metadata_filepath = os.path.join(features_dir, 'metadata.json')
+
+    if not os.path.exists(metadata_filepath):
+        return None
+
+    with open(metadata_filepath, 'r', encoding='utf-8') as metadata_file:
+        metadata = json.load(metadata_file)
+
+    matrices = {name: load_npz(os.path.join(features_dir, name + '.npz'))
+                for name in metadata['matrices']}
+
+    return matrices, metadata, features_dir
+
+def save_features(cache_dir, key, matrices, metadata, artifacts=()):
+    """Saves a set of features in the cache.
+
+    The features are written to a temporary folder that is renamed when
+    complete, so an interrupted execution never leaves partial features
+    in the cache.
+
+    Args:
+        cache_dir (String): Folder where the features are cached.
+        key (String): Key of the features (See compute_features_key).
+        matrices (Dictionary): Sparse matrices indexed by name.
+        metadata (Dictionary): JSON serializable data about the features
+            (e.g. feature names and preprocessed paragraphs).
+        artifacts (List of strings, optional): Files generated with the
+            features (e.g. fitted vectorizers) to be copied to the cache.
+    """
+    features_dir = os.path.join(cache_dir, key)
+    temporary_dir = features_dir + '.tmp'
+
+    if os.path.isdir(temporary_dir):
+        shutil.rmtree(temporary_dir)
+
+    os.makedirs(temporary_dir)
+
+    for name, matrix in matrices.items():
+        save_npz(os.path.join(temporary_dir, name + '.npz'), matrix)
+
+    for artifact in artifacts:
+        shutil.copyfile(artifact, os.path.join(temporary_dir, os.path.basename(artifact)))
+
+    metadata = dict(metadata, matrices=list(matrices))
+
+    with open(os.path.join(temporary_dir, 'metadata.json'), 'w', encoding='utf-8') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    if os.path.isdir(features_dir):
+        shutil.rmtree(features_dir)
+
+    os.replace(temporary_dir, features_dir)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import json
+import hashlib
+import numpy
+from scipy.sparse import csr_matrix, hstack, save_npz, load_npz
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .generate_features import VECTORIZER_ARGS
+from .select_features import compute_chi2_scores, create_selector, SELECTION_PERCENTILE
+
+class FoldFeatures:
+    def __init__(self, paragraphs, heuristic_features, cache_dir, vectorizer_args=VECTORIZER_ARGS,
+                 percentile=SELECTION_PERCENTILE):
+        """Generates the features of each fold of a cross-validation using
+        only the training instances of the fold.
+
+        The TF-IDF vocabulary and the chi-square selection are learned from the
+        training instances, so the test instances of a fold never influence its
+        features. The heuristic features do not learn anything from the data,
+        so they are computed once for all paragraphs. The features of each fold
+        are cached, so all classifiers and strategies evaluated in a fold use
+        the same features.
+
+        Args:
+            paragraphs (List of strings): Preprocessed paragraphs of the training set.
+            heuristic_features (Sparse matrix): Heuristic features of the paragraphs
+                (See create_heuristic_features in generate_features.py).
+            cache_dir (String): Folder where the features of each fold are cached.
+            vectorizer_args (Dictionary, optional): Arguments of the TF-IDF vectorizer.
+            percentile (Integer, optional): Percentile of features selected in each fold.
+        """
+        self.paragraphs = numpy.array(list(paragraphs), dtype=object)
+        self.heuristic_features = csr_matrix(heuristic_features)
+        self.vectorizer_args = vectorizer_args
+        self.percentile = percentile
+
+        sha1 = hashlib.sha1()
+        sha1.update(json.dumps([vectorizer_args, percentile], sort_keys=True, default=str).encode('utf-8'))
+        sha1.update('\n'.join(self.paragraphs).encode('utf-8'))
+
+        for array in [self.heuristic_features.data, self.heuristic_features.indices, self.heuristic_features.indptr]:
+            sha1.update(numpy.ascontiguousarray(array).tobytes())
+
+        self.fingerprint = sha1.hexdigest()
+        self.cache_dir = os.path.join(cache_dir, self.fingerprint)
+
+    def __len__(self):
+        return len(self.paragraphs)
+
+    def is_prepared(self, fold_hash):
+        return all(os.path.exists(self._filepath(fold_hash, part)) for part in ['train', 'test'])
+
+    def prepare(self, fold_hash, train_index, test_index, y):
+        """Learns the features of a fold with its training instances and caches them.
+
+        Args:
+            fold_hash (String): Identifier of the fold (See hash_fold in cross_validation.py).
+            train_index (Array): Training instances of the fold.
+            test_index (Array): Test instances of the fold.
+            y (Array): Labels of all paragraphs.
+        """
+        vectorizer = TfidfVectorizer(**self.vectorizer_args)
+        train_statistic_features = vectorizer.fit_transform(self.paragraphs[train_index])
+        test_statistic_features = vectorizer.transform(self.paragraphs[test_index])
+
+        X_train = hstack([train_statistic_features, self.heuristic_features[train_index]], format='csr')
+        X_test = hstack([test_statistic_features, self.heuristic_features[test_index]], format='csr')
+
+        selector = create_selector(*compute_chi2_scores(X_train, y[train_index]), percentile=self.percentile)
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        # The training features are written last, so a fold is
+        # prepared only when both files are complete.
+        for part, X in [('test', X_test), ('train', X_train)]:
+            filepath = self._filepath(fold_hash, part)
+            save_npz(filepath + '.tmp.npz', selector.transform(X))
+            os.replace(filepath + '.tmp.npz', filepath)
+
+    def load(self, fold_hash):
+        """Returns the training and test features of a fold prepared before."""
+        return load_npz(self._filepath(fold_hash, 'train')), load_npz(self._filepath(fold_hash, 'test'))
+
+    def _filepath(self, fold_hash, part):
+        return os.path.join(self.cache_dir, fold_hash + '-' + part + '.npz')
@@ -5,19 +5,23 @@ __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
 import os
+import numpy
 import pickle
-from functools import partial
-import pandas
 # Heuristic
 from spacy.lang.en import English
 # Statistic
 from sklearn.feature_extraction.text import TfidfVectorizer
+# Arguments of the TF-IDF vectorizer and matching of the rules, shared with the web application
+from paragraph_pipeline import VECTORIZER_ARGS, match_heuristics
+
+# Rules used to create heuristic features
+PATTERNS_FILEPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patterns.jsonl')
 
 def add_column_name_prefix(column_name, prefix):
     return prefix + column_name
 
 
-def create_statistic_features(X_train, X_test, is_predict = False):
+def create_statistic_features(X_train, X_test, is_predict = False, models_dir = ''):
     """Converts paragraphs into TF-IDF features.
 
     Note that in this study, the TF-IDF features are mentioned
@@ -29,36 +33,28 @@ def create_statistic_features(X_train, X_test, is_predict = False):
         X_test: String column containing features
         is_predict: Boolean defining if features should
         be fitted before transformation.
+        models_dir: Folder where the fitted vectorizer (tf-idf.sav)
+        is saved, or loaded from when predicting. Defaults to the
+        working directory.
     Returns:
-        A sparse matrix of TF-IDF features.
+        Two sparse matrices (CSR) of TF-IDF features, for training and
+        test, and an array with the names of the features.
     """
 
-    vect_args = {
-        'ngram_range': (1, 2),  # Google recomends: 1-gram + 2-grams
-        'strip_accents': 'unicode',
-        'decode_error': 'replace',
-        'stop_words': 'english',
-        'analyzer': 'word',
-    }
-
     if is_predict:
-        vectorizer = pickle.load(open('tf-idf.sav', 'rb'))
-        train_features = vectorizer.transform(X_train)
-        test_features = vectorizer.transform(X_test)
-        train_statistic_features = pandas.DataFrame(train_features.toarray(), columns=vectorizer.get_feature_names())
-        test_statistic_features = pandas.DataFrame(test_features.toarray(), columns=vectorizer.get_feature_names())
+        vectorizer = pickle.load(open(os.path.join(models_dir, 'tf-idf.sav'), 'rb'))
+        train_statistic_features = vectorizer.transform(X_train)
+        test_statistic_features = vectorizer.transform(X_test)
     else:
-        vectorizer = TfidfVectorizer(**vect_args)
-        train_features = vectorizer.fit_transform(X_train)
-        test_features = vectorizer.transform(X_test)
-        train_statistic_features = pandas.DataFrame(train_features.toarray(), columns=vectorizer.get_feature_names())
-        test_statistic_features = pandas.DataFrame(test_features.toarray(), columns=vectorizer.get_feature_names())
-        pickle.dump(vectorizer, open('tf-idf.sav', 'wb'))
+        vectorizer = TfidfVectorizer(**VECTORIZER_ARGS)
+        train_statistic_features = vectorizer.fit_transform(X_train)
+        test_statistic_features = vectorizer.transform(X_test)
+        pickle.dump(vectorizer, open(os.path.join(models_dir, 'tf-idf.sav'), 'wb'))
 
-    train_statistic_features = train_statistic_features.rename(mapper=partial(add_column_name_prefix, prefix="stat_"), axis="columns")
-    test_statistic_features = test_statistic_features.rename(mapper=partial(add_column_name_prefix, prefix="stat_"), axis="columns")
+    feature_names = numpy.array([add_column_name_prefix(name, prefix="stat_")
+                                 for name in vectorizer.get_feature_names()], dtype=object)
 
-    return train_statistic_features, test_statistic_features
+    return train_statistic_features.tocsr(), test_statistic_features.tocsr(), feature_names
 
 def create_heuristic_features(X_train, X_test):
     """Creates a set of features using a rule-based matching approach over paragraphs.
@@ -66,7 +62,7 @@ def create_heuristic_features(X_train, X_test):
     To improve the performance of the classification models, a set of rule-based features were
     created in conjunction with the TF-IDF features.
 
-    Each rule defines a new feature in X, and it is represented as a column in the dataframe. 
+    Each rule defines a new feature in X, and it is represented as a column in the matrix. 
     Each rule was manually defined by the researchers based on what they have learned during the qualitative analysis.
     The row values of each rule (column) are defined based on the expression given by the respective rule. 
     There is, for example, a rule in this study that verifies if the word "GitHub" appears in each paragraph.
@@ -76,42 +72,25 @@ def create_heuristic_features(X_train, X_test):
     Learn more about rule-based matching at: spacy.io/usage/rule-based-matching
 
     Args:
-        X: A string column containing paragraphs.
+        X_train: A string column containing training paragraphs.
+        X_test: A string column containing test paragraphs.
 
     Returns:
-        A sparse matrix of heuristic features.
+        Two sparse matrices (CSR) of heuristic features, for training
+        and test, and an array with the names of the features.
     """
 
     nlp = English()
-    jsonl_filepath = os.path.join(os.getcwd(), 'data_preparation', 'patterns.jsonl')
-    ruler = nlp.add_pipe("entity_ruler").from_disk(jsonl_filepath)
-
-    train_heuristic_features = pandas.DataFrame()
-    train_heuristic_features['Paragraph'] = X_train
-
-    test_heuristic_features = pandas.DataFrame()
-    test_heuristic_features['Paragraph'] = X_test
-
-    for heuristic in ruler.patterns:
-        train_heuristic_features[heuristic['id']] = 0
-        test_heuristic_features[heuristic['id']] = 0
-
-    for index, row in train_heuristic_features.iterrows():
-        doc = nlp(row['Paragraph'])
-
-        for heuristic in doc.ents:
-            train_heuristic_features.at[index, heuristic.ent_id_] = 1
-
-    for index, row in test_heuristic_features.iterrows():
-        doc = nlp(row['Paragraph'])
+    ruler = nlp.add_pipe("entity_ruler").from_disk(PATTERNS_FILEPATH)
 
-        for heuristic in doc.ents:
-            test_heuristic_features.at[index, heuristic.ent_id_] = 1
+    # Different patterns may define the same rule, so each
+    # rule is a column, in the order they first appear.
+    heuristics = list(dict.fromkeys(heuristic['id'] for heuristic in ruler.patterns))
 
-    train_heuristic_features.drop('Paragraph', axis=1, inplace=True)
-    test_heuristic_features.drop('Paragraph', axis=1, inplace=True)
+    train_heuristic_features = match_heuristics(nlp, X_train, heuristics)
+    test_heuristic_features = match_heuristics(nlp, X_test, heuristics)
 
-    train_heuristic_features = train_heuristic_features.rename(mapper=partial(add_column_name_prefix, prefix="heur_"), axis="columns")
-    test_heuristic_features = test_heuristic_features.rename(mapper=partial(add_column_name_prefix, prefix="heur_"), axis="columns")
+    feature_names = numpy.array([add_column_name_prefix(heuristic, prefix="heur_")
+                                 for heuristic in heuristics], dtype=object)
 
-    return train_heuristic_features, test_heuristic_features
\ No newline at end of file
+    return train_heuristic_features, test_heuristic_features, feature_names
@@ -5,9 +5,11 @@ __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
 import os
-from data_preparation.prepare_data import create_train_and_test_sets, import_sets
+from data_preparation.prepare_data import create_train_and_test_sets, import_sets, import_features, get_scores_filepath
+from data_preparation.prepare_data import import_fold_features
+from data_preparation.select_features import compute_chi2_scores
 
-def import_data_for_classification(spreadsheets_dir, data_dir, features = 'all'):
+def import_data_for_classification(spreadsheets_dir, data_dir, features = 'all', memory_report_dir = None):
     """Imports and parses spreadsheets as data structures for classification
     and save them as CSV files.
 
@@ -15,6 +17,8 @@ def import_data_for_classification(spreadsheets_dir, data_dir, features = 'all')
         spreadsheets_dir (String): Folder where spreadsheets
         are located.
         data_dir (String): Folder where parsed data is saved.
+        memory_report_dir (String, optional): If given, the memory of each stage
+        is tracked and saved in this folder (See MemoryTracker in track_memory.py).
 
     Returns:
         Dataframes: Training and test samples (See import_sets in prepare_data.py)
@@ -38,12 +42,127 @@ def import_data_for_classification(spreadsheets_dir, data_dir, features = 'all')
     train_filepath = os.path.join(data_dir, 'train.csv')
     test_filepath = os.path.join(data_dir, 'test.csv')
 
+    # Folder where the parsed spreadsheets are cached
+    cache_dir = os.path.join(data_dir, 'corpus-cache')
+
+    if not os.path.exists(train_filepath) or not os.path.exists(test_filepath):
+        create_train_and_test_sets(spreadsheets_dir, text_column, 
+                                   classes_columns, train_filepath, test_filepath,
+                                   label_column, cache_dir,
+                                   get_memory_report_filepath(memory_report_dir, 'create_train_and_test_sets'))
+
+    # Folder where the features generated from the train and test sets are cached
+    features_cache_dir = os.path.join(data_dir, 'features-cache')
+
+    return import_sets(train_filepath, test_filepath, text_column, label_column,
+                       features=features, cache_dir=features_cache_dir,
+                       memory_report_filepath=get_memory_report_filepath(memory_report_dir, 'import_sets'))
+
+def get_memory_report_filepath(memory_report_dir, name):
+    """Returns the JSON file where the memory of a data preparation method is
+    reported, or None if the memory is not tracked."""
+    if memory_report_dir is None:
+        return None
+
+    return os.path.join(memory_report_dir, 'memory_' + name + '.json')
+
+def import_data_for_feature_selection(spreadsheets_dir, data_dir, features = 'all'):
+    """Imports the training samples before feature selection, together with
+    the chi-square score of each feature, so different numbers of features
+    can be evaluated (See sweep_feature_selection in select_features.py).
+
+    Args:
+        spreadsheets_dir (String): Folder where spreadsheets
+        are located.
+        data_dir (String): Folder where parsed data is saved.
+        features (String, optional): Type of features used ('all', 'statistic'
+            or 'heuristic'). Defaults to 'all'.
+    Returns:
+        Training features (sparse matrix), training labels, names of the
+        features and their chi-square scores
+    """
+
+    # Spreadsheets headers
+    text_column = 'Paragraph'   
+    classes_columns = ['No categories identified.',
+                       'CF – Contribution flow',
+                       'CT – Choose a task',
+                       'TC – Talk to the community',
+                       'BW – Build local workspace',
+                       'DC – Deal with the code',
+                       'SC – Submit the changes']
+
+    # Label for a new column header that will merge
+    # classes_columns into a single column
+    label_column = 'Label'
+
+    # Filepaths where the train and test sets are saved
+    train_filepath = os.path.join(data_dir, 'train.csv')
+    test_filepath = os.path.join(data_dir, 'test.csv')
+
+    # Folder where the parsed spreadsheets are cached
+    cache_dir = os.path.join(data_dir, 'corpus-cache')
+
+    if not os.path.exists(train_filepath) or not os.path.exists(test_filepath):
+        create_train_and_test_sets(spreadsheets_dir, text_column, 
+                                   classes_columns, train_filepath, test_filepath,
+                                   label_column, cache_dir)
+
+    # Folder where the features generated from the train and test sets are cached
+    features_cache_dir = os.path.join(data_dir, 'features-cache')
+
+    X_train, y_train, _, _, _, _, feature_names, features_dir = import_features(
+        train_filepath, test_filepath, text_column, label_column,
+        features=features, cache_dir=features_cache_dir)
+
+    scores, _ = compute_chi2_scores(X_train, y_train, get_scores_filepath(features_dir, features))
+
+    return X_train, y_train, feature_names, scores
+
+def import_data_for_fold_features(spreadsheets_dir, data_dir):
+    """Imports and parses spreadsheets as data structures for a cross-validation
+    in which the features of each fold are generated only from its training
+    instances (See FoldFeatures in fold_features.py).
+
+    Args:
+        spreadsheets_dir (String): Folder where spreadsheets
+        are located.
+        data_dir (String): Folder where parsed data is saved.
+    Returns:
+        FoldFeatures, Series: Training paragraphs and labels (See
+        import_fold_features in prepare_data.py)
+    """
+
+    # Spreadsheets headers
+    text_column = 'Paragraph'   
+    classes_columns = ['No categories identified.',
+                       'CF – Contribution flow',
+                       'CT – Choose a task',
+                       'TC – Talk to the community',
+                       'BW – Build local workspace',
+                       'DC – Deal with the code',
+                       'SC – Submit the changes']
+
+    # Label for a new column header that will merge
+    # classes_columns into a single column
+    label_column = 'Label'
+
+    # Filepaths where the train and test sets are saved
+    train_filepath = os.path.join(data_dir, 'train.csv')
+    test_filepath = os.path.join(data_dir, 'test.csv')
+
+    # Folder where the parsed spreadsheets are cached
+    cache_dir = os.path.join(data_dir, 'corpus-cache')
+
     if not os.path.exists(train_filepath) or not os.path.exists(test_filepath):
         create_train_and_test_sets(spreadsheets_dir, text_column, 
                                    classes_columns, train_filepath, test_filepath,
-                                   label_column)
+                                   label_column, cache_dir)
+
+    # Folder where the features generated for each fold are cached
+    folds_cache_dir = os.path.join(data_dir, 'folds-cache')
 
-    return import_sets(train_filepath, test_filepath, text_column, label_column, features=features)
+    return import_fold_features(train_filepath, text_column, label_column, folds_cache_dir)
 
 def import_data_for_prediction(spreadsheets_dir, data_dir):
     """Imports and parses spreadsheets as data structures for prediction.
@@ -76,9 +195,16 @@ def import_data_for_prediction(spreadsheets_dir, data_dir):
     train_filepath = os.path.join(data_dir, 'train_predict.csv')
     test_filepath = os.path.join(data_dir, 'test_predict.csv')
 
+    # Folder where the parsed spreadsheets are cached
+    cache_dir = os.path.join(data_dir, 'corpus-cache-predict')
+
     if not os.path.exists(train_filepath) or not os.path.exists(test_filepath):
         create_train_and_test_sets(spreadsheets_dir, text_column, 
                                    classes_columns, train_filepath, test_filepath,
-                                   label_column)
+                                   label_column, cache_dir)
+
+    # Folder where the features generated from the train and test sets are cached
+    features_cache_dir = os.path.join(data_dir, 'features-cache')
 
-    return import_sets(train_filepath, test_filepath, text_column, label_column, True)
\ No newline at end of file
+    return import_sets(train_filepath, test_filepath, text_column, label_column, True,
+                       cache_dir=features_cache_dir)
\ No newline at end of file
@@ -4,17 +4,26 @@
 __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
+import os
+import numpy
+import shutil
 import pandas
 from scipy.sparse import hstack
 from sklearn.model_selection import train_test_split
 
+from .cache_features import compute_features_key, load_features, save_features
+from .fold_features import FoldFeatures
 from .generate_features import create_statistic_features, create_heuristic_features
+from .generate_features import VECTORIZER_ARGS, PATTERNS_FILEPATH
 from .transform_data import transform_spreadsheets_in_dataframe
-from .preprocess_text import text_preprocessing
-from .select_features import select_features
+from .select_features import select_features, compute_chi2_scores, SELECTION_PERCENTILE
+from .track_memory import MemoryTracker
+# Text preprocessing techniques, shared with the web application
+from paragraph_pipeline import PREPROCESSING_TECHNIQUES, text_preprocessing
 
 def create_train_and_test_sets(spreadsheets_dir, text_column, classes_columns,
-                               train_filepath, test_filepath, label_column):
+                               train_filepath, test_filepath, label_column,
+                               cache_dir=None, memory_report_filepath=None):
     """Creates the train and test sets based on the spreadsheets from the 
         qualitative analysis.
 
@@ -30,25 +39,49 @@ def create_train_and_test_sets(spreadsheets_dir, text_column, classes_columns,
             saved as a CSV file
         label_column (String): Represents the name given to a new column that
             will be used to store the label of each paragraph.
+        cache_dir (String, optional): Represents the path to the directory where
+            the parsed spreadsheets are cached (See transform_spreadsheets_in_dataframe).
+            Defaults to None (no cache).
+        memory_report_filepath (String, optional): If given, the peak and retained
+            memory of each stage are tracked, printed and saved in this JSON file
+            (See MemoryTracker). Defaults to None (no tracking).
     """
-    dataframe = transform_spreadsheets_in_dataframe(spreadsheets_dir,
-                                                    text_column,
-                                                    classes_columns,
-                                                    label_column)
+    memory_tracker = MemoryTracker(enabled=memory_report_filepath is not None)
 
-    X = dataframe[text_column]
-    y = dataframe[label_column]
+    with memory_tracker.stage('parse_spreadsheets'):
+        dataframe = transform_spreadsheets_in_dataframe(spreadsheets_dir,
+                                                        text_column,
+                                                        classes_columns,
+                                                        label_column,
+                                                        cache_dir)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, test_size=0.2)
+    with memory_tracker.stage('split_sets'):
+        X = dataframe[text_column]
+        y = dataframe[label_column]
 
-    train_data = pandas.concat([X_train, y_train], axis=1)
-    test_data = pandas.concat([X_test, y_test], axis=1)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, test_size=0.2)
 
-    train_data.to_csv(train_filepath, index=False, encoding='utf-8-sig')
-    test_data.to_csv(test_filepath, index=False, encoding='utf-8-sig')
+        train_data = pandas.concat([X_train, y_train], axis=1)
+        test_data = pandas.concat([X_test, y_test], axis=1)
 
-def import_sets(train_filepath, test_filepath, text_column, label_column, is_predict = False, features='all'):
-    """Imports train and test sets and applies the text preprocessing techniques when necessary
+    with memory_tracker.stage('write_sets'):
+        train_data.to_csv(train_filepath, index=False, encoding='utf-8-sig')
+        test_data.to_csv(test_filepath, index=False, encoding='utf-8-sig')
+
+    memory_tracker.report(memory_report_filepath)
+
+def read_annotated_set(filepath, text_column):
+    """Reads a train or test set (CSV) without the rows whose paragraph is empty.
+
+    Both import_features and import_fold_features read the sets here, so the
+    same paragraphs (and index) are used by both, and the fold hashes of a
+    cross-validation match.
+    """
+    return pandas.read_csv(filepath).dropna(subset=[text_column])
+
+def import_features(train_filepath, test_filepath, text_column, label_column, is_predict = False, features='all', cache_dir=None,
+                    memory_tracker=None, models_dir=''):
+    """Imports train and test sets and converts them into features, before feature selection
     
     Args:
         text_column (String): Represents the column containing the paragraphs
@@ -63,41 +96,209 @@ def import_sets(train_filepath, test_filepath, text_column, label_column, is_pre
             feature selection is prediction, it loads the
             feature selector used during training to avoid
             overfitting. Defaults to False.
+        features (String, optional): Type of features used ('all', 'statistic'
+            or 'heuristic'). Defaults to 'all'.
+        cache_dir (String, optional): Folder where the preprocessed paragraphs and
+            the statistic and heuristic features are cached. The cache is identified
+            by the content of the train and test sets, the preprocessing techniques,
+            the vectorizer arguments and the heuristic patterns, and it is shared by
+            all types of features. Defaults to None (no cache).
+        memory_tracker (MemoryTracker, optional): Tracks the memory of each stage.
+            Defaults to None (no tracking).
+        models_dir (String, optional): Folder where the fitted vectorizer is saved,
+            or loaded from when predicting (See create_statistic_features).
+            Defaults to the working directory.
+    Returns:
+        Training and test features (sparse matrices) and labels, the original
+        paragraphs of both sets, the names of the features and the folder where
+        the features are cached (None if they are not cached).
     """
+    if memory_tracker is None:
+        memory_tracker = MemoryTracker(enabled=False)
+
     print("Importing training and test sets.")
-    train_data = pandas.read_csv(train_filepath)
-    train_text_column = train_data[text_column]
-    X_train, y_train = train_data[text_column], train_data[label_column]
+    with memory_tracker.stage('load_sets'):
+        train_data = read_annotated_set(train_filepath, text_column)
+        train_text_column = train_data[text_column]
+        X_train, y_train = train_data[text_column], train_data[label_column]
 
-    test_data = pandas.read_csv(test_filepath)
-    test_text_column = test_data[text_column]
-    X_test, y_test = test_data[text_column], test_data[label_column]
+        test_data = read_annotated_set(test_filepath, text_column)
+        test_text_column = test_data[text_column]
+        X_test, y_test = test_data[text_column], test_data[label_column]
 
-    print("Applying preprocessing techniques on paragraphs column.")
-    preprocessing_techniques = ['remove-stopwords', 'remove-punctuations', 'lemmatization']
-    X_train = text_preprocessing(X_train, preprocessing_techniques)
-    X_test = text_preprocessing(X_test, preprocessing_techniques)
+    cached_features = None
+    features_dir = None
+    vectorizer_filepath = os.path.join(models_dir, 'tf-idf.sav')
 
-    print("Converting paragraphs into statistic features.")
-    train_statistic_features, test_statistic_features = create_statistic_features(X_train, X_test, is_predict)
+    if cache_dir is not None:
+        # When predicting, the statistic features depend on the vectorizer fitted during training.
+        key_filepaths = [train_filepath, test_filepath, PATTERNS_FILEPATH] + ([vectorizer_filepath] if is_predict else [])
+        key_parameters = {'preprocessing_techniques': PREPROCESSING_TECHNIQUES,
+                          'vectorizer_args': VECTORIZER_ARGS,
+                          'is_predict': is_predict}
+        features_key = compute_features_key(key_filepaths, key_parameters)
 
-    print("Converting paragraphs into heuristic features.")
-    train_heuristic_features, test_heuristic_features = create_heuristic_features(X_train, X_test)
+        with memory_tracker.stage('load_cached_features'):
+            cached_features = load_features(cache_dir, features_key)
+
+    if cached_features is not None:
+        print("Loading statistic and heuristic features from cache.")
+        matrices, metadata, features_dir = cached_features
+
+        train_statistic_features, test_statistic_features = matrices['train_statistic'], matrices['test_statistic']
+        train_heuristic_features, test_heuristic_features = matrices['train_heuristic'], matrices['test_heuristic']
+        statistic_names = numpy.array(metadata['statistic_names'], dtype=object)
+        heuristic_names = numpy.array(metadata['heuristic_names'], dtype=object)
+
+        # The vectorizer fitted with the cached features replaces the
+        # one left by previous executions.
+        if not is_predict:
+            shutil.copyfile(os.path.join(features_dir, 'tf-idf.sav'), vectorizer_filepath)
+    else:
+        print("Applying preprocessing techniques on paragraphs column.")
+        with memory_tracker.stage('preprocessing'):
+            X_train = text_preprocessing(X_train, PREPROCESSING_TECHNIQUES)
+            X_test = text_preprocessing(X_test, PREPROCESSING_TECHNIQUES)
+
+        print("Converting paragraphs into statistic features.")
+        with memory_tracker.stage('statistic_features'):
+            train_statistic_features, test_statistic_features, statistic_names = create_statistic_features(
+                X_train, X_test, is_predict, models_dir)
 
+        print("Converting paragraphs into heuristic features.")
+        with memory_tracker.stage('heuristic_features'):
+            train_heuristic_features, test_heuristic_features, heuristic_names = create_heuristic_features(X_train, X_test)
+
+        if cache_dir is not None:
+            print("Saving statistic and heuristic features to cache.")
+            matrices = {
+                'train_statistic': train_statistic_features,
+                'test_statistic': test_statistic_features,
+                'train_heuristic': train_heuristic_features,
+                'test_heuristic': test_heuristic_features
+            }
+            metadata = {
+                'statistic_names': statistic_names.tolist(),
+                'heuristic_names': heuristic_names.tolist(),
+                'train_paragraphs': X_train.tolist(),
+                'test_paragraphs': X_test.tolist()
+            }
+            with memory_tracker.stage('save_cached_features'):
+                save_features(cache_dir, features_key, matrices, metadata,
+                              artifacts=[] if is_predict else [vectorizer_filepath])
+            features_dir = os.path.join(cache_dir, features_key)
+
+    # Features are kept as sparse matrices (CSR) until the end, and the
+    # names of their columns are kept in a separate array.
     if features == 'all':
-        X_train = pandas.concat([train_statistic_features, train_heuristic_features], axis=1)
-        X_test = pandas.concat([test_statistic_features, test_heuristic_features], axis=1)
+        with memory_tracker.stage('concat'):
+            X_train = hstack([train_statistic_features, train_heuristic_features], format='csr')
+            X_test = hstack([test_statistic_features, test_heuristic_features], format='csr')
+            feature_names = numpy.concatenate([statistic_names, heuristic_names])
     elif features == 'heuristic':
         X_train = train_heuristic_features
         X_test = test_heuristic_features
+        feature_names = heuristic_names
     elif features == 'statistic':
         X_train = train_statistic_features
         X_test = test_statistic_features
+        feature_names = statistic_names
     else:
         print('The type of features you aim to use does not exist.')
         raise ValueError
 
+    return X_train, y_train, X_test, y_test, train_text_column, test_text_column, feature_names, features_dir
+
+def import_sets(train_filepath, test_filepath, text_column, label_column, is_predict = False, features='all',
+                cache_dir=None, percentile=SELECTION_PERCENTILE, memory_report_filepath=None, models_dir=''):
+    """Imports train and test sets and applies the text preprocessing techniques when necessary
+
+    Args:
+        text_column (String): Represents the column containing the paragraphs
+            in each spreadsheet
+        train_filepath (String): Represents the filepath where the train instances are
+            saved as a CSV file
+        test_filepath (String): Represents the filepath where the test instances are
+            saved as a CSV file
+        label_column (String): Represents the name given to a new column that
+            will be used to store the label of each paragraph.
+        is_predict (Bool, optional): If the purpose of
+            feature selection is prediction, it loads the
+            feature selector used during training to avoid
+            overfitting. Defaults to False.
+        features (String, optional): Type of features used ('all', 'statistic'
+            or 'heuristic'). Defaults to 'all'.
+        cache_dir (String, optional): Folder where the features and their chi-square
+            scores are cached (See import_features). Defaults to None (no cache).
+        percentile (Integer, optional): Percentile of features selected.
+            Defaults to SELECTION_PERCENTILE.
+        memory_report_filepath (String, optional): If given, the peak and retained
+            memory of each stage are tracked, printed and saved in this JSON file
+            (See MemoryTracker). Defaults to None (no tracking).
+        models_dir (String, optional): Folder where the fitted vectorizer and feature
+            selector are saved, or loaded from when predicting. Defaults to the
+            working directory.
+    """
+    memory_tracker = MemoryTracker(enabled=memory_report_filepath is not None)
+
+    X_train, y_train, X_test, y_test, train_text_column, test_text_column, feature_names, features_dir = \
+        import_features(train_filepath, test_filepath, text_column, label_column, is_predict, features, cache_dir,
+                        memory_tracker, models_dir)
+
+    scores = None
+
+    if not is_predict:
+        print("Scoring features with chi2.")
+        with memory_tracker.stage('chi2_scores'):
+            scores = compute_chi2_scores(X_train, y_train, get_scores_filepath(features_dir, features))
+
     print("Selecting features with SelectPercentile (chi2).")
-    X_train, X_test, selected_feature_names = select_features(X_train, y_train, X_test, is_predict)
+    with memory_tracker.stage('selection'):
+        X_train, X_test, selected_feature_names = select_features(X_train, y_train, X_test, feature_names, is_predict,
+                                                                  scores, percentile, models_dir)
+
+    memory_tracker.report(memory_report_filepath)
 
     return X_train, y_train, X_test, y_test, train_text_column, test_text_column, selected_feature_names
+
+def import_fold_features(train_filepath, text_column, label_column, cache_dir):
+    """Imports the train set for a cross-validation without data leakage.
+
+    Unlike import_sets, the TF-IDF vocabulary and the feature selection are not
+    learned here, but in each fold of the cross-validation (See FoldFeatures).
+
+    Args:
+        train_filepath (String): Represents the filepath where the train instances are
+            saved as a CSV file
+        text_column (String): Represents the column containing the paragraphs
+            in each spreadsheet
+        label_column (String): Represents the name of the column containing the
+            label of each paragraph.
+        cache_dir (String): Folder where the features of each fold are cached.
+    Returns:
+        FoldFeatures, Series: Features of the training paragraphs and their labels
+    """
+    print("Importing training set.")
+    train_data = read_annotated_set(train_filepath, text_column)
+    X_train, y_train = train_data[text_column], train_data[label_column]
+
+    print("Applying preprocessing techniques on paragraphs column.")
+    X_train = text_preprocessing(X_train, PREPROCESSING_TECHNIQUES)
+
+    print("Converting paragraphs into heuristic features.")
+    train_heuristic_features, _, _ = create_heuristic_features(X_train, [])
+
+    return FoldFeatures(X_train.tolist(), train_heuristic_features, cache_dir), y_train
+
+def get_scores_filepath(features_dir, features):
+    """Returns the file where the chi-square scores of a type of features are cached.
+
+    Args:
+        features_dir (String): Folder of the cached features (See import_features).
+            If None, the scores are not cached.
+        features (String): Type of features ('all', 'statistic' or 'heuristic').
+    """
+    if features_dir is None:
+        return None
+
+    return os.path.join(features_dir, 'chi2-' + features + '.npz')
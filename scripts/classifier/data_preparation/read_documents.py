@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import zipfile
+import pandas
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+# app/classifier/get_contributing.py (the app folder is added to the path by main.py)
+from classifier.get_contributing import iter_paragraphs
+
+# Namespace of the elements of a .docx document (WordprocessingML)
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Number of documents written at a time by export_documentation_paragraphs
+DOCUMENTS_PER_BATCH = 64
+
+def list_documentation_files(raw_dir):
+    """Lists the .docx files of the raw documentation folder, sorted by name."""
+    return [os.path.join(raw_dir, filename) for filename in sorted(os.listdir(raw_dir))
+            if filename.endswith('.docx') and os.path.isfile(os.path.join(raw_dir, filename))]
+
+def iter_docx_lines(filepath):
+    """Reads the lines of a .docx file, as the XML of the document is parsed.
+
+    Each paragraph of the document (<w:p>) is a line, and line breaks inside
+    a paragraph (<w:br>) start new lines. Empty paragraphs are blank lines.
+    Paragraphs nested in another one (e.g. in text boxes) are read as lines
+    of the outer paragraph, so they are not read twice. Each element is
+    removed from its parent once it is read, so the whole XML tree is never
+    kept in memory.
+
+    Args:
+        filepath (String): A .docx file.
+    Returns:
+        Generator of strings: The lines of the document.
+    """
+    paragraph_tag, text_tag, tab_tag = WORD_NAMESPACE + 'p', WORD_NAMESPACE + 't', WORD_NAMESPACE + 'tab'
+    break_tags = (WORD_NAMESPACE + 'br', WORD_NAMESPACE + 'cr')
+
+    # Elements being parsed, from the root to the current one,
+    # and number of them that are paragraphs.
+    parents = []
+    paragraph_depth = 0
+
+    with zipfile.ZipFile(filepath) as docx_file:
+        with docx_file.open('word/document.xml') as document:
+            for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+                if event == 'start':
+                    parents.append(element)
+                    paragraph_depth = paragraph_depth + (element.tag == paragraph_tag)
+                    continue
+
+                parents.pop()
+
+                if element.tag == paragraph_tag:
+                    paragraph_depth = paragraph_depth - 1
+
+                    if paragraph_depth == 0:
+                        text = []
+
+                        for child in element.iter():
+                            if child.tag == text_tag:
+                                text.append(child.text or '')
+                            elif child.tag == tab_tag:
+                                text.append('\t')
+                            elif child.tag in break_tags:
+                                text.append('\n')
+                            elif child.tag == paragraph_tag and child is not element:
+                                text.append('\n')
+
+                        yield from ''.join(text).split('\n')
+
+                # Elements inside a paragraph are read with it.
+                if paragraph_depth == 0 and parents:
+                    parents[-1].remove(element)
+
+def read_docx_paragraphs(filepath):
+    """Extracts the paragraphs of a .docx file, with the same rules used to split
+    the CONTRIBUTING files (See iter_paragraphs in app/classifier/get_contributing.py).
+
+    Args:
+        filepath (String): A .docx file.
+    Returns:
+        List of strings: The paragraphs of the document.
+    """
+    return list(iter_paragraphs(iter_docx_lines(filepath)))
+
+def iter_documentation_paragraphs(filepaths, workers=None):
+    """Extracts the paragraphs of a list of .docx files in a pool of processes.
+
+    Args:
+        filepaths (List of strings): The .docx files (See list_documentation_files).
+        workers (Integer, optional): Number of processes used to read the files.
+            Defaults to one per CPU core.
+    Returns:
+        Generator of tuples: The filepath and the paragraphs of each document,
+        in the order of filepaths, as soon as they are read.
+    """
+    if not filepaths:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from zip(filepaths, executor.map(read_docx_paragraphs, filepaths, chunksize=16))
+
+def export_documentation_paragraphs(raw_dir, output_filepath, workers=None):
+    """Extracts the paragraphs of all documents of the raw documentation folder
+    (data/documentation/raw) and saves them in a Parquet file.
+
+    The file has one row per paragraph, with the document (e.g.
+    'owner@repository.docx'), the position of the paragraph in the document
+    and the paragraph. The documents are written in batches, as they are read.
+
+    Args:
+        raw_dir (String): Folder of the .docx files.
+        output_filepath (String): Parquet file where the paragraphs are saved.
+        workers (Integer, optional): Number of processes used to read the files.
+    Returns:
+        Integer, Integer: Number of documents and paragraphs exported.
+    """
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([('Document', pyarrow.string()), ('Paragraph Index', pyarrow.int64()),
+                             ('Paragraph', pyarrow.string())])
+    filepaths = list_documentation_files(raw_dir)
+    rows = []
+    n_paragraphs = 0
+
+    with pyarrow.parquet.ParquetWriter(output_filepath + '.tmp', schema) as output:
+        for number, (filepath, paragraphs) in enumerate(iter_documentation_paragraphs(filepaths, workers), 1):
+            rows.extend((os.path.basename(filepath), index, paragraph) for index, paragraph in enumerate(paragraphs))
+
+            if number % DOCUMENTS_PER_BATCH == 0 or number == len(filepaths):
+                batch = pandas.DataFrame(rows, columns=schema.names)
+                output.write_table(pyarrow.Table.from_pandas(batch, schema=schema, preserve_index=False))
+                n_paragraphs += len(rows)
+                rows = []
+
+    os.replace(output_filepath + '.tmp', output_filepath)
+
+    return len(filepaths), n_paragraphs
@@ -4,36 +4,162 @@
 __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
+import os
+import time
+import numpy
 import pickle
+import pandas
+from sklearn.base import clone
 from sklearn.feature_selection import SelectPercentile, chi2
+from sklearn.model_selection import StratifiedKFold, cross_val_score
 
-def select_features(X_train, y_train, X_test, is_predict = False):
+# Percentile of features kept by select_features
+SELECTION_PERCENTILE = 15
+
+def compute_chi2_scores(X_train, y_train, filepath=None):
+    """Computes the chi-square score of each feature.
+
+    chi2 works directly on the sparse matrix, and the scores are saved to
+    a file, so different percentiles can be tried without computing them again.
+
+    Args:
+        X_train (Sparse matrix): Training features
+        y_train (Series): Training labels
+        filepath (String, optional): File (.npz) where the scores are cached.
+            The file must be specific to the training features (e.g. inside
+            the folder of the features cache). Defaults to None (no cache).
+    Returns:
+        Array, Array: chi-square scores and p-values of each feature
+    """
+
+    if filepath is not None and os.path.exists(filepath):
+        with numpy.load(filepath) as cached:
+            if cached['scores'].shape[0] == X_train.shape[1]:
+                return cached['scores'], cached['pvalues']
+
+    scores, pvalues = chi2(X_train, y_train)
+
+    if filepath is not None:
+        # numpy adds the extension to files without it
+        temporary_filepath = filepath + '.tmp.npz'
+        numpy.savez(temporary_filepath, scores=scores, pvalues=pvalues)
+        os.replace(temporary_filepath, filepath)
+
+    return scores, pvalues
+
+def create_selector(scores, pvalues, percentile=SELECTION_PERCENTILE):
+    """Creates a fitted SelectPercentile (chi-square) from scores already computed.
+
+    The selector is equal to one fitted on the training features, but no
+    scoring is done, so changing the percentile is just a new threshold.
+
+    Args:
+        scores (Array): chi-square scores (See compute_chi2_scores)
+        pvalues (Array): chi-square p-values (See compute_chi2_scores)
+        percentile (Integer, optional): Percentile of features kept.
+    Returns:
+        SelectPercentile: The fitted selector
+    """
+    selector = SelectPercentile(chi2, percentile=percentile)
+    selector.scores_ = numpy.asarray(scores)
+    selector.pvalues_ = numpy.asarray(pvalues)
+    selector.n_features_in_ = selector.scores_.shape[0]
+
+    return selector
+
+def select_features(X_train, y_train, X_test, feature_names, is_predict = False,
+                    scores = None, percentile = SELECTION_PERCENTILE, models_dir = ''):
     """Selects the best features in a classification problem
 
     Args:
-        X_train (Dataframe): Training features
+        X_train (Sparse matrix): Training features
         y_train (Series): Training labels
-        X_test (Dataframe): Test features
+        X_test (Sparse matrix): Test features
+        feature_names (Array of strings): Names of the columns
+            of X_train and X_test
         is_predict (Bool, optional): If the purpose of
             feature selection is prediction, it loads the
             feature selector used during training to avoid
             overfitting. Defaults to False.
+        scores (Tuple of arrays, optional): chi-square scores and p-values
+            of the training features (See compute_chi2_scores). If None,
+            they are computed.
+        percentile (Integer, optional): Percentile of features kept.
+            Defaults to SELECTION_PERCENTILE.
+        models_dir (String, optional): Folder where the fitted selector
+            (feature_selector.sav) is saved, or loaded from when predicting.
+            Defaults to the working directory.
     Returns:
-        Dataframe, Dataframe: Training and test features selected
-            using SelectPercentile (chi-square)
+        Sparse matrix, Sparse matrix, Array: Training and test
+            features selected using SelectPercentile (chi-square),
+            and the names of the selected features
     """
 
     if is_predict:
-        selector = pickle.load(open('feature_selector.sav', 'rb'))
+        selector = pickle.load(open(os.path.join(models_dir, 'feature_selector.sav'), 'rb'))
         X_train = selector.transform(X_train)
-        X_test = selector.transform(X_test)           
+        X_test = selector.transform(X_test)
     else:
-        selector = SelectPercentile(chi2, percentile=15)
-        selector.fit(X_train, y_train)
+        if scores is None:
+            scores = compute_chi2_scores(X_train, y_train)
+
+        selector = create_selector(*scores, percentile=percentile)
 
         X_train = selector.transform(X_train)
         X_test = selector.transform(X_test)
 
-        pickle.dump(selector, open('feature_selector.sav', 'wb'))
+        pickle.dump(selector, open(os.path.join(models_dir, 'feature_selector.sav'), 'wb'))
+
+    return X_train, X_test, numpy.asarray(feature_names)[selector.get_support()]
+
+def sweep_feature_selection(estimator, X_train, y_train, scores, percentiles=(), top_k=(), n_splits=10):
+    """Evaluates an estimator with different numbers of selected features.
+
+    The features are ranked once by their chi-square scores, so each
+    percentile (or number of features) only takes the columns on the top
+    of the ranking and cross-validates the estimator on them.
+
+    Args:
+        estimator: A scikit-learn classifier (not fitted)
+        X_train (Sparse matrix): Training features, before selection
+        y_train (Series): Training labels
+        scores (Array): chi-square scores of the training features
+            (See compute_chi2_scores)
+        percentiles (List of numbers, optional): Percentiles of features evaluated
+        top_k (List of integers, optional): Numbers of features evaluated
+        n_splits (Integer, optional): Number of folds of the cross-validation
+    Returns:
+        Dataframe: Number of features, percentile, F1 weighted (mean and
+            standard deviation) and fitting time of each evaluation, sorted
+            by the number of features
+    """
+    n_total = X_train.shape[1]
+    # Features without score (e.g. never present in the training set) are the last ones
+    ranking = numpy.argsort(-numpy.nan_to_num(scores, nan=-numpy.inf), kind='stable')
+
+    sizes = set(min(int(k), n_total) for k in top_k)
+    sizes.update(max(1, int(n_total * percentile / 100)) for percentile in percentiles)
+
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=0)
+    results = []
+
+    for n_features in sorted(sizes):
+        columns = numpy.sort(ranking[:n_features])
+
+        started_at = time.time()
+        f1_weighted_scores = cross_val_score(clone(estimator), X_train[:, columns], y_train,
+                                             scoring='f1_weighted', cv=cv)
+
+        results.append({
+            'n_features': n_features,
+            'percentile': round(100 * n_features / n_total, 2),
+            'f1_weighted_mean': f1_weighted_scores.mean(),
+            'f1_weighted_std': f1_weighted_scores.std(),
+            'seconds': round(time.time() - started_at, 2)
+        })
+
+        print('{} features ({}%): F1 weighted {:.3f} (+/- {:.3f})'.format(
+              n_features, results[-1]['percentile'], results[-1]['f1_weighted_mean'],
+              results[-1]['f1_weighted_std']))
 
-    return X_train, X_test, selector.get_feature_names_out()
+    return pandas.DataFrame(results)
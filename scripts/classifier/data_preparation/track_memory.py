@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class MemoryTracker:
+    def __init__(self, enabled=True):
+        """Tracks the memory of the stages of a data preparation run.
+
+        For each stage, it records the peak memory allocated while the stage is
+        executed (above the memory allocated before it) and the memory it retains
+        when it finishes, both in MB, using tracemalloc. Python objects, numpy
+        arrays and scipy matrices are tracked. tracemalloc slows the execution,
+        so the tracking is disabled by default in the data preparation methods.
+
+        Args:
+            enabled (Boolean, optional): If False, stages are executed without
+                being tracked.
+        """
+        self.enabled = enabled
+        self.stages = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """Tracks the code executed inside a `with` block as a stage."""
+        if not self.enabled:
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        # Without reset_peak (Python < 3.9), the peak of a stage
+        # is the highest peak since the tracking started.
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        started_at = time.perf_counter()
+        before, _ = tracemalloc.get_traced_memory()
+
+        try:
+            yield
+        finally:
+            after, peak = tracemalloc.get_traced_memory()
+            self.stages.append({'stage': name,
+                                'peak_memory_mb': round(max(peak - before, 0) / 2 ** 20, 1),
+                                'retained_memory_mb': round((after - before) / 2 ** 20, 1),
+                                'total_memory_mb': round(after / 2 ** 20, 1),
+                                'seconds': round(time.perf_counter() - started_at, 2)})
+
+    def report(self, filepath=None):
+        """Prints the memory of each stage, stops the tracking and, if a
+        filepath is given, saves the stages as a JSON file."""
+        if not self.enabled:
+            return
+
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+        print("Memory per stage (MB):")
+
+        for stage in self.stages:
+            print('  {stage}: peak {peak_memory_mb}, retained {retained_memory_mb}, '
+                  'total {total_memory_mb} ({seconds} s).'.format(**stage))
+
+        if filepath is not None:
+            if os.path.dirname(filepath) and not os.path.isdir(os.path.dirname(filepath)):
+                os.makedirs(os.path.dirname(filepath))
+
+            with open(filepath, 'w') as report_file:
+                json.dump(self.stages, report_file, indent=4)
@@ -5,32 +5,204 @@ __author__ = 'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
 import os
+import json
+import numpy
 import pandas
+import hashlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 
 def transform_spreadsheets_in_dataframe(spreadsheets_dir, text_column, 
-                                        classes_columns, label_column):
+                                        classes_columns, label_column,
+                                        cache_dir=None, workers=None):
     """Transforms annotated spreadsheets in a dataframe structure.
 
+    Parsing spreadsheets is slow, so when a cache folder is provided, the parsed
+    spreadsheets are saved there as a Parquet file (see update_corpus_cache), and
+    only new or changed spreadsheets are parsed again in the next executions.
+
     Args:
         spreadsheets_dir (String): Represents the path to the directory where the
             spreadsheets are located.
+        cache_dir (String, optional): Represents the path to the directory where
+            the parsed spreadsheets are cached. Defaults to None (no cache).
+        workers (Integer, optional): Number of processes used to parse the
+            spreadsheets. Defaults to one per CPU core.
 
     Returns:
         Dataframe: Contains the parsed spreadsheets in a dataframe structure.
     """
-    dataframe = pandas.DataFrame()
+    if cache_dir is not None:
+        return update_corpus_cache(spreadsheets_dir, cache_dir, text_column,
+                                   classes_columns, label_column, workers)
+
+    filepaths = list_spreadsheet_files(spreadsheets_dir)
+    worksheets = parse_spreadsheet_files(filepaths, text_column, classes_columns,
+                                         label_column, workers)
+
+    return pandas.concat(worksheets) if worksheets else pandas.DataFrame()
+
+def list_spreadsheet_files(spreadsheets_dir):
+    """Lists the spreadsheet files of a directory.
+
+    Args:
+        spreadsheets_dir (String): Represents the path to the directory where the
+            spreadsheets are located.
+
+    Returns:
+        List of strings: Filepaths of the spreadsheets, sorted by name.
+    """
+    filepaths = []
 
-    for filename in os.listdir(spreadsheets_dir):
+    for filename in sorted(os.listdir(spreadsheets_dir)):
         filepath = os.path.join(spreadsheets_dir, filename)
 
         if os.path.isfile(filepath):
             if filename.endswith('.xlsx'):
-                rows = parse_spreadsheet_file(filepath, text_column,
-                                              classes_columns, label_column)
-                dataframe = pandas.concat([dataframe, rows])
+                filepaths.append(filepath)
+
+    return filepaths
+
+def parse_spreadsheet_files(filepaths, text_column, classes_columns, label_column, workers=None):
+    """Parses a list of spreadsheet files in a pool of processes.
+
+    Args:
+        filepaths (List of strings): Represent the paths to the spreadsheets.
+        workers (Integer, optional): Number of processes used to parse the
+            spreadsheets. Defaults to one per CPU core.
+
+    Returns:
+        List of dataframes: The data of each spreadsheet, in the order of filepaths.
+    """
+    if not filepaths:
+        return []
+
+    parse = partial(parse_spreadsheet_file, text_column=text_column,
+                    classes_columns=classes_columns, label_column=label_column)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(parse, filepaths, chunksize=16))
+
+def update_corpus_cache(spreadsheets_dir, cache_dir, text_column, classes_columns,
+                        label_column, workers=None):
+    """Loads the parsed spreadsheets from the cache, parsing only what has changed.
+
+    The cache contains a Parquet file with the rows of all spreadsheets and a
+    manifest identifying each spreadsheet by its path, size and hash. A spreadsheet
+    is parsed again only if it is new or if its size or hash differ from the
+    manifest (the hash is computed only when the modification time changes).
+    Rows of spreadsheets removed from the directory are removed from the cache.
+    The manifest also records the columns used to parse the spreadsheets
+    (text_column, classes_columns and label_column), and if they change, all
+    spreadsheets are parsed again.
+
+    Args:
+        spreadsheets_dir (String): Represents the path to the directory where the
+            spreadsheets are located.
+        cache_dir (String): Represents the path to the directory where the
+            parsed spreadsheets are cached.
+        workers (Integer, optional): Number of processes used to parse the
+            spreadsheets. Defaults to one per CPU core.
+
+    Returns:
+        Dataframe: Contains the parsed spreadsheets in a dataframe structure.
+    """
+    corpus_filepath = os.path.join(cache_dir, 'corpus.parquet')
+    manifest_filepath = os.path.join(cache_dir, 'manifest.json')
+
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    parameters = {'text_column': text_column, 'classes_columns': list(classes_columns),
+                  'label_column': label_column}
+    manifest = {}
+
+    if os.path.exists(manifest_filepath) and os.path.exists(corpus_filepath):
+        with open(manifest_filepath, 'r') as manifest_file:
+            cached_manifest = json.load(manifest_file)
+
+        # Spreadsheets parsed with other columns are parsed again.
+        if cached_manifest.get('parameters') == parameters:
+            manifest = cached_manifest['files']
+        else:
+            print("The cached spreadsheets were not parsed with the same columns.")
+
+    # Identifies which spreadsheets are new or have changed since
+    # the last time the cache was updated.
+    current_manifest = {}
+    changed_filepaths = []
+
+    for filepath in list_spreadsheet_files(spreadsheets_dir):
+        filename = os.path.basename(filepath)
+        stat = os.stat(filepath)
+        entry = {'path': os.path.abspath(filepath), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        cached = manifest.get(filename)
+
+        if cached and cached['path'] == entry['path'] and cached['size'] == entry['size'] \
+           and cached['mtime'] == entry['mtime']:
+            entry['sha1'] = cached['sha1']
+        else:
+            entry['sha1'] = hash_file(filepath)
+
+            if not cached or cached['path'] != entry['path'] or cached['size'] != entry['size'] \
+               or cached['sha1'] != entry['sha1']:
+                changed_filepaths.append(filepath)
+
+        current_manifest[filename] = entry
+
+    removed_filenames = set(manifest) - set(current_manifest)
+
+    if manifest and not changed_filepaths and not removed_filenames:
+        print("Loading {} spreadsheets from cache.".format(len(current_manifest)))
+        dataframe = pandas.read_parquet(corpus_filepath)
+    else:
+        print("Parsing {} new or changed spreadsheets ({} in cache).".format(
+              len(changed_filepaths), len(current_manifest) - len(changed_filepaths)))
+
+        outdated_filenames = removed_filenames | set(os.path.basename(filepath) for filepath in changed_filepaths)
+        worksheets = parse_spreadsheet_files(changed_filepaths, text_column, classes_columns,
+                                             label_column, workers)
+
+        if manifest:
+            cached_dataframe = pandas.read_parquet(corpus_filepath)
+            worksheets.insert(0, cached_dataframe[~cached_dataframe['Spreadsheet'].isin(outdated_filenames)])
+
+        dataframe = pandas.concat(worksheets, ignore_index=True) if worksheets else pandas.DataFrame()
+
+        # Columns of classes absent in a worksheet are not annotated.
+        for column in classes_columns:
+            if column in dataframe:
+                dataframe[column] = dataframe[column].fillna(0).astype(int)
+
+        # The corpus and its manifest are replaced only after being
+        # completely written, so an interrupted update keeps the old cache.
+        dataframe.to_parquet(corpus_filepath + '.tmp', index=False)
+        os.replace(corpus_filepath + '.tmp', corpus_filepath)
+
+        with open(manifest_filepath + '.tmp', 'w') as manifest_file:
+            json.dump({'parameters': parameters, 'files': current_manifest}, manifest_file, indent=4)
+
+        os.replace(manifest_filepath + '.tmp', manifest_filepath)
 
     return dataframe
 
+def hash_file(filepath):
+    """Computes the SHA-1 hash of the content of a file.
+
+    Args:
+        filepath (String): Represents the path to the file.
+
+    Returns:
+        String: Hexadecimal representation of the hash.
+    """
+    sha1 = hashlib.sha1()
+
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
 def parse_spreadsheet_file(filepath, text_column, classes_columns, label_column):
     """Extracts the annotated data from one spreadsheet file.
 
@@ -43,29 +215,57 @@ def parse_spreadsheet_file(filepath, text_column, classes_columns, label_column)
        Dataframe: Contains the data from the spreadsheet.
     """
     spreadsheet = pandas.ExcelFile(filepath, engine='openpyxl')
-    dataframe = pandas.DataFrame()
+    worksheets = []
 
     for worksheet_name in spreadsheet.sheet_names:
         worksheet = spreadsheet.parse(worksheet_name)
 
         # Identify the text column with text_column label
         worksheet.rename(columns={worksheet.columns[0]: text_column}, inplace = True)
-        worksheet[text_column].astype(str)
+        paragraphs = worksheet[text_column]
+        worksheet[text_column] = paragraphs.where(paragraphs.isnull(), paragraphs.astype(str))
 
         # Replace NaNs with 0s and non NaNs with 1s
         for column in classes_columns:
             if column in worksheet:
                 worksheet[column] = worksheet[column].notnull().astype(int)
-                
-        worksheet[label_column] = worksheet.apply(lambda row: 
-                                                  define_label(row, classes_columns),
-                                                  axis=1)
+
+        worksheet[label_column] = define_labels(worksheet, classes_columns)
         worksheet['Spreadsheet'] = os.path.basename(filepath)
         worksheet['Worksheet'] = worksheet_name
         worksheet['Row Index'] = worksheet.index
-        dataframe = pandas.concat([worksheet, dataframe])
 
-    return dataframe
+        # Only the annotated columns are kept. Other columns
+        # (e.g. comments of the annotators) are ignored.
+        columns = [text_column] + [column for column in classes_columns if column in worksheet] + \
+                  [label_column, 'Spreadsheet', 'Worksheet', 'Row Index']
+        worksheets.insert(0, worksheet[columns])
+
+    return pandas.concat(worksheets) if worksheets else pandas.DataFrame()
+
+def define_labels(worksheet, classes_columns):
+    """Identifies which label should be assigned to each row of a worksheet.
+
+    Works as define_label, but for all the rows at the same time.
+
+    Args:
+        worksheet: A pandas dataframe where the columns of classes contain 1
+            if the row was annotated with the respective class or 0 otherwise.
+        classes: A list of strings containing the columns that should be extracted
+            from the spreadsheet as classes of the classifier.
+    
+    Returns:
+        A pandas series of strings representing the label of each row.
+    """
+    labels = numpy.full(len(worksheet), 'No categories identified.', dtype=object)
+
+    # As in define_label, if a row was annotated with more than
+    # one class, the last class in classes_columns is used.
+    for _class in classes_columns:
+        if _class in worksheet:
+            labels = numpy.where(worksheet[_class].to_numpy() == 1, _class, labels)
+
+    return pandas.Series(labels, index=worksheet.index)
 
 def define_label(row, classes_columns):
     """Identifies which label should be assigned to a row in a spreadsheet
@@ -6,18 +6,36 @@ __contact__ = 'fronchetti@usp.br'
 
 # General modules
 import os
+import sys
 import random
 import shutil
 import pandas
+import time
 import pickle
 import numpy as np
 from scipy.sparse import vstack
 
+# The steps of the pipeline shared with the web application are kept only in
+# app/paragraph_pipeline.py. Pickled pipelines refer to them by the module name
+# `paragraph_pipeline`, so the folder of the application is added to the path
+# before the modules below are imported.
+APP_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'app'))
+
+if APP_DIR not in sys.path:
+    sys.path.append(APP_DIR)
+
 # Final estimator 
 from sklearn.svm import LinearSVC
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.metrics import accuracy_score, f1_score
 
 # Data preparation
-from data_preparation.import_data import import_data_for_classification, import_data_for_prediction
+from data_preparation.import_data import import_data_for_classification
+from data_preparation.import_data import import_data_for_feature_selection, import_data_for_fold_features
+from data_preparation.select_features import sweep_feature_selection
+from data_preparation.read_documents import export_documentation_paragraphs
+# app/paragraph_pipeline.py
+from paragraph_pipeline import build_pipeline, load_patterns, save_pipeline, load_pipeline, PIPELINE_FILEPATH
 
 # Model selection
 from model_selection.evaluate_estimators import evaluate_estimators_performance
@@ -25,21 +43,29 @@ from sklearn.ensemble import RandomForestClassifier as RClf
 
 # Classification
 from classification.train_model import train_classifier, features_cross_validation
+from classification.train_incremental import IncrementalClassifier, iter_annotated_chunks, train_incremental_classifier
+from classification.predict_batch import predict_directory, PREDICTION_CHUNK_SIZE
 from classification.explore_model import export_classification_report
 from classification.explore_model import export_confusion_matrix
 from classification.explore_model import export_learning_curve
+from classification.explore_model import export_model_diagnostics
 
-def find_best_estimator(X_train, y_train, results_dir):
+def find_best_estimator(X_train, y_train, results_dir, search='grid'):
     """Tests a list of pre-defined algorithms with the 
     training samples provided in order to find
     the one that best fits the given problem.
 
     Args:
-        X_train (Dataframe): Training features
+        X_train (Sparse matrix or FoldFeatures): Training
+        features (See nested_cross_validation in
+        model_selection/cross_validation.py)
         y_train (Series): Training labels
         results_dir (String): Folder were the
         performance results are supposed to be
         stored.
+        search (String, optional): 'grid' to evaluate all
+        hyperparameters or 'racing' to eliminate the worst
+        ones after a few folds.
     """
 
     # Algorithms implemented:
@@ -60,10 +86,12 @@ def find_best_estimator(X_train, y_train, results_dir):
     # Oversampling:
     # True to apply SMOTE
     # False to not apply SMOTE
+    # 'class_weight', 'random' or 'sparse_smote' for faster alternatives
+    # (See classification/oversampling.py and benchmarks/imbalance_strategies.py)
     oversample = [True, False]
 
     evaluate_estimators_performance(classifiers, strategies, oversample,
-                                    X_train, y_train, results_dir)
+                                    X_train, y_train, results_dir, search)
 
 def evaluate_final_estimator_on_unseen_data(X_train, y_train, X_test, y_test, results_dir):
     """After identifying the algorithm that provides the best
@@ -99,7 +127,43 @@ def evaluate_final_estimator_on_unseen_data(X_train, y_train, X_test, y_test, re
     export_confusion_matrix(model, X_test, y_test)
     export_learning_curve(**training_args)
 
-def evaluate_usefulness_of_features(X_train, y_train, selected_feature_names, results_dir):
+def export_final_estimator_diagnostics(X_train, y_train, X_test, y_test, results_dir, prefix, workers=-1):
+    """Same evaluation as evaluate_final_estimator_on_unseen_data, but the
+    classification report, confusion matrix and learning curve are saved in
+    results/classification_analysis instead of being displayed. The estimator
+    is trained only once and the learning curve is computed in parallel.
+
+    Args:
+        X_train (Dataframe): Training features
+        y_train (Series): Training labels
+        X_test (Dataframe): Test features
+        y_test (Series): Test labels
+        results_dir (String): Folder where results
+        should be saved.
+        prefix (String): Prefix of the files (e.g. 'final_model_all_features')
+        workers (Integer, optional): Number of processes
+        used by the learning curve (-1 for all CPU cores).
+    Returns:
+        The models fitted in the 10 folds of the learning
+        curve (See evaluate_usefulness_of_features).
+    """
+
+    # Based on the current tests, LinearSVC with the following arguments
+    # is the estimator that provides the best performance for the training instances.
+    selected_classifier = LinearSVC(tol=0.001, C=1, max_iter=500)
+
+    _, fold_estimators = export_model_diagnostics(selected_classifier, 'one_vs_rest', False, X_train, y_train,
+                                                  X_test, y_test, os.path.join(results_dir, 'classification_analysis'),
+                                                  prefix, workers)
+
+    return fold_estimators
+
+def evaluate_usefulness_of_features(X_train, y_train, selected_feature_names, results_dir, estimators=None):
+    """Saves the weights given by the final estimator to each feature in the
+    folds of a cross-validation (See features_cross_validation in train_model.py).
+    The fold models fitted by export_final_estimator_diagnostics (one-vs-rest
+    LinearSVC, same features) can be given in `estimators` to avoid training
+    them again."""
 
     # Based on the current tests, LinearSVC with the following arguments
     # is the estimator that provides the best performance for the training instances.
@@ -113,7 +177,33 @@ def evaluate_usefulness_of_features(X_train, y_train, selected_feature_names, re
         'y_train': y_train
     }
 
-    features_cross_validation(**training_args, feature_names=selected_feature_names, results_dir=results_dir)
+    features_cross_validation(**training_args, feature_names=selected_feature_names, results_dir=results_dir,
+                              estimators=estimators)
+
+def find_best_percentile(X_train, y_train, scores, results_dir):
+    """Evaluates the selected estimator with different numbers of features
+    (chi-square ranking), in order to find a smaller and faster model with
+    a similar performance. The scores are computed once (See 
+    import_data_for_feature_selection), so each percentile is only a new
+    threshold over them.
+
+    Args:
+        X_train (Sparse matrix): Training features, before feature selection
+        y_train (Series): Training labels
+        scores (Array): chi-square scores of the training features
+        results_dir (String): Folder where results
+        should be saved.
+    """
+
+    # Based on the current tests, LinearSVC with the following arguments
+    # is the estimator that provides the best performance for the training instances.
+    selected_classifier = OneVsRestClassifier(LinearSVC(tol=0.001, C=1, max_iter=500))
+
+    percentiles = [1, 2, 5, 10, 15, 20, 30, 50, 75, 100]
+    top_k = [100, 250, 500, 1000, 2500]
+
+    results = sweep_feature_selection(selected_classifier, X_train, y_train, scores, percentiles, top_k)
+    results.to_csv(os.path.join(results_dir, 'feature_selection_sweep.csv'), index=False)
 
 def train_final_estimator(X_train, y_train, X_test, y_test):
     """After identifying the algorithm that provides the best
@@ -146,8 +236,103 @@ def train_final_estimator(X_train, y_train, X_test, y_test):
     # Dumps the model to a file for future predictions.
     pickle.dump(model, open('final_estimator.sav', 'wb'))
 
-def predict_survey_spreadsheets(spreadsheets_dir, predict_spreadsheets_dir, results_dir, n_samples):
-    """Using the final version of the best estimator (See train_final_estimator), 
+def train_final_pipeline(train_filepath, test_filepath, patterns_filepath, pipeline_filepath=PIPELINE_FILEPATH):
+    """Trains the final estimator together with all the featurization steps
+    (text preprocessing, TF-IDF, heuristics and feature selection) as a single
+    pipeline, using all train and test instances, and dumps it for prediction.
+
+    Unlike train_final_estimator, the dumped pipeline receives raw paragraphs,
+    so the web application (and any other script) can load it as a single
+    file and classify paragraphs in the same way they were featurized in
+    training (See paragraph_pipeline.py).
+
+    Args:
+        train_filepath (String): Filepath of the train set (CSV)
+        test_filepath (String): Filepath of the test set (CSV)
+        patterns_filepath (String): Filepath of the rules used as heuristic features
+        pipeline_filepath (String, optional): Filepath where the pipeline is dumped.
+            Defaults to the file loaded by the web application.
+    """
+    selected_classifier = LinearSVC(tol=0.001, C=1.5, max_iter=500)
+
+    # Merges training and test samples/labels
+    data = pandas.concat([pandas.read_csv(train_filepath), pandas.read_csv(test_filepath)], ignore_index=True)
+    data = data.dropna(subset=['Paragraph'])
+
+    pipeline = build_pipeline(OneVsRestClassifier(selected_classifier), load_patterns(patterns_filepath))
+    pipeline.fit(data['Paragraph'], data['Label'])
+
+    # Dumps the pipeline to a file for future predictions.
+    save_pipeline(pipeline, pipeline_filepath, metadata={'n_paragraphs': len(data)})
+
+def evaluate_incremental_training(train_filepath, test_filepath, patterns_filepath, results_dir, chunk_size=1000):
+    """Compares the incremental classifier (hashed features and a linear model
+    trained one chunk at a time, see classification/train_incremental.py) with
+    the final estimator (LinearSVC trained with all paragraphs in memory) on
+    unseen data, reporting their performance and throughput. The incremental
+    model is dumped, so new annotated spreadsheets can be learned later
+    (See update_incremental_classifier).
+
+    Args:
+        train_filepath (String): Filepath of the train set (CSV)
+        test_filepath (String): Filepath of the test set (CSV)
+        patterns_filepath (String): Filepath of the rules used as heuristic features
+        results_dir (String): Folder where results
+        should be saved.
+        chunk_size (Integer, optional): Number of paragraphs learned at a time
+    """
+    classes = ['No categories identified.',
+               'CF – Contribution flow',
+               'CT – Choose a task',
+               'TC – Talk to the community',
+               'BW – Build local workspace',
+               'DC – Deal with the code',
+               'SC – Submit the changes']
+    patterns = load_patterns(patterns_filepath)
+
+    test_data = pandas.read_csv(test_filepath).dropna(subset=['Paragraph'])
+    X_test, y_test = test_data['Paragraph'].tolist(), test_data['Label']
+    results = []
+
+    def evaluate(name, model, training):
+        started_at = time.perf_counter()
+        y_pred = model.predict(X_test)
+        seconds = time.perf_counter() - started_at
+
+        results.append({
+            'model': name,
+            'accuracy': accuracy_score(y_test, y_pred),
+            'f1_weighted': f1_score(y_test, y_pred, average='weighted'),
+            'training_paragraphs': training['n_paragraphs'],
+            'training_seconds': training['seconds'],
+            'training_paragraphs_per_second': training['paragraphs_per_second'],
+            'prediction_paragraphs_per_second': round(len(X_test) / seconds, 1) if seconds > 0 else 0.0
+        })
+        print(results[-1])
+
+    # Baseline: the whole train set and the TF-IDF vocabulary in memory
+    train_data = pandas.read_csv(train_filepath).dropna(subset=['Paragraph'])
+    baseline = build_pipeline(OneVsRestClassifier(LinearSVC(tol=0.001, C=1, max_iter=500)), patterns)
+
+    started_at = time.perf_counter()
+    baseline.fit(train_data['Paragraph'], train_data['Label'])
+    seconds = time.perf_counter() - started_at
+
+    evaluate('LinearSVC (TF-IDF)', baseline, {'n_paragraphs': len(train_data), 'seconds': round(seconds, 3),
+                                              'paragraphs_per_second': round(len(train_data) / seconds, 1)})
+    del train_data, baseline
+
+    # Incremental: the train set is streamed in chunks
+    chunks = iter_annotated_chunks([train_filepath], 'Paragraph', 'Label', chunk_size)
+    model, training = train_incremental_classifier(IncrementalClassifier(classes, patterns), chunks, 'Paragraph', 'Label')
+
+    evaluate('SGDClassifier (hashing, incremental)', model, training)
+
+    pickle.dump(model, open('incremental_model.sav', 'wb'))
+    pandas.DataFrame(results).to_csv(os.path.join(results_dir, 'incremental_training_comparison.csv'), index=False)
+
+def predict_survey_spreadsheets(spreadsheets_dir, predict_spreadsheets_dir, results_dir, n_samples, chunk_size=PREDICTION_CHUNK_SIZE):
+    """Using the final version of the best estimator (See train_final_pipeline), 
     this method is used to predict the classes of new data samples.
 
     This method is used in our survey where participants evaluate
@@ -163,62 +348,34 @@ def predict_survey_spreadsheets(spreadsheets_dir, predict_spreadsheets_dir, resu
         results_dir (String): Folder where the predictions will
         be saved.
         n_samples (Integer): Number of spreadsheets to be predicted.
+        chunk_size (Integer, optional): Number of paragraphs predicted at a time.
     """
 
-    # Finds a spreadsheet in the spreadsheet folder that is not
-    # being used, and copies it to a new folder of spreadsheets
-    # to be predicted. The outer loop stops when a number of
-    # n_samples is satisfied.
-
-    for i in range(0, n_samples):
-        while True:
-            filename = random.choice(os.listdir(spreadsheets_dir))
-            filepath = os.path.join(spreadsheets_dir, filename)
-            copy_filepath = os.path.join(predict_spreadsheets_dir, filename)
-
-            if os.path.isfile(filepath) and not os.path.exists(copy_filepath):
-                shutil.copyfile(filepath, copy_filepath)
-                break
-
-    # We use the same method using during the training process of an estimator
-    # to parse the data from the spreadsheets to be predicted.
-    X_train, _, X_test, _, train_text_column, test_text_column = import_data_for_prediction(predict_spreadsheets_dir, data_dir)
-
-    # Merge training and test samples. Notice that this data
-    # will not be used for training but only for prediction.
-    # We just need to merge "training and test samples" because
-    # we use the method import_data_for_prediction to parse the
-    # data, which is also used in training.
-    X_predict = vstack((X_train, X_test))
-    text_column = pandas.concat([train_text_column, test_text_column], ignore_index = True)
-
-    # Loads the final estimator (See predict_using_final_estimator).
-    model = pickle.load(open('final_estimator.sav', 'rb'))
-
-    # Using the final estimator, predicts the classes for the unknown
-    # spreadsheets.
-    y_predict = model.predict(X_predict)
-
-    # Saves predictions in a CSV file.
-    with open(os.path.join(results_dir, 'predictions.csv'), 'w') as predictions_file:
-        classes = ['No categories identified.',
-                    'CF - Contribution flow',
-                    'CT - Choose a task',
-                    'TC - Talk to the community',
-                    'BW - Build local workspace',
-                    'DC - Deal with the code',
-                    'SC - Submit the changes']
-
-        for predicted_class in classes:
-            predictions_file.write('Paragraph, Predicted Class\n')
-
-            instances = [i for i, item in enumerate(y_predict) if item.startswith(predicted_class[:2])]
-
-            for i in range(0, len(instances)):
-                if len(text_column[instances[i]]) > 100:
-                    predictions_file.write("\"%s\", %s\n" % (text_column[instances[i]], y_predict[instances[i]]))
-
-            predictions_file.write('\n')
+    # Chooses spreadsheets in the spreadsheet folder that are not
+    # being used, and copies them to a new folder of spreadsheets
+    # to be predicted.
+    unused_filenames = [filename for filename in sorted(os.listdir(spreadsheets_dir))
+                        if os.path.isfile(os.path.join(spreadsheets_dir, filename))
+                        and not os.path.exists(os.path.join(predict_spreadsheets_dir, filename))]
+
+    if len(unused_filenames) < n_samples:
+        print('Only {} spreadsheets are not being used.'.format(len(unused_filenames)))
+
+    for filename in random.sample(unused_filenames, min(n_samples, len(unused_filenames))):
+        shutil.copyfile(os.path.join(spreadsheets_dir, filename), os.path.join(predict_spreadsheets_dir, filename))
+
+    # Loads the final pipeline (See train_final_pipeline), which
+    # receives raw paragraphs, so the spreadsheets are not split
+    # into training and test sets as in training.
+    model = load_pipeline(PIPELINE_FILEPATH)
+
+    # Predicts the paragraphs of all spreadsheets in chunks and saves them
+    # grouped by predicted class. As in the survey, only paragraphs with
+    # more than 100 characters are predicted.
+    stats = predict_directory(model, predict_spreadsheets_dir, os.path.join(results_dir, 'predictions.parquet'),
+                              chunk_size, min_length=101)
+
+    print('{paragraphs} paragraphs of {files} files predicted in {seconds} s.'.format(**stats))
 
 if __name__ == '__main__':
     # Folders used during the whole process:
@@ -242,9 +399,17 @@ if __name__ == '__main__':
     ###########
     # Stage 1 #
     ###########
+    # Reports the peak and retained memory of each stage of the data preparation
+    # (saved as results/memory_*.json), e.g. to choose a machine for retraining
+    # import_data_for_classification(training_spreadsheets_dir, data_dir, features='all', memory_report_dir=results_dir)
+
     # Estimates the performance of different classification algorithms on training data
     # X_train, y_train, X_test, y_test, _, _ = import_data_for_classification(training_spreadsheets_dir, data_dir, features='all')
     # find_best_estimator(X_train, y_train, results_dir)
+    # Or without data leakage: the TF-IDF vocabulary and the feature selection of each
+    # fold are learned only from its training instances (and reused by all estimators)
+    # fold_features, y_train = import_data_for_fold_features(training_spreadsheets_dir, data_dir)
+    # find_best_estimator(fold_features, y_train, results_dir)
 
     ###########
     # Stage 2 #
@@ -261,14 +426,35 @@ if __name__ == '__main__':
     # X_train, y_train, X_test, y_test, _, _, _ = import_data_for_classification(training_spreadsheets_dir, data_dir, features='heuristic')
     # evaluate_final_estimator_on_unseen_data(X_train, y_train, X_test, y_test, results_dir)
 
-    # Evaluate usefulness of characteristics
-    X_train, y_train, _, _, _, _, selected_feature_names = import_data_for_classification(training_spreadsheets_dir, data_dir, features='all')
-    evaluate_usefulness_of_features(X_train, y_train, selected_feature_names, results_dir)
+    # Or save the diagnostics as files, without a display (for each set of features)
+    # for features in ['all', 'statistic', 'heuristic']:
+    #     X_train, y_train, X_test, y_test, _, _, _ = import_data_for_classification(training_spreadsheets_dir, data_dir, features=features)
+    #     export_final_estimator_diagnostics(X_train, y_train, X_test, y_test, results_dir, 'final_model_{}_features'.format(features))
+
+    # Evaluate F1 against the number of features selected
+    # X_train, y_train, _, scores = import_data_for_feature_selection(training_spreadsheets_dir, data_dir, features='all')
+    # find_best_percentile(X_train, y_train, scores, results_dir)
+
+    # Evaluate usefulness of characteristics, reusing the fold models of the diagnostics
+    X_train, y_train, X_test, y_test, _, _, selected_feature_names = import_data_for_classification(training_spreadsheets_dir, data_dir, features='all')
+    fold_estimators = export_final_estimator_diagnostics(X_train, y_train, X_test, y_test, results_dir, 'final_model_all_features')
+    evaluate_usefulness_of_features(X_train, y_train, selected_feature_names, results_dir, fold_estimators)
  
     ###########
     # Stage 3 #
     ###########
     # Train the final classification with all data and dump the model
     # train_final_estimator(X_train, y_train, X_test, y_test)
+    # Or dump the model together with its featurization steps as a single pipeline
+    # train_final_pipeline(os.path.join(data_dir, 'train.csv'), os.path.join(data_dir, 'test.csv'),
+    #                      os.path.join(classifier_dir, 'data_preparation', 'patterns.jsonl'))
+    # Or train a linear model incrementally (out-of-core) and compare it with the final estimator
+    # evaluate_incremental_training(os.path.join(data_dir, 'train.csv'), os.path.join(data_dir, 'test.csv'),
+    #                               os.path.join(classifier_dir, 'data_preparation', 'patterns.jsonl'), results_dir)
     # Predict samples using the final model for the survey evaluation
-    # predict_survey_spreadsheets(spreadsheets_dir, survey_spreadsheets_dir, results_dir, 75)
\ No newline at end of file
+    # predict_survey_spreadsheets(spreadsheets_dir, survey_spreadsheets_dir, results_dir, 75)
+    # Extract the paragraphs of the raw documentation files (.docx) without GitHub or the spreadsheets
+    # export_documentation_paragraphs(os.path.join(data_dir, 'documentation', 'raw'), os.path.join(data_dir, 'raw_paragraphs.parquet'))
+    # Or classify all raw documentation files offline with the final pipeline
+    # predict_directory(load_pipeline(PIPELINE_FILEPATH), os.path.join(data_dir, 'documentation', 'raw'),
+    #                   os.path.join(results_dir, 'raw_predictions.parquet'))
\ No newline at end of file
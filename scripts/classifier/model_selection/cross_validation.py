@@ -0,0 +1,510 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = 'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import os
+import json
+import time
+import hashlib
+import pickle
+import tempfile
+import numpy
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from scipy.sparse import csr_matrix
+from imblearn.pipeline import Pipeline
+from sklearn.metrics import accuracy_score, f1_score
+from sklearn.model_selection import StratifiedKFold, ParameterGrid
+from sklearn.multiclass import OneVsRestClassifier, OneVsOneClassifier
+from data_preparation.fold_features import FoldFeatures
+from classification.oversampling import create_sampler, create_classifier
+
+# Features, labels and folds loaded by each process of the pool (See load_shared_data)
+_shared_data = {}
+
+# Racing search (See plan_search_rounds): number of inner folds evaluated in
+# the first round, growth of this number in each round, and fraction of the
+# configurations eliminated after each round.
+RACING_MIN_FOLDS = 3
+RACING_FOLDS_GROWTH = 2
+RACING_ELIMINATION_FACTOR = 3
+
+# Number of folds whose features are kept in the memory of each process
+# when the features are generated per fold (See FoldFeatures).
+FOLDS_IN_MEMORY = 4
+
+def create_pipeline(classifier, strategy, oversample, params=None):
+    """Creates the pipeline evaluated in the cross-validation.
+
+    Args:
+        classifier (Class): An instance of a scikit-learn classifier.
+        strategy (String): Multiclass strategy ('one_vs_rest' or 'one_vs_one').
+        oversample (Boolean or String): Defines if and how the classes are balanced
+            (See OVERSAMPLING_STRATEGIES in classification/oversampling.py).
+        params (Dictionary, optional): Hyperparameters of the pipeline
+            (e.g. {'clf__estimator__C': 1}).
+    Returns:
+        Pipeline: An imblearn pipeline, not fitted.
+    """
+    pipeline_args = []
+    sampler = create_sampler(oversample)
+    classifier = create_classifier(classifier, oversample)
+
+    if sampler is not None:
+        pipeline_args.append(('smt', sampler))
+
+    if strategy == 'one_vs_rest':
+        pipeline_args.append(('clf', OneVsRestClassifier(classifier)))
+    elif strategy == 'one_vs_one':
+        pipeline_args.append(('clf', OneVsOneClassifier(classifier)))
+
+    pipeline = Pipeline(pipeline_args)
+
+    if params:
+        pipeline.set_params(**params)
+
+    return pipeline
+
+def count_repetitions(strategy):
+    # We perform the external cross-validation 10 times to evaluate
+    # difference of the average scores of each model in OneVsRest
+    # strategy. The result will be always the same for OneVsOne.
+    # See thread: https://stats.stackexchange.com/questions/91091/one-vs-all-and-one-vs-one-in-svm
+    return 10 if strategy == 'one_vs_rest' else 1
+
+def create_folds(y, repetitions, n_splits=10):
+    """Creates the folds of a nested cross-validation.
+
+    The 'tuning' fold contains all instances and is used to find the
+    hyperparameters reported for an estimator. The outer folds ('r<repetition>o<fold>')
+    are used for model selection, and each fold (including 'tuning') is divided
+    into inner folds ('<fold>i<inner fold>') for hyperparameter optimization.
+    Each repetition of the outer cross-validation shuffles the instances with
+    its own seed (the repetition number), so repetitions have different folds
+    and the same folds are created in every execution.
+
+    Args:
+        y (Array): Labels
+        repetitions (Integer): Number of repetitions of the outer cross-validation
+        n_splits (Integer, optional): Number of folds of each cross-validation
+    Returns:
+        Dictionary, Dictionary: Train and test indices of each fold, and
+            the identifiers of the outer folds of each repetition
+    """
+    folds = {'tuning': (numpy.arange(len(y)), numpy.array([], dtype=int))}
+    outer_folds = {}
+
+    for repetition in range(repetitions):
+        outer_cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=repetition)
+        outer_folds[repetition] = []
+
+        for index, (train_index, test_index) in enumerate(outer_cv.split(numpy.zeros(len(y)), y)):
+            fold = 'r{}o{}'.format(repetition, index)
+            folds[fold] = (train_index, test_index)
+            outer_folds[repetition].append(fold)
+
+    for fold, (train_index, _) in list(folds.items()):
+        inner_cv = StratifiedKFold(n_splits=n_splits)
+
+        for index, (inner_train, inner_test) in enumerate(inner_cv.split(train_index, y[train_index])):
+            folds['{}i{}'.format(fold, index)] = (train_index[inner_train], train_index[inner_test])
+
+    return folds, outer_folds
+
+def hash_fold(train_index, test_index):
+    """Computes a hash of the instances of a fold, so a configuration is
+    never fitted twice in folds with the same instances."""
+    sha1 = hashlib.sha1()
+    sha1.update(numpy.sort(train_index).astype(numpy.int64).tobytes())
+    sha1.update(b'|')
+    sha1.update(numpy.sort(test_index).astype(numpy.int64).tobytes())
+
+    return sha1.hexdigest()
+
+def share_data(X, y, directory):
+    """Saves features and labels as arrays that the processes of the pool map
+    in memory (read-only), so they are not copied to each process.
+
+    Args:
+        X (Sparse matrix or FoldFeatures): Features. FoldFeatures are saved
+            as they are, and each process generates the features of the folds.
+        y (Array): Labels
+        directory (String): Folder where the arrays are saved
+    """
+    numpy.save(os.path.join(directory, 'y.npy'), numpy.asarray(y).astype(str))
+
+    if isinstance(X, FoldFeatures):
+        with open(os.path.join(directory, 'features.pkl'), 'wb') as features_file:
+            pickle.dump(X, features_file)
+        return
+
+    X = csr_matrix(X)
+
+    for name, array in [('data', X.data), ('indices', X.indices), ('indptr', X.indptr),
+                        ('shape', numpy.array(X.shape))]:
+        numpy.save(os.path.join(directory, name + '.npy'), array)
+
+def load_shared_data(directory, folds, fold_hashes):
+    """Initializes a process of the pool with the data saved by share_data."""
+
+    def load(name):
+        return numpy.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+
+    if os.path.exists(os.path.join(directory, 'features.pkl')):
+        with open(os.path.join(directory, 'features.pkl'), 'rb') as features_file:
+            _shared_data['X'] = pickle.load(features_file)
+    else:
+        _shared_data['X'] = csr_matrix((load('data'), load('indices'), load('indptr')), shape=tuple(load('shape')))
+
+    _shared_data['y'] = load('y')
+    _shared_data['folds'] = folds
+    _shared_data['fold_hashes'] = fold_hashes
+
+def prepare_fold(fold):
+    """Generates the features of a fold (See FoldFeatures)."""
+    train_index, test_index = _shared_data['folds'][fold]
+    _shared_data['X'].prepare(_shared_data['fold_hashes'][fold], train_index, test_index, _shared_data['y'])
+
+@lru_cache(maxsize=FOLDS_IN_MEMORY)
+def load_fold_features(fold):
+    return _shared_data['X'].load(_shared_data['fold_hashes'][fold])
+
+def fit_and_score(pipeline, fold):
+    """Fits a pipeline on the train instances of a fold and scores it on the test instances.
+
+    Returns:
+        Dictionary: Accuracy, F1 weighted and seconds spent
+    """
+    X, y = _shared_data['X'], _shared_data['y']
+    train_index, test_index = _shared_data['folds'][fold]
+
+    if isinstance(X, FoldFeatures):
+        X_fold_train, X_fold_test = load_fold_features(fold)
+    else:
+        X_fold_train, X_fold_test = X[train_index], X[test_index]
+
+    started_at = time.perf_counter()
+    pipeline.fit(X_fold_train, y[train_index])
+    y_pred = pipeline.predict(X_fold_test)
+
+    return {
+        'accuracy': accuracy_score(y[test_index], y_pred),
+        'f1_weighted': f1_score(y[test_index], y_pred, average='weighted'),
+        'seconds': time.perf_counter() - started_at
+    }
+
+def fingerprint_data(X, y):
+    """Computes a hash of features and labels, so results cached for other data are never reused."""
+    sha1 = hashlib.sha1()
+
+    if isinstance(X, FoldFeatures):
+        sha1.update(X.fingerprint.encode('utf-8'))
+    else:
+        X = csr_matrix(X)
+
+        for array in [X.data, X.indices, X.indptr, numpy.array(X.shape)]:
+            sha1.update(numpy.ascontiguousarray(array).tobytes())
+
+    sha1.update('\n'.join(str(label) for label in y).encode('utf-8'))
+
+    return sha1.hexdigest()
+
+class ResultsStore:
+    def __init__(self, filepath=None):
+        """Keeps the score of each fit of the cross-validation.
+
+        Each result is appended to a JSON Lines file as soon as it is
+        computed, so an interrupted execution continues from the last fit.
+
+        Args:
+            filepath (String, optional): File where the results are saved.
+                Defaults to None (results are kept only in memory).
+        """
+        self.filepath = filepath
+        self.results = {}
+
+        if filepath is not None and os.path.exists(filepath) and os.path.getsize(filepath) > 0:
+            with open(filepath, 'r', encoding='utf-8') as results_file:
+                for line in results_file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line of an interrupted execution
+                        continue
+
+                    self.results[entry['key']] = entry['result']
+
+            # The next results must not be appended to an incomplete line.
+            if not line.endswith('\n'):
+                with open(filepath, 'a', encoding='utf-8') as results_file:
+                    results_file.write('\n')
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key):
+        return self.results[key]
+
+    def add(self, key, result):
+        self.results[key] = result
+
+        if self.filepath is not None:
+            with open(self.filepath, 'a', encoding='utf-8') as results_file:
+                results_file.write(json.dumps({'key': key, 'result': result}) + '\n')
+
+def compute_key(*values):
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def run_fits(executor, fits, store, fold_features=None, fold_hashes=None):
+    """Runs in the pool the fits that are not in the store.
+
+    Args:
+        executor (ProcessPoolExecutor): Pool initialized with load_shared_data
+        fits (Dictionary): Pipeline and fold of each fit, indexed by key
+        store (ResultsStore): Results already computed
+        fold_features (FoldFeatures, optional): When the features are generated
+            per fold, the folds not prepared yet are prepared before the fits.
+        fold_hashes (Dictionary, optional): Hash of each fold (See hash_fold)
+    Returns:
+        Dictionary: Result of each fit, indexed by key
+    """
+    if fold_features is not None:
+        folds = set(fold for key, (_, fold) in fits.items() if key not in store)
+        folds = [fold for fold in sorted(folds) if not fold_features.is_prepared(fold_hashes[fold])]
+
+        if folds:
+            print('Generating the features of {} folds.'.format(len(folds)))
+
+            for future in as_completed([executor.submit(prepare_fold, fold) for fold in folds]):
+                future.result()
+
+    # Fits of the same fold are submitted together, so each process
+    # loads the features of a fold only a few times.
+    fits = dict(sorted(fits.items(), key=lambda fit: fit[1][1]))
+    pending = {executor.submit(fit_and_score, pipeline, fold): key
+               for key, (pipeline, fold) in fits.items() if key not in store}
+
+    print('Running {} fits ({} already computed).'.format(len(pending), len(fits) - len(pending)))
+
+    for completed, future in enumerate(as_completed(pending), start=1):
+        store.add(pending[future], future.result())
+
+        if completed % 100 == 0:
+            print('{} out of {} fits completed.'.format(completed, len(pending)))
+
+    return {key: store.get(key) for key in fits}
+
+def plan_search_rounds(search, n_splits):
+    """Returns how many inner folds have been evaluated at the end of each round of a search.
+
+    Args:
+        search (String): 'grid' evaluates every configuration in all inner folds.
+            'racing' evaluates every configuration in a few folds, and after each
+            round keeps only the best 1/RACING_ELIMINATION_FACTOR configurations,
+            which are evaluated in more folds (successive halving).
+        n_splits (Integer): Number of inner folds.
+    """
+    if search == 'grid':
+        return [n_splits]
+
+    if search == 'racing':
+        rounds = [min(RACING_MIN_FOLDS, n_splits)]
+
+        while rounds[-1] < n_splits:
+            rounds.append(min(n_splits, rounds[-1] * RACING_FOLDS_GROWTH))
+
+        return rounds
+
+    raise ValueError('The search {} does not exist.'.format(search))
+
+def nested_cross_validation(experiments, X_train, y_train, n_splits=10, search='grid', cache_filepath=None, workers=None):
+    """Computes a nested ten-fold cross-validation for a list of experiments at once.
+
+    Every fit of every experiment (hyperparameter configuration and fold) is
+    scheduled on a pool of processes, which share the features read-only.
+    The inner cross-validation selects the hyperparameters by accuracy, as
+    GridSearchCV does, and the outer cross-validation evaluates the selected
+    configuration with F1 weighted. Estimators with a single configuration
+    (e.g. dummy classifiers) have nothing to select, so they skip the inner
+    cross-validation.
+
+    Args:
+        experiments (List of dictionaries): Arguments of each experiment:
+            'classifier', 'hyperparameters' (grid), 'strategy' and 'oversample'.
+        X_train (Sparse matrix or FoldFeatures): Training features. With
+            FoldFeatures, the features of each fold are learned only from its
+            training instances, and shared by all experiments.
+        y_train (Series): Training labels
+        n_splits (Integer, optional): Number of folds of each cross-validation
+        search (String, optional): Hyperparameter search, 'grid' (exhaustive)
+            or 'racing' (See plan_search_rounds). Defaults to 'grid'.
+        cache_filepath (String, optional): File where the result of each fit is
+            saved (See ResultsStore). Defaults to None (no cache).
+        workers (Integer, optional): Number of processes. Defaults to one per CPU core.
+    Returns:
+        List of dictionaries: For each experiment, the best parameters found in
+            all training instances ('best_params'), the pipeline with these
+            parameters ('best_estimator'), the mean F1 weighted score of
+            each repetition of the outer cross-validation ('f1_weighted_scores_means')
+            and the cost of the hyperparameter search compared to an exhaustive
+            grid search ('search_report'). The report also lists each round of the
+            search ('rounds'): the inner folds evaluated so far, the races (tuning
+            and outer folds) still running, the configurations evaluated and the
+            configurations eliminated in these races.
+    """
+    y_train = numpy.asarray(y_train)
+    store = ResultsStore(cache_filepath)
+    fingerprint = fingerprint_data(X_train, y_train)
+
+    repetitions = max(count_repetitions(experiment['strategy']) for experiment in experiments)
+    folds, outer_folds = create_folds(y_train, repetitions, n_splits)
+    fold_hashes = {fold: hash_fold(*indices) for fold, indices in folds.items()}
+    fold_features = X_train if isinstance(X_train, FoldFeatures) else None
+
+    # Fits are identified by the instances of their folds, not by the
+    # fold names, so identical folds share the same fit.
+    def fit_key(name, params, fold):
+        return compute_key(fingerprint, name, params, fold_hashes[fold])
+
+    candidates = []
+    races = []
+
+    for index, experiment in enumerate(experiments):
+        name = repr(create_pipeline(experiment['classifier'], experiment['strategy'], experiment['oversample']))
+        grid = list(ParameterGrid(experiment['hyperparameters']))
+        evaluated_folds = ['tuning'] + [fold for repetition in range(count_repetitions(experiment['strategy']))
+                                        for fold in outer_folds[repetition]]
+        candidates.append((name, grid, evaluated_folds))
+
+        # A race selects the configuration of an experiment in one fold.
+        for fold in evaluated_folds:
+            races.append({'experiment': index, 'fold': fold, 'configurations': list(range(len(grid))),
+                          'selected': 0 if len(grid) == 1 else None})
+
+    inner_results = {}
+    inner_keys = [set() for _ in experiments]
+    search_rounds = [[] for _ in experiments]
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        share_data(X_train, y_train, shared_dir)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_shared_data,
+                                 initargs=(shared_dir, folds, fold_hashes)) as executor:
+            # (1) Hyperparameter optimization: the configurations are fitted in
+            # the inner folds of the tuning fold and of each outer fold. Rounds
+            # of all experiments run together in the pool.
+            print('Running hyperparameter optimization ({} search).'.format(search))
+            evaluated_splits = 0
+
+            for n_evaluated in plan_search_rounds(search, n_splits):
+                running = [race for race in races if race['selected'] is None]
+
+                if not running:
+                    break
+
+                inner_fits = {}
+
+                for race in running:
+                    experiment = experiments[race['experiment']]
+                    name, grid, _ = candidates[race['experiment']]
+
+                    for configuration in race['configurations']:
+                        pipeline = create_pipeline(experiment['classifier'], experiment['strategy'],
+                                                   experiment['oversample'], grid[configuration])
+
+                        for split in range(evaluated_splits, n_evaluated):
+                            inner_fold = '{}i{}'.format(race['fold'], split)
+                            key = fit_key(name, grid[configuration], inner_fold)
+                            inner_fits[key] = (pipeline, inner_fold)
+                            inner_keys[race['experiment']].add(key)
+
+                inner_results.update(run_fits(executor, inner_fits, store, fold_features, fold_hashes))
+                round_reports = {}
+
+                for race in running:
+                    name, grid, _ = candidates[race['experiment']]
+                    configurations = race['configurations']
+                    means = [numpy.mean([inner_results[fit_key(name, grid[configuration], '{}i{}'.format(race['fold'], split))]['accuracy']
+                                         for split in range(n_evaluated)]) for configuration in configurations]
+
+                    if n_evaluated == n_splits:
+                        # As in GridSearchCV, the first configuration with the best mean score is selected.
+                        race['selected'] = configurations[int(numpy.argmax(means))]
+                    else:
+                        ranking = sorted(range(len(configurations)), key=lambda position: -means[position])
+                        kept = max(1, int(numpy.ceil(len(configurations) / RACING_ELIMINATION_FACTOR)))
+                        race['configurations'] = sorted(configurations[position] for position in ranking[:kept])
+
+                        if len(race['configurations']) == 1:
+                            race['selected'] = race['configurations'][0]
+
+                    # The configurations not kept for the next round are eliminated
+                    # (in the last round, the best one is selected instead).
+                    report = round_reports.setdefault(race['experiment'], {'folds': n_evaluated, 'races': 0,
+                                                                           'configurations': 0, 'eliminated': 0})
+                    report['races'] = report['races'] + 1
+                    report['configurations'] = report['configurations'] + len(configurations)
+
+                    if n_evaluated != n_splits:
+                        report['eliminated'] = report['eliminated'] + len(configurations) - len(race['configurations'])
+
+                for experiment, report in round_reports.items():
+                    search_rounds[experiment].append(report)
+
+                evaluated_splits = n_evaluated
+
+            selected = [{} for _ in experiments]
+
+            for race in races:
+                _, grid, _ = candidates[race['experiment']]
+                selected[race['experiment']][race['fold']] = grid[race['selected']]
+
+            # (2) Model selection: the best configuration of each outer fold
+            # is fitted in the fold and evaluated on its test instances.
+            print('Running model selection cross-validation.')
+            outer_fits = {}
+
+            for experiment, (name, grid, evaluated_folds), best_params in zip(experiments, candidates, selected):
+                for fold in evaluated_folds[1:]:
+                    pipeline = create_pipeline(experiment['classifier'], experiment['strategy'],
+                                               experiment['oversample'], best_params[fold])
+                    outer_fits[fit_key(name, best_params[fold], fold)] = (pipeline, fold)
+
+            outer_results = run_fits(executor, outer_fits, store, fold_features, fold_hashes)
+
+    results = []
+
+    for experiment, (name, grid, evaluated_folds), best_params, keys, rounds in zip(experiments, candidates, selected,
+                                                                                  inner_keys, search_rounds):
+        f1_weighted_scores_means = []
+        outer_keys = []
+
+        for repetition in range(count_repetitions(experiment['strategy'])):
+            outer_keys.extend(fit_key(name, best_params[fold], fold) for fold in outer_folds[repetition])
+            scores = [outer_results[key]['f1_weighted'] for key in outer_keys[-n_splits:]]
+            f1_weighted_scores_means.append(numpy.mean(scores))
+
+        # The cost of the fits skipped is estimated with the
+        # mean time of the fits of the same experiment.
+        seconds = [inner_results[key]['seconds'] for key in keys] or \
+                  [outer_results[key]['seconds'] for key in outer_keys]
+        grid_fits = len(grid) * len(evaluated_folds) * n_splits
+
+        results.append({
+            'best_params': best_params['tuning'],
+            'best_estimator': create_pipeline(experiment['classifier'], experiment['strategy'],
+                                              experiment['oversample'], best_params['tuning']),
+            'f1_weighted_scores_means': f1_weighted_scores_means,
+            'search_report': {
+                'search': search,
+                'fits': len(keys),
+                'grid_fits': grid_fits,
+                'seconds': round(sum(inner_results[key]['seconds'] for key in keys), 2),
+                'grid_seconds': round(float(numpy.mean(seconds)) * grid_fits, 2) if seconds else 0.0,
+                'rounds': rounds
+            }
+        })
+
+    return results
@@ -7,18 +7,10 @@ __contact__ = 'fronchetti@usp.br'
 import os
 import numpy as np
 np.set_printoptions(threshold=np.inf)
-from imblearn.pipeline import Pipeline
 
 # Cross-validation
-from sklearn.model_selection import StratifiedKFold, cross_val_score
-from sklearn.model_selection import GridSearchCV
-
-# Oversampling techniques
-from imblearn.over_sampling import SMOTE
-
-# Training strategies
-from sklearn.multiclass import OneVsRestClassifier
-from sklearn.multiclass import OneVsOneClassifier
+from .cross_validation import nested_cross_validation
+from classification.oversampling import supports_oversampling
 
 # Classification Algorithms
 from sklearn.ensemble import RandomForestClassifier
@@ -28,8 +20,14 @@ from sklearn.naive_bayes import MultinomialNB
 from sklearn.linear_model import LogisticRegression
 from sklearn.dummy import DummyClassifier
 
+# Names of the hyperparameter searches in the results (See plan_search_rounds in cross_validation.py)
+SEARCH_NAMES = {
+    'grid': 'GridSearch',
+    'racing': 'Racing search, successive halving'
+}
+
 def evaluate_estimators_performance(classifiers, strategies, oversample, 
-                                    X_train, y_train, results_dir):
+                                    X_train, y_train, results_dir, search='grid', workers=None):
     """For a set of pre-defined estimators, evaluate
     their performance on training instances.
 
@@ -38,17 +36,24 @@ def evaluate_estimators_performance(classifiers, strategies, oversample,
         which performance should be estimated. 
         strategies (List of strings): The list of multiclass
         estrategies that should be used during estimation.
-        oversample (Boolean): The possibility (or not) of
-        using an oversampling technique on training data.
-        X_train (Dataframe): Training features
+        oversample (List): The oversampling strategies used on
+        training data (See OVERSAMPLING_STRATEGIES in
+        classification/oversampling.py).
+        X_train (Sparse matrix or FoldFeatures): Training features
         y_train (Series): Training labels
         results_dir (String): Folder where results
-        should be saved.
+        should be saved. The result of each fit is also saved
+        there, so an interrupted evaluation is resumed.
+        search (String, optional): Hyperparameter search, 'grid'
+        (exhaustive) or 'racing' (successive halving, faster).
+        workers (Integer, optional): Number of processes used.
+        Defaults to one per CPU core.
     """
 
-    # Dictionary of classification algorithms available
+    # Dictionary of classification algorithms available. The fits already
+    # run in parallel in the pool of processes, so each one uses a single core.
     classifiers_available = {
-        'rf': RandomForestClassifier(n_jobs=-1),
+        'rf': RandomForestClassifier(n_jobs=1),
         'svc': LinearSVC(),
         'mnb': MultinomialNB(),
         'knn': KNeighborsClassifier(),
@@ -93,110 +98,47 @@ def evaluate_estimators_performance(classifiers, strategies, oversample,
                             for strategy in strategies]
 
     # For all the selected resources, estimate the performance and
-    # export the results.
-    for classifier, hyperparameters in zip(selected_classifiers, selected_hyperparameters):
-        classifier_name = type(classifier).__name__
-        print("Evaluating estimator: " + classifier_name)
+    # export the results. The fits of all experiments are computed
+    # together (See nested_cross_validation).
+    experiments = []
 
+    for classifier, hyperparameters in zip(selected_classifiers, selected_hyperparameters):
         for strategy in selected_strategies:
-            print("Multiclass strategy: " + strategy)
-
             for oversample_condition in oversample:
-                oversample_bool = str(oversample_condition).lower()
-                print("Oversample: " + oversample_bool)
+                if not supports_oversampling(classifier, oversample_condition):
+                    print("Skipping {} with {}: class weights are not supported.".format(
+                          type(classifier).__name__, oversample_condition))
+                    continue
 
-                estimator_args = {
+                experiments.append({
                     'classifier': classifier,
                     'hyperparameters': hyperparameters,
                     'strategy': strategy,
-                    'oversample': oversample_condition,
-                    'X_train': X_train,
-                    'y_train': y_train
-                }
-
-                internal_evaluation, f1_weighted_scores_means = nested_cross_validation(**estimator_args)
+                    'oversample': oversample_condition
+                })
 
-                export_estimator_results(estimator_args, internal_evaluation, 
-                                         f1_weighted_scores_means, results_dir)
+    print("Evaluating {} estimators.".format(len(experiments)))
+    cache_filepath = os.path.join(results_dir, 'nested_cross_validation.jsonl')
+    results = nested_cross_validation(experiments, X_train, y_train, search=search,
+                                      cache_filepath=cache_filepath, workers=workers)
 
+    for estimator_args, result in zip(experiments, results):
+        export_estimator_results(estimator_args, result['best_params'], result['best_estimator'],
+                                 result['f1_weighted_scores_means'], results_dir, result['search_report'])
 
-def nested_cross_validation(classifier, hyperparameters, strategy, 
-                            oversample, X_train, y_train):
-    """Computes a multiclass nested ten-fold cross-validation.
-
-    To better evaluate how each algorithm performs in our data,
-    a nested stratified k-folding cross-validation approach was applied.
-
-    Args:
-        classifier (Class): An instance of a scikit-learn classifier.
-        hyperparameters (Dictionary): Hyperparameters to be used in GridSearch.
-        strategy (String): Defines which strategies will be used during training.
-        oversample (Boolean): Defines if smote oversampling should be applied.
-        X_train: Training features.
-        y_train: Training labels.
-
-    Returns:
-        F1 weighted scores from cross-validation.
-    """
-
-    # Selected resources are used
-    # in a scikit-learn pipeline
-    pipeline_args = []
-
-    # IF oversample is selected
-    if oversample:
-        oversample = ('smt', SMOTE())
-        pipeline_args.append(oversample)
-
-    # If one of the following multiclass
-    # strategies is elected.
-    if strategy == 'one_vs_rest':
-        strategy_arg = ('clf', OneVsRestClassifier(classifier))
-        pipeline_args.append(strategy_arg)
-    elif strategy == 'one_vs_one':
-        strategy_arg = ('clf', OneVsOneClassifier(classifier))
-        pipeline_args.append(strategy_arg)
-
-    pipeline = Pipeline(pipeline_args)
-
-    # The internal cross-validation is used for hyperparameter optimization.
-    print('Running hyperparameter optimization.')
-    internal_cv = StratifiedKFold(n_splits=10)
-    internal_evaluation = GridSearchCV(pipeline, hyperparameters, cv=internal_cv)
-    internal_evaluation.fit(X_train, y_train)
-
-    # The external cross-validation is used for model selection.
-    external_cv = StratifiedKFold(n_splits=10)
-    f1_weighted_scores_means = []
-
-    # We perform the external cross-validation `num` times to 
-    # evaluate difference of the average scores of each model
-    # in OneVsRest strategy. The result will be always the same
-    # for OneVsOne.
-    # See thread: https://stats.stackexchange.com/questions/91091/one-vs-all-and-one-vs-one-in-svm
-
-    num_times = 1
-
-    if strategy == 'one_vs_rest':
-        num_times = 10
-
-    for times in range(0, num_times):
-        print('Running model selection cross-validation (' + str(times + 1) + ' out of ' + str(num_times) + ')')
-        # Notice that the variable `internal_evaluation` represents 
-        # the classification model with the best hyperparameters.
-        f1_weighted_scores = cross_val_score(internal_evaluation, X_train, y_train, scoring='f1_weighted', cv=external_cv)
-        f1_weighted_scores_means.append(f1_weighted_scores.mean())
-
-    return internal_evaluation, f1_weighted_scores_means
-
-def export_estimator_results(estimator_args, internal_evaluation, f1_weighted_scores_means, results_dir):
+def export_estimator_results(estimator_args, best_params, best_estimator, f1_weighted_scores_means, results_dir,
+                             search_report=None):
     """Exports a estimators performance to a text file.
 
     Args:
         estimator_args (Dictionary): Arguments used to train the classifier (e.g. training strategy)
-        internal_evaluation (Class): GridSearch results
+        best_params (Dictionary): Best hyperparameters found in the internal cross-validation
+        best_estimator (Pipeline): Pipeline with the best hyperparameters
         f1_weighted_scores_means (List): F1 weighted scores (mean)
         results_dir (String): Folder whre results should be saved.
+        search_report (Dictionary, optional): Cost and rounds of the hyperparameter
+        search (See nested_cross_validation in cross_validation.py). Without it,
+        the search is reported as a grid search.
     """
 
     filename = type(estimator_args['classifier']).__name__ + '_strategy_' + \
@@ -209,7 +151,7 @@ def export_estimator_results(estimator_args, internal_evaluation, f1_weighted_sc
         num_attempts = 1
 
         while True:
-            new_filepath = filepath + ' (' + num_attempts + ')'
+            new_filepath = filepath + ' (' + str(num_attempts) + ')'
 
             if not os.path.exists(new_filepath):
                 filepath = new_filepath
@@ -223,12 +165,30 @@ def export_estimator_results(estimator_args, internal_evaluation, f1_weighted_sc
         results.write('Strategy: ' + estimator_args['strategy'] + '\n')
         results.write('Oversample: ' + str(estimator_args['oversample']) + '\n\n')
         # Hyperparameter optimization report
-        results.write('Internal Cross Validation (GridSearch)\n')
-        results.write('Best parameters: ' + str(internal_evaluation.best_params_) + '\n')
-        results.write('Best estimator: ' + str(internal_evaluation.best_estimator_) + '\n')
+        search = search_report['search'] if search_report is not None else 'grid'
+        results.write('Internal Cross Validation (' + SEARCH_NAMES[search] + ')\n')
+        results.write('Best parameters: ' + str(best_params) + '\n')
+        results.write('Best estimator: ' + str(best_estimator) + '\n')
+
+        if search_report is not None:
+            saved = 1 - search_report['fits'] / search_report['grid_fits']
+            results.write('Search: {search}, {fits} fits out of {grid_fits} in the exhaustive grid '
+                          '({seconds}s, estimated {grid_seconds}s for the grid)'.format(**search_report) +
+                          ', ' + str(round(100 * saved, 1)) + '% of the fits saved\n')
+
+            if search == 'racing':
+                for number, search_round in enumerate(search_report['rounds'], start=1):
+                    results.write('Round {}: {folds} inner folds, {configurations} configurations in {races} races, '
+                                  '{eliminated} eliminated\n'.format(number, **search_round))
+
         # Model selection report 
         results.write('External Cross Validation (cross_val_score)\n')
         results.write('F1 weighted scores (averages): \n')
 
         for mean in f1_weighted_scores_means:
             results.write(str(mean) + '\n')
+
+        # Each repetition uses different folds (See create_folds in cross_validation.py)
+        if len(f1_weighted_scores_means) > 1:
+            results.write('Mean of the repetitions: ' + str(np.mean(f1_weighted_scores_means)) +
+                          ' (standard deviation: ' + str(np.std(f1_weighted_scores_means)) + ')\n')
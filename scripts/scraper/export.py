@@ -6,9 +6,36 @@ __contact__ = 'fronchetti@usp.br'
 
 import re
 import os
-import csv
+import json
+import logging
+import sqlite3
 import xlsxwriter
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Categories of relevant information for new contributors, and the
+# colors of their columns in the spreadsheets for qualitative analysis.
+CATEGORIES_COLORS = [
+    ('CF – Contribution flow', '#ffd966'),
+    ('CT – Choose a task', '#b6d7a8'),
+    ('TC – Talk to the community', '#d9d2e9'),
+    ('BW – Build local workspace', '#ea9999'),
+    ('DC – Deal with the code', '#a2c4c9'),
+    ('SC – Submit the changes', '#f9cb9c')
+]
+
+# Columns of the database of repositories (see RepositoriesDatabase).
+REPOSITORIES_COLUMNS = [
+    ('id', 'INTEGER PRIMARY KEY'),
+    ('owner', 'TEXT'),
+    ('name', 'TEXT'),
+    ('url', 'TEXT'),
+    ('language', 'TEXT'),
+    ('description', 'TEXT'),
+    ('extracted_at', 'TEXT'),
+    ('is_valid', 'INTEGER'),
+    ('reasons_for_invalidation', 'TEXT')
+]
 
 def create_analysis_file(worksheet_name, raw_filepath, spreadsheet_filepath):
     """Exports documentation files as spreadsheet for qualitative analysis.
@@ -29,9 +56,77 @@ def create_analysis_file(worksheet_name, raw_filepath, spreadsheet_filepath):
         documentation files to be used in the spreadsheet.
         spreadsheet_filepath: A string representing the filepath where the 
         spreadsheet will be saved. 
+    Returns:
+        A list of strings representing the paragraphs written in the spreadsheet.
+    """
+
+    paragraphs = split_into_paragraphs(convert_to_plaintext(raw_filepath))
+    write_analysis_file(worksheet_name, paragraphs, spreadsheet_filepath)
+
+    return paragraphs
+
+def create_analysis_files(documents, corpus_filepath=None, workers=None):
+    """Exports many documentation files as spreadsheets for qualitative analysis.
+
+    Works as create_analysis_file, but the documentation files are converted in
+    a pool of processes. Optionally, the paragraphs of all the documentation
+    files are also saved in a single JSON Lines file, where each line contains
+    the repository, the position of the paragraph in the documentation file
+    (offset) and the paragraph itself. This file is easier to read by scripts
+    than the spreadsheets.
+
+    Args:
+        documents: A list of tuples (worksheet_name, raw_filepath, spreadsheet_filepath),
+            in accordance with the create_analysis_file arguments.
+        corpus_filepath: A string representing the filepath where the JSON Lines
+            file will be saved. If None, the file is not created.
+        workers: An integer representing the number of processes used. If None,
+            one process per CPU core is used.
+    Returns:
+        An integer representing the number of spreadsheets created.
+    """
+
+    n_spreadsheets = 0
+    corpus_file = open(corpus_filepath, 'w', encoding='utf-8') if corpus_filepath else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(create_analysis_file, *document): document for document in documents}
+
+            for future in as_completed(futures):
+                worksheet_name, raw_filepath, spreadsheet_filepath = futures[future]
+
+                try:
+                    paragraphs = future.result()
+                except Exception as exception:
+                    logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+                    logging.info('It was impossible to export {} in export.py'.format(raw_filepath))
+                    logging.exception(exception)
+                    continue
+
+                n_spreadsheets = n_spreadsheets + 1
+                print("Exported {} ({} paragraphs).".format(os.path.basename(spreadsheet_filepath), len(paragraphs)))
+
+                if corpus_file is not None:
+                    repository = os.path.splitext(os.path.basename(spreadsheet_filepath))[0]
+
+                    for offset, paragraph in enumerate(paragraphs):
+                        corpus_file.write(json.dumps({'repository': repository, 'offset': offset,
+                                                      'paragraph': paragraph}, ensure_ascii=False) + '\n')
+    finally:
+        if corpus_file is not None:
+            corpus_file.close()
+
+    return n_spreadsheets
+
+def convert_to_plaintext(raw_filepath):
+    """Converts a documentation file written in Markdown into plaintext using cmark-gfm.
+
+    Args:
+        raw_filepath: A string representing the filepath of the documentation file.
+    Returns:
+        A string containing the plaintext of the documentation file.
     """
- 
-    workbook = xlsxwriter.Workbook(spreadsheet_filepath)
 
     absolute_path = os.path.abspath(raw_filepath)
 
@@ -43,9 +138,24 @@ def create_analysis_file(worksheet_name, raw_filepath, spreadsheet_filepath):
     else:
         print('Please, update the filepath to the `cmark-gfm.exe` file inside the scripts/scraper/export.py file')
         print('If you do not have cmark-gfm installed, please visit their repository and install it: github.com/github/cmark-gfm')
-        raise ValueError('The cmark-gfm.exe variable was not defined in scripts/scraper/export.py (Line 38)')
+        raise ValueError('The cmark-gfm.exe variable was not defined in scripts/scraper/export.py (convert_to_plaintext)')
+
+    return plaintext.stdout.decode('utf-8')
+
+def write_analysis_file(worksheet_name, paragraphs, spreadsheet_filepath):
+    """Writes the paragraphs of a documentation file in a spreadsheet for qualitative analysis.
 
-    paragraphs = split_into_paragraphs(plaintext.stdout.decode('utf-8'))
+    The spreadsheet is written in the constant memory mode of xlsxwriter, where
+    each row is saved to disk as soon as the next one is written.
+
+    Args:
+        worksheet_name: A string representing the name of the worksheet.
+        paragraphs: A list of strings representing the paragraphs of the file.
+        spreadsheet_filepath: A string representing the filepath where the 
+        spreadsheet will be saved. 
+    """
+
+    workbook = xlsxwriter.Workbook(spreadsheet_filepath, {'constant_memory': True})
 
     # Creating the worksheet 
 
@@ -61,25 +171,15 @@ def create_analysis_file(worksheet_name, raw_filepath, spreadsheet_filepath):
     worksheet.set_column(0, 0, 60)
     worksheet.set_column(1, 7, 25)
 
-    # Set up colors and text properties for each column
+    # Set up colors and text properties for each column, and write the
+    # categories of relevant information for new contributors in the first
+    # line of the spreadsheet, from the second to the eight column.
 
     default_format = workbook.add_format({'text_wrap': True})
-    CF_format = workbook.add_format({'text_wrap': True, 'bg_color': '#ffd966'})
-    CT_format = workbook.add_format({'text_wrap': True, 'bg_color': '#b6d7a8'})
-    TC_format = workbook.add_format({'text_wrap': True, 'bg_color': '#d9d2e9'})
-    BW_format = workbook.add_format({'text_wrap': True, 'bg_color': '#ea9999'})
-    DC_format = workbook.add_format({'text_wrap': True, 'bg_color': '#a2c4c9'})
-    SC_format = workbook.add_format({'text_wrap': True, 'bg_color': '#f9cb9c'})
-
-    # Write the categories of relevant information for new contributors in
-    # the first line of the spreadsheet, from the second to the eight column.
-
-    worksheet.write(0, 1, 'CF – Contribution flow', CF_format)
-    worksheet.write(0, 2, 'CT – Choose a task', CT_format)
-    worksheet.write(0, 3, 'TC – Talk to the community', TC_format)
-    worksheet.write(0, 4, 'BW – Build local workspace', BW_format)
-    worksheet.write(0, 5, 'DC – Deal with the code', DC_format)
-    worksheet.write(0, 6, 'SC – Submit the changes', SC_format)
+
+    for column, (category, color) in enumerate(CATEGORIES_COLORS, start=1):
+        category_format = workbook.add_format({'text_wrap': True, 'bg_color': color})
+        worksheet.write(0, column, category, category_format)
 
     # Write paragraphs in the first column of the worksheet
 
@@ -155,25 +255,86 @@ def split_into_paragraphs(content):
 
     return text
 
-def export_to_repositories_file(information, filepath):
-    """Exports information about a repository to a spreadsheet file.
+class RepositoriesDatabase:
+    def __init__(self, filepath, batch_size=100):
+        """Stores information about the extracted repositories in a SQLite database.
+
+        Instead of opening a file for every repository, the information is kept in
+        memory and written in batches of `batch_size` repositories. Each batch is
+        written in a single transaction, so the database never contains half of a
+        batch. Repositories are indexed by their id: extracting a repository again
+        updates its information instead of duplicating it.
+
+        The database can be loaded in a single call with load_repositories or,
+        using pandas, with `pandas.read_sql('SELECT * FROM repositories', connection)`.
+
+        Args:
+            filepath: A string representing the path where the database will be saved.
+            batch_size: An integer representing the number of repositories kept in
+                memory before being written.
+        """
+
+        self.filepath = filepath
+        self.batch_size = batch_size
+        self.buffer = []
+
+        self.connection = sqlite3.connect(filepath)
+        columns = ', '.join(column + ' ' + column_type for column, column_type in REPOSITORIES_COLUMNS)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS repositories ({})'.format(columns))
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    def add(self, information):
+        """Adds information about a repository to the database.
+
+        Args:
+            information: A dictionary containing information about a repository.
+        """
+
+        print("Exporting {}/{} to `{}`.".format(information['owner'], information['name'], os.path.basename(self.filepath)))
+        self.buffer.append(tuple(information.get(column) for column, _ in REPOSITORIES_COLUMNS))
+
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the repositories kept in memory to the database."""
+
+        if not self.buffer:
+            return
+
+        columns = [column for column, _ in REPOSITORIES_COLUMNS]
+        updates = ', '.join('{0} = excluded.{0}'.format(column) for column in columns if column != 'id')
+        statement = 'INSERT INTO repositories ({}) VALUES ({}) ON CONFLICT(id) DO UPDATE SET {}'.format(
+            ', '.join(columns), ', '.join('?' for _ in columns), updates)
+
+        with self.connection:
+            self.connection.executemany(statement, self.buffer)
+
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+def load_repositories(filepath):
+    """Loads the information about the repositories stored by RepositoriesDatabase.
 
     Args:
-        repositories: A dictionary containing information about a repository.
-        filepath: A string representing the path where the spreadsheet file will be saved.
+        filepath: A string representing the path where the database is saved.
+    Returns:
+        A list of dictionaries, each one containing information about a repository.
     """
-    if os.path.isfile(filepath):
-        with open(filepath, 'a', errors='replace') as writer:
-            print("Exporting {}/{} to `repositories.csv`.".format(information['owner'], information['name']))
-            fieldnames = information.keys()
-            dict_writer = csv.DictWriter(writer, fieldnames)
-            dict_writer.writerow(information)
-            writer.close()
-    else:
-        with open(filepath, 'w', errors='replace') as writer:
-            print("Exporting {}/{} to `repositories.csv`.".format(information['owner'], information['name']))
-            fieldnames = information.keys()
-            dict_writer = csv.DictWriter(writer, fieldnames)
-            dict_writer.writeheader()
-            dict_writer.writerow(information)
-            writer.close()    
+
+    connection = sqlite3.connect(filepath)
+    connection.row_factory = sqlite3.Row
+
+    try:
+        return [dict(row) for row in connection.execute('SELECT * FROM repositories ORDER BY id')]
+    finally:
+        connection.close()
@@ -7,120 +7,254 @@ __contact__ = 'fronchetti@usp.br'
 import os
 import logging
 from datetime import datetime
-from scrap import scrap_documentation_file, scrap_repositories
-from export import create_analysis_file, export_to_repositories_file
-from validate import validate_documentation
-
-def scrap_validate_and_export(programming_languages, api_pages, output_dir):
-    """Performs the steps of scraping, validating and exporting data and documentation.
-
-    In our study, we analyze qualitatively the documentation files of popular open
-    source repositories hosted on GitHub, in order to identify what information
-    are relevant to new contributors. To achieve this objective, we first extract 
-    the documentation files of these projects from GitHub. We remove files that
-    are invalid (for example, files not written in English), and we export these
-    documentation files as spreadsheets for manual analysis. This method peforms,
-    in sequence, all the necessary steps of this first objective of our study.
+from functools import partial
+from scrap import scrap_documentation_file, scrap_documentation_content, iter_top_repositories
+from export import create_analysis_file, create_analysis_files, RepositoriesDatabase
+from validate import validate_documentation_metadata, validate_documentation_contents
+from pipeline import Pipeline, Stage
+
+# Number of workers used in each stage of the pipeline. Searching and
+# downloading mostly wait for GitHub API, so they use threads, while
+# validating and exporting use one process per CPU core.
+DEFAULT_WORKERS = {
+    'search': 4,
+    'fetch': 8,
+    'validate': os.cpu_count() or 1,
+    'export': os.cpu_count() or 1
+}
+
+# Maximum number of documentation files validated at a time by each
+# worker of the validate stage (see validate_documentation_files).
+VALIDATION_BATCH_SIZE = 16
+
+def fetch_documentation(repository):
+    """Pipeline stage that downloads the `CONTRIBUTING.md` file of a repository.
+
+    The description of the file is validated first (see validate_documentation_metadata
+    in validate.py), and the content is only downloaded if the description is valid.
 
     Args:
-        programming_languages: A list of strings representing programming languages
-            of which the most popular repositories will be extracted.
-        api_pages: A list of integers representing the pages to be extracted for
-            each programming language on GitHub API.
-        output_dir: A string representing the directory path where the data and
-            files about the extracted repositories will be saved.
+        repository: A dictionary representing a repository returned by GitHub API.
+    Returns:
+        A list with a single tuple (repository, contributing, is_valid,
+        reasons_for_invalidation), where the last two values are the result
+        of the validation of the description.
     """
 
-    repositories_filepath = os.path.join(output_dir, 'repositories.csv')
+    owner, name = repository['owner']['login'], repository['name']
+    contributing = scrap_documentation_file(owner, name, 'contributing', download_content=False)
 
-    # (1) Creates the output directory, if it does not exist.
-    if not os.path.isdir(output_dir):
-        os.makedirs(output_dir)
+    is_valid, reasons_for_invalidation = validate_documentation_metadata(contributing)
 
-    # (2) Creates a directory where the projects files for analysis will be saved, 
-    # if it does not exist.
+    if is_valid:
+        scrap_documentation_content(contributing)
 
-    analysis_dir = os.path.join(output_dir, 'documentation-spreadsheets')
+    return [(repository, contributing, is_valid, reasons_for_invalidation)]
 
-    if not os.path.isdir(analysis_dir):
-        os.makedirs(analysis_dir)
+def validate_documentation_files(batch):
+    """Pipeline stage that checks if a batch of documentation files attend the requirements.
 
-    # (3) Extract most popular repositories from GitHub API. 
+    The contents of the batch are validated in one call (see
+    validate_documentation_contents in validate.py).
+
+    Args:
+        batch: A list of tuples (repository, contributing, is_valid, reasons_for_invalidation),
+            in accordance with the fetch_documentation output.
+    Returns:
+        A list with a tuple (repository, contributing, is_valid,
+        reasons_for_invalidation) for each item of the batch.
+    """
 
-    repositories = scrap_repositories(programming_languages, api_pages)
+    # Files with an invalid description were not downloaded, and
+    # their reasons for invalidation are kept.
+    downloaded = [contributing for _, contributing, is_valid, _ in batch if is_valid]
+    verdicts = iter(validate_documentation_contents(downloaded))
+    validated = []
 
-    for index, repository in enumerate(repositories):
-        try:
-            # (4) For each repository collected, extract the `CONTRIBUTING.md`
-            # documentation file.
+    for repository, contributing, is_valid, reasons_for_invalidation in batch:
+        if is_valid:
+            is_valid, reasons_for_invalidation = next(verdicts)
 
-            owner, name = repository['owner']['login'], repository['name']
-            contributing = scrap_documentation_file(owner, name, 'contributing')
+        validated.append((repository, contributing, is_valid, reasons_for_invalidation))
+
+    return validated
+
+def export_documentation_file(validated, output_dir):
+    """Pipeline stage that exports a documentation file for qualitative analysis.
+
+    Args:
+        validated: A tuple (repository, contributing, is_valid, reasons_for_invalidation),
+            in accordance with the validate_documentation_files output.
+        output_dir: A string representing the directory path where the data and
+            files about the extracted repositories will be saved.
+    Returns:
+        A list with a single dictionary containing only the necessary information
+        about the repository, including the is_valid flag and the possible
+        reasons for invalidation.
+    """
 
-            # (5) Check if the documentation file is valid (attend the requirements).
+    repository, contributing, is_valid, reasons_for_invalidation = validated
+    owner, name = repository['owner']['login'], repository['name']
 
-            is_valid, reasons_for_invalidation = validate_documentation(contributing)
+    # If the documentation file is valid, create a Markdown file, and save it
+    # into a `raw` folder, inside the output directory.
 
-            # (6) If the documentation file is valid, create a Markdown file, and save it
-            # into a `raw` folder, inside the output directory.
+    raw_dir = os.path.join(output_dir, 'documentation-raw')
+    analysis_dir = os.path.join(output_dir, 'documentation-spreadsheets')
 
-            raw_dir = os.path.join(output_dir, 'documentation-raw')
+    if is_valid:
+        filename = owner + '@' + name + '.txt'
+        raw_filepath = os.path.join(raw_dir, filename)
+
+        with open(raw_filepath, 'w', errors='replace') as writer:
+            writer.write(contributing['content'])
+            writer.close()
+
+        # For each project containing a valid documentation file, create 
+        # a spreadsheet containing the paragraphs of this documentation file
+        # to be used in qualitative analysis, and export this spreadsheet
+        # to the `analysis` folder, inside the output directory.
+
+        spreadsheet_filepath = os.path.join(analysis_dir, owner + '@' + name + '.xlsx')
+        create_analysis_file('contributing', raw_filepath, spreadsheet_filepath)
+
+    repository_information = {
+        'id': repository['id'],
+        'owner': owner,
+        'name': name,
+        'url': repository['html_url'],
+        'language': repository['language'],
+        'description': repository['description'],
+        'extracted_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+        'is_valid': is_valid,
+        'reasons_for_invalidation': reasons_for_invalidation
+    }
+
+    return [repository_information]
+
+def scrap_validate_and_export(programming_languages, n_repositories, output_dir, workers=None, queue_size=64):
+    """Performs the steps of scraping, validating and exporting data and documentation.
 
-            if not os.path.isdir(raw_dir):
-                os.makedirs(raw_dir)
+    In our study, we analyze qualitatively the documentation files of popular open
+    source repositories hosted on GitHub, in order to identify what information
+    are relevant to new contributors. To achieve this objective, we first extract 
+    the documentation files of these projects from GitHub. We remove files that
+    are invalid (for example, files not written in English), and we export these
+    documentation files as spreadsheets for manual analysis. This method peforms
+    all the necessary steps of this first objective of our study.
+
+    The steps are executed as a pipeline (see pipeline.py): the search and
+    download steps wait for GitHub API in pools of threads, while the validation
+    and export steps use pools of processes. The repositories found are sent to
+    the pipeline as soon as their page arrives (see iter_top_repositories in
+    scrap.py), so the download starts in seconds. Every step works on a different
+    repository at the same time, and bounded queues between them keep the
+    memory usage stable. A report of throughput and queue depth per stage is
+    printed during and at the end of the execution to identify the bottleneck.
 
-            if is_valid:
-                filename = owner + '@' + name + '.txt'
-                raw_filepath = os.path.join(raw_dir, filename)
+    Args:
+        programming_languages: A list of strings representing programming languages
+            of which the most popular repositories will be extracted.
+        n_repositories: An integer representing the number of repositories to be
+            extracted for each programming language on GitHub API. Values above
+            the 1,000 results returned by a search are supported (see
+            iter_top_repositories in scrap.py).
+        output_dir: A string representing the directory path where the data and
+            files about the extracted repositories will be saved.
+        workers: A dictionary with the number of workers of each stage ('search',
+            'fetch', 'validate' and 'export'). Missing stages use DEFAULT_WORKERS.
+        queue_size: An integer representing the maximum number of items waiting
+            between two stages.
+    Returns:
+        A list of dictionaries containing the information exported for each
+        repository.
+    """
 
-                with open(raw_filepath, 'w', errors='replace') as writer:
-                    writer.write(contributing['content'])
-                    writer.close()
+    workers = dict(DEFAULT_WORKERS, **(workers or {}))
+    repositories_filepath = os.path.join(output_dir, 'repositories.db')
+
+    # (1) Creates the output directory and the directories where the raw
+    # documentation files and the spreadsheets for analysis will be saved,
+    # if they do not exist.
+
+    for directory in [output_dir,
+                      os.path.join(output_dir, 'documentation-raw'),
+                      os.path.join(output_dir, 'documentation-spreadsheets')]:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    # (2) Defines the stages of the pipeline, which receives the most popular
+    # repositories from GitHub API: extract their `CONTRIBUTING.md` documentation
+    # files, check if each documentation file is valid (attend the requirements)
+    # and export the valid files as Markdown files and spreadsheets for
+    # qualitative analysis.
+
+    stages = [
+        Stage('fetch', fetch_documentation, workers['fetch'], queue_size=queue_size),
+        Stage('validate', validate_documentation_files, workers['validate'], use_processes=True, queue_size=queue_size,
+              batch_size=VALIDATION_BATCH_SIZE),
+        Stage('export', partial(export_documentation_file, output_dir=output_dir), workers['export'], use_processes=True, queue_size=queue_size)
+    ]
+
+    # The search is not executed by the pipeline, but it records its requests
+    # and pending pages in a stage, so it is reported with the other stages.
+    search = Stage('search', iter_top_repositories, workers['search'], queue_size=0)
+    searches = iter_top_repositories(programming_languages, n_repositories, workers['search'], stage=search)
+    repositories = []
+
+    # (3) Export the repository information to the `repositories.db` database,
+    # inside the output folder. The database is written only by this process.
+
+    with RepositoriesDatabase(repositories_filepath) as database:
+        for repository_information in Pipeline(stages, source=search).run(searches):
+            try:
+                database.add(repository_information)
+                repositories.append(repository_information)
+            except Exception as exception:
+                # Attention:
+                # Sometimes when we scrap GitHub projects it is hard to
+                # predict what kind of weird data they will return.
+                # To prevent the scraping process from stopping, I use this
+                # generic try/catch in main.py. However, I highly recommend you,
+                # developer, to review the exceptions.log after every execution.
+
+                logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+                logging.info('Generic exception caught in main.py')
+                logging.exception(exception)
 
-                # (7) For each project containing a valid documentation file, create 
-                # a spreadsheet containing the paragraphs of this documentation file
-                # to be used in qualitative analysis, and export this spreadsheet
-                # to the `analysis` folder, inside the output directory.
+    return repositories
 
-                spreadsheet_filepath = os.path.join(analysis_dir, owner + '@' + name + '.xlsx')
-                create_analysis_file('contributing', raw_filepath, spreadsheet_filepath)
+def export_documentation_spreadsheets(output_dir, corpus=True, workers=None):
+    """Exports again all the documentation files already extracted as spreadsheets.
 
-            # (8) Update the dictionary of the collected repository only with the
-            # necessary information, including the is_valid flag and the possible
-            # reasons for invalidation.
+    The documentation files saved in the `documentation-raw` folder are converted,
+    in a pool of processes, into spreadsheets for qualitative analysis inside the
+    `documentation-spreadsheets` folder (see create_analysis_files in export.py).
 
-            repository_information = {
-                'id': repository['id'],
-                'owner': owner,
-                'name': name,
-                'url': repository['html_url'],
-                'language': repository['language'],
-                'description': repository['description'],
-                'extracted_at': datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
-                'is_valid': is_valid,
-                'reasons_for_invalidation': reasons_for_invalidation
-            }
+    Args:
+        output_dir: A string representing the directory path where the data and
+            files about the extracted repositories were saved.
+        corpus: A boolean defining if the paragraphs of all documentation files are
+            also saved in the `documentation-paragraphs.jsonl` file.
+        workers: An integer representing the number of processes used. If None,
+            one process per CPU core is used.
+    """
 
-            repositories[index] = repository_information
+    raw_dir = os.path.join(output_dir, 'documentation-raw')
+    analysis_dir = os.path.join(output_dir, 'documentation-spreadsheets')
+    corpus_filepath = os.path.join(output_dir, 'documentation-paragraphs.jsonl') if corpus else None
 
-            # (9) Export the repository information to the `repositories.csv` spreadsheet,
-            # inside the output folder.
+    if not os.path.isdir(analysis_dir):
+        os.makedirs(analysis_dir)
 
-            export_to_repositories_file(repository_information, repositories_filepath)
+    documents = []
 
-        except Exception as exception:
-            # Attention:
-            # Sometimes when we scrap GitHub projects it is hard to
-            # predict what kind of weird data they will return.
-            # To prevent the scraping process from stopping, I use this
-            # generic try/catch in main.py. However, I highly recommend you,
-            # developer, to review the exceptions.log after every execution.
- 
-            logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
-            logging.info('Generic exception caught in main.py')
-            logging.exception(exception)
+    for filename in sorted(os.listdir(raw_dir)):
+        if filename.endswith('.txt'):
+            spreadsheet_filepath = os.path.join(analysis_dir, os.path.splitext(filename)[0] + '.xlsx')
+            documents.append(('contributing', os.path.join(raw_dir, filename), spreadsheet_filepath))
 
-    return repositories
+    create_analysis_files(documents, corpus_filepath, workers)
 
 if __name__ == '__main__':
     root_dir = os.path.dirname(os.getcwd())
@@ -128,5 +262,5 @@ if __name__ == '__main__':
 
     # Reference to justify why we are using these programming languages: octoverse.github.com (or see misc/octoverse-top-languages.png)
     programming_languages = ['JavaScript', 'Python', 'Java', 'PHP', 'C#', 'C++', 'TypeScript', 'Shell', 'C', 'Ruby']
-    api_pages = [i for i in range(1, 35)]
-    scrap_validate_and_export(programming_languages, api_pages, data_dir)
+    n_repositories = 1020
+    scrap_validate_and_export(programming_languages, n_repositories, data_dir)
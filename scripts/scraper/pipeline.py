@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ =  'Felipe Fronchetti'
+__contact__ = 'fronchetti@usp.br'
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Marker put in a stage queue to tell one of its workers that
+# no more items will arrive.
+_STOP = object()
+
+class Stage:
+    def __init__(self, name, function, workers=1, use_processes=False, queue_size=64, batch_size=None):
+        """Defines a step of the crawling pipeline.
+
+        Args:
+            name: String used to identify the stage in the reports.
+            function: Callable that receives one item and returns a list with the
+                items to be forwarded to the next stage. Returning an empty list
+                drops the item. When use_processes is True, the callable must be
+                picklable (i.e. a module-level function or a functools.partial).
+            workers: Integer representing how many items the stage processes
+                at the same time.
+            use_processes: Boolean defining if the items are processed in a pool
+                of processes (CPU-bound stages) instead of threads (I/O-bound stages).
+            queue_size: Integer representing the maximum number of items waiting
+                in the stage queue. When the queue is full, the previous stage
+                waits until this stage consumes its items.
+            batch_size: Integer representing the maximum number of items given
+                to the function at a time. If None, the function receives one
+                item, otherwise it receives a list with the items waiting in the
+                queue (up to batch_size) and returns the items of all of them.
+        """
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.use_processes = use_processes
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.processed = 0 # Number of items received by the stage
+        self.produced = 0 # Number of items forwarded to the next stage
+        self.failed = 0 # Number of items that raised an exception
+        self.busy_seconds = 0.0 # Time spent by all workers processing items
+        self.started_at = None
+        self.finished_at = None
+        self.depth_samples = [] # Sizes of the stage queue over time
+        self.waiting = 0 # Items waiting outside the stage queue (e.g. pages of a search not requested yet)
+
+        self.lock = threading.Lock()
+
+    def track(self, function, *args):
+        """Calls a function as one item processed by the stage, for stages whose
+        workers are not managed by a Pipeline (see the source of a Pipeline)."""
+
+        started_at = time.time()
+
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = started_at
+
+        try:
+            return function(*args)
+        except Exception:
+            with self.lock:
+                self.failed = self.failed + 1
+            raise
+        finally:
+            with self.lock:
+                self.processed = self.processed + 1
+                self.busy_seconds = self.busy_seconds + (time.time() - started_at)
+
+    def depth(self):
+        """Returns the number of items waiting for the stage."""
+
+        return self.queue.qsize() + self.waiting
+
+    def throughput(self):
+        """Returns the number of items processed per second by the stage."""
+
+        if self.started_at is None:
+            return 0.0
+
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def utilization(self):
+        """Returns the fraction of time the stage workers were busy.
+
+        A stage close to 1.0 with a full queue in front of it is the bottleneck
+        of the pipeline.
+        """
+
+        if self.started_at is None:
+            return 0.0
+
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0
+
+    def report(self):
+        """Returns a dictionary summarizing the performance of the stage."""
+
+        depths = self.depth_samples or [0]
+
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'processed': self.processed,
+            'produced': self.produced,
+            'failed': self.failed,
+            'items_per_second': round(self.throughput(), 3),
+            'utilization': round(self.utilization(), 3),
+            'queue_depth_mean': round(sum(depths) / len(depths), 2),
+            'queue_depth_max': max(depths),
+            'queue_size': self.queue.maxsize
+        }
+
+class Pipeline:
+    def __init__(self, stages, source=None, sample_interval=1, report_interval=60):
+        """Connects a list of stages through bounded queues.
+
+        Each stage runs its own pool of workers, so while a stage is waiting for
+        the GitHub API, the following stages keep validating and exporting the
+        items already received.
+
+        Args:
+            stages: A list of Stage objects, in the order they are executed.
+            source: An optional Stage representing the producer of the items sent
+                to the first stage (e.g. the search of repositories). It is not
+                executed by the pipeline, but its throughput and queue depth,
+                updated by the producer, are reported with the other stages.
+            sample_interval: Number of seconds between two samples of the
+                queue depths.
+            report_interval: Number of seconds between two reports printed
+                while the pipeline is running.
+        """
+
+        self.stages = stages
+        self.source = source
+        self.sample_interval = sample_interval
+        self.report_interval = report_interval
+        self.output = queue.Queue(maxsize=stages[-1].queue.maxsize)
+
+    def run(self, items):
+        """Sends the items through all stages of the pipeline.
+
+        Args:
+            items: An iterable of items to be sent to the first stage.
+        Returns:
+            A generator of the items produced by the last stage, in the
+            order they are completed.
+        Raises:
+            The exception raised while reading the items, if any, after the
+            items already sent are processed.
+        """
+
+        finished = threading.Event()
+        threads = []
+        self.feed_exception = None
+
+        feeder = threading.Thread(target=self._feed, args=(items,), daemon=True)
+        threads.append(feeder)
+
+        for index, stage in enumerate(self.stages):
+            if index + 1 < len(self.stages):
+                next_queue, next_workers = self.stages[index + 1].queue, self.stages[index + 1].workers
+            else:
+                next_queue, next_workers = self.output, 1
+
+            executor = ProcessPoolExecutor(max_workers=stage.workers) if stage.use_processes else None
+            workers = [threading.Thread(target=self._work, args=(stage, executor, next_queue), daemon=True)
+                       for _ in range(stage.workers)]
+            closer = threading.Thread(target=self._close, args=(workers, executor, next_queue, next_workers), daemon=True)
+            threads.extend(workers + [closer])
+
+        monitor = threading.Thread(target=self._monitor, args=(finished,), daemon=True)
+        threads.append(monitor)
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self.output.get()
+
+                if item is _STOP:
+                    break
+
+                yield item
+
+            if self.feed_exception is not None:
+                raise self.feed_exception
+        finally:
+            finished.set()
+            self.print_report()
+
+    def report(self):
+        """Returns a list with the performance summary of each stage."""
+
+        return [stage.report() for stage in self._reported_stages()]
+
+    def _reported_stages(self):
+        return ([self.source] if self.source is not None else []) + self.stages
+
+    def print_report(self):
+        for summary in self.report():
+            print('[Pipeline] {stage}: {processed} items ({failed} failed), {items_per_second} items/s, '
+                  'utilization {utilization}, queue depth {queue_depth_mean} avg / {queue_depth_max} max '
+                  '(limit {queue_size}), {workers} workers.'.format(**summary))
+
+    def _feed(self, items):
+        first_stage = self.stages[0]
+
+        # The stages are always told to stop, even if the items can not be
+        # read, and the exception is raised again by run.
+        try:
+            for item in items:
+                first_stage.queue.put(item)
+        except Exception as exception:
+            self.feed_exception = exception
+        finally:
+            for _ in range(first_stage.workers):
+                first_stage.queue.put(_STOP)
+
+    def _work(self, stage, executor, next_queue):
+        stopped = False
+
+        while not stopped:
+            item = stage.queue.get()
+
+            if item is _STOP:
+                break
+
+            items = [item]
+
+            # Batches take the items already waiting, without waiting for more.
+            while stage.batch_size is not None and len(items) < stage.batch_size:
+                try:
+                    item = stage.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if item is _STOP:
+                    stopped = True
+                    break
+
+                items.append(item)
+
+            argument = items if stage.batch_size is not None else items[0]
+            started_at = time.time()
+
+            with stage.lock:
+                if stage.started_at is None:
+                    stage.started_at = started_at
+
+            try:
+                if executor is not None:
+                    results = executor.submit(stage.function, argument).result()
+                else:
+                    results = stage.function(argument)
+            except Exception as exception:
+                results = []
+
+                with stage.lock:
+                    stage.failed = stage.failed + len(items)
+
+                logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+                logging.info('Exception caught in the {} stage of pipeline.py'.format(stage.name))
+                logging.exception(exception)
+
+            with stage.lock:
+                stage.processed = stage.processed + len(items)
+                stage.produced = stage.produced + len(results)
+                stage.busy_seconds = stage.busy_seconds + (time.time() - started_at)
+
+            for result in results:
+                next_queue.put(result)
+
+        with stage.lock:
+            stage.finished_at = time.time()
+
+    def _close(self, workers, executor, next_queue, next_workers):
+        # Waits until every worker of a stage is done before
+        # telling the workers of the next stage to stop.
+        for worker in workers:
+            worker.join()
+
+        if executor is not None:
+            executor.shutdown()
+
+        for _ in range(next_workers):
+            next_queue.put(_STOP)
+
+    def _monitor(self, finished):
+        last_report = time.time()
+
+        while not finished.wait(self.sample_interval):
+            for stage in self._reported_stages():
+                stage.depth_samples.append(stage.depth())
+
+            if time.time() - last_report >= self.report_interval:
+                self.print_report()
+                last_report = time.time()
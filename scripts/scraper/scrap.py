@@ -4,9 +4,24 @@
 __author__ =  'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
+import math
+import time
 import logging
+from collections import deque
+from itertools import islice
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import api_scraper as scraper
 
+# GitHub API returns at most 1,000 results for each search query,
+# in pages of at most 100 results.
+# See: docs.github.com/en/rest/search#about-search
+SEARCH_RESULTS_LIMIT = 1000
+SEARCH_RESULTS_PER_PAGE = 100
+
+# Repositories created before this date do not exist.
+GITHUB_CREATION_DATE = date(2007, 10, 1)
+
 def scrap_repositories(programming_languages, api_pages):
     """Scraps repositories hosted on GitHub, ordered by popularity and language.
 
@@ -21,65 +36,348 @@ def scrap_repositories(programming_languages, api_pages):
             of which the most popular repositories will be extracted.
         api_pages: A list of integers representing the pages to be extracted for
             each programming language.
+    Returns:
+        A list of repositories, without duplicates. See iter_repositories for a
+        version that returns the repositories while the pages are requested.
     References:
         Borges, Hudson, Andre Hora, and Marco Tulio Valente. "Understanding
         the factors that impact the popularity of GitHub repositories." 2016
         IEEE International Conference on Software Maintenance and Evolution
         (ICSME). IEEE, 2016.
     """
+
+    return list(iter_repositories(programming_languages, api_pages))
+
+def iter_repositories(programming_languages, api_pages, workers=1):
+    """Scraps repositories hosted on GitHub, returning each one as soon as its page arrives.
+
+    Works as scrap_repositories, but instead of waiting for all the pages of all
+    the programming languages, it yields the repositories of a page as soon as
+    GitHub API answers it, so the following steps of the crawling can start
+    in seconds. Up to `workers` pages are requested at the same time.
+
+    The same repository may be returned in different pages (see LIMITATIONS.md),
+    so repositories are de-duplicated by their id.
+
+    Args:
+        programming_languages: A list of strings representing programming languages
+            of which the most popular repositories will be extracted.
+        api_pages: A list of integers representing the pages to be extracted for
+            each programming language.
+        workers: An integer representing the number of pages requested at the
+            same time.
+    Returns:
+        A generator of dictionaries, each one representing a repository.
+    """
+
+    searches = iter([(language, page) for language in programming_languages for page in api_pages])
+    seen_ids = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Keeps a limited number of pages being requested, so the
+        # memory usage does not depend on the number of pages.
+        pending = set()
+
+        for language, page in islice(searches, workers * 2):
+            pending.add(executor.submit(scrap_repositories_page, language, page))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                for repository in future.result():
+                    if repository['id'] not in seen_ids:
+                        seen_ids.add(repository['id'])
+                        yield repository
+
+                for language, page in islice(searches, 1):
+                    pending.add(executor.submit(scrap_repositories_page, language, page))
+
+def iter_top_repositories(programming_languages, n_repositories, workers=1, stage=None):
+    """Scraps the `n_repositories` most popular repositories of each programming language.
+
+    GitHub API returns at most 1,000 results for a search query, no matter how
+    many pages are requested. To go beyond this limit, the search of each
+    programming language is split into shards of stars (e.g. `stars:5000..7200`),
+    each one containing less than 1,000 repositories. When more than 1,000
+    repositories have the same number of stars, the shard is split again by
+    creation date. The shards and their pages are requested at the same time,
+    and the repositories are returned as soon as their page arrives.
+
+    Args:
+        programming_languages: A list of strings representing programming languages
+            of which the most popular repositories will be extracted.
+        n_repositories: An integer representing the number of repositories to be
+            extracted for each programming language.
+        workers: An integer representing the number of requests executed at the
+            same time.
+        stage: An optional Stage (see pipeline.py) where the requests, the
+            repositories found and the pages waiting to be requested are
+            recorded, so the search is reported with the stages of a Pipeline.
+    Returns:
+        A generator of dictionaries, each one representing a repository.
+    """
+
+    per_page = SEARCH_RESULTS_PER_PAGE
+    collected = {language: 0 for language in programming_languages}
+    seen_ids = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        if stage is None:
+            submit = executor.submit
+        else:
+            submit = lambda function, *args: executor.submit(stage.track, function, *args)
+
+        pending = {} # Futures being executed and what they represent
+        waiting_pages = deque() # Pages of planned shards not requested yet
+
+        for language in programming_languages:
+            pending[submit(plan_next_shards, language, None)] = ('plan', language)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                task, language = pending.pop(future)
+
+                if task == 'plan':
+                    shards, next_highest_stars = future.result()
+
+                    for qualifiers, count in shards:
+                        limit = min(count, n_repositories - collected[language])
+
+                        if limit <= 0:
+                            break
+
+                        collected[language] = collected[language] + limit
+
+                        for page in range(1, math.ceil(limit / per_page) + 1):
+                            waiting_pages.append((language, page, qualifiers, per_page, limit))
+
+                    if next_highest_stars is not None and collected[language] < n_repositories:
+                        pending[submit(plan_next_shards, language, next_highest_stars)] = ('plan', language)
+                else:
+                    for repository in future.result():
+                        if repository['id'] not in seen_ids:
+                            seen_ids.add(repository['id'])
+
+                            if stage is not None:
+                                with stage.lock:
+                                    stage.produced = stage.produced + 1
+
+                            yield repository
+
+            # Keeps a limited number of pages being requested, so the
+            # memory usage does not depend on the number of shards.
+            requested_pages = sum(1 for task, _ in pending.values() if task == 'page')
+
+            while waiting_pages and requested_pages < workers * 2:
+                language, page, qualifiers, per_page, limit = waiting_pages.popleft()
+                future = submit(scrap_repositories_page, language, page, qualifiers, per_page, limit)
+                pending[future] = ('page', language)
+                requested_pages = requested_pages + 1
+
+            if stage is not None:
+                stage.waiting = len(pending) + len(waiting_pages)
+
+    if stage is not None:
+        with stage.lock:
+            stage.finished_at = time.time()
+
+def plan_next_shards(language, highest_stars):
+    """Finds the next shards of a search, starting from the most popular repositories.
+
+    The repository in the 1,000th position of the search (i.e. the last one
+    returned by GitHub API) defines the next shard: all repositories with more
+    stars than it fit in a single search. If this repository has as many stars
+    as the most popular one, the repositories with this number of stars are
+    split by creation date (see shard_by_creation_date).
+
+    Args:
+        language: A string representing the programming language of the repositories.
+        highest_stars: An integer representing the maximum number of stars of the
+            repositories in the next shards. If None, starts from the most popular
+            repository.
+    Returns:
+        A list of tuples (qualifiers, count), where qualifiers is a string to be
+        added to the search query and count is the number of repositories in the
+        shard, and the maximum number of stars of the following shards (None if
+        there are no more repositories).
+    """
+
+    api_scraper = scraper.Create()
+    api_repositories_url = 'https://api.github.com/search/repositories'
+    stars_qualifier = 'stars:<={}'.format(highest_stars) if highest_stars is not None else ''
+    last_page = SEARCH_RESULTS_LIMIT // SEARCH_RESULTS_PER_PAGE
+
+    print("Planning shards of repositories written in {} ({}).".format(language, stars_qualifier or 'all stars'))
+    parameters = {'q': ' '.join(['language:' + language, stars_qualifier]).strip(),
+                  'sort': 'stars', 'order': 'desc', 'page': last_page, 'per_page': SEARCH_RESULTS_PER_PAGE}
+    response = api_scraper.request(api_repositories_url, parameters)
+
+    try:
+        repositories, total_count = response['items'], response['total_count']
+
+        # The remaining repositories fit in a single search.
+        if total_count <= SEARCH_RESULTS_LIMIT or len(repositories) < SEARCH_RESULTS_PER_PAGE:
+            return [(stars_qualifier, total_count)], None
+
+        threshold = repositories[-1]['stargazers_count']
+
+        if threshold == highest_stars:
+            shards = shard_by_creation_date(language, 'stars:{}'.format(threshold))
+            return shards, threshold - 1
+
+        if highest_stars is not None:
+            shard_qualifier = 'stars:{}..{}'.format(threshold + 1, highest_stars)
+        else:
+            shard_qualifier = 'stars:>{}'.format(threshold)
+
+        # If some repositories in the last page have more stars than the threshold,
+        # all the repositories in the previous pages are part of the shard.
+        # Otherwise, the shard size is requested to GitHub API.
+        above_threshold = sum(1 for repository in repositories if repository['stargazers_count'] > threshold)
+
+        if above_threshold > 0:
+            count = SEARCH_RESULTS_LIMIT - SEARCH_RESULTS_PER_PAGE + above_threshold
+        else:
+            count = count_repositories(language, shard_qualifier)
+
+        return [(shard_qualifier, count)], threshold
+
+    except:
+        logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+        logging.warning('It was impossible to plan the shards of {} ({}) in scrap.py.'.format(language, stars_qualifier))
+        logging.exception(response)
+
+    return [], None
+
+def shard_by_creation_date(language, stars_qualifier, since=None, until=None):
+    """Splits the repositories of a shard of stars by creation date.
+
+    Args:
+        language: A string representing the programming language of the repositories.
+        stars_qualifier: A string representing the shard of stars (e.g. `stars:42`).
+        since: A date where the shard starts. If None, the creation of GitHub is used.
+        until: A date where the shard ends. If None, the current date is used.
+    Returns:
+        A list of tuples (qualifiers, count), in accordance with the
+        plan_next_shards output.
+    """
+
+    since = since or GITHUB_CREATION_DATE
+    until = until or date.today()
+    qualifiers = '{} created:{}..{}'.format(stars_qualifier, since.isoformat(), until.isoformat())
+    total_count = count_repositories(language, qualifiers)
+
+    if total_count <= SEARCH_RESULTS_LIMIT or since == until:
+        return [(qualifiers, total_count)] if total_count > 0 else []
+
+    middle = since + (until - since) / 2
+
+    return shard_by_creation_date(language, stars_qualifier, since, middle) + \
+           shard_by_creation_date(language, stars_qualifier, middle + timedelta(days=1), until)
+
+def count_repositories(language, qualifiers):
+    """Counts the repositories written in a programming language that match a search.
+
+    Args:
+        language: A string representing the programming language of the repositories.
+        qualifiers: A string with additional search qualifiers (e.g. a shard of stars).
+    Returns:
+        An integer representing the number of repositories found. If the search
+        fails, zero is returned.
+    """
+
     api_scraper = scraper.Create()
     api_repositories_url = 'https://api.github.com/search/repositories'
-    repositories = []
 
-    for language in programming_languages:
-        for page in api_pages:
-            print("Extracting repositories in page {} written in {}.".format(page, language))
-            parameters = {'q': 'language:' + language, 'sort': 'stars', 'order': 'desc', 'page': page}
-            response = api_scraper.request(api_repositories_url, parameters)
+    parameters = {'q': ' '.join(['language:' + language, qualifiers]).strip(), 'per_page': 1}
+    response = api_scraper.request(api_repositories_url, parameters)
 
-            try:
-                response = response['items']
+    try:
+        return response['total_count']
+    except:
+        logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+        logging.warning('It was impossible to count the repositories of {} ({}) in scrap.py.'.format(language, qualifiers))
+        logging.exception(response)
 
-                # Some projects received from API have a None value for the language
-                # parameter instead of their respective language, so in such cases
-                # we manually update the repository's language.
+    return 0
 
-                for index, repository in enumerate(response):
-                    repository['language'] = language
-                    response[index] = repository
+def scrap_repositories_page(language, page, qualifiers='', per_page=30, limit=None):
+    """Scraps one page of the most popular repositories written in a programming language.
 
-                repositories = repositories + response
+    Args:
+        language: A string representing the programming language of the repositories.
+        page: An integer representing the page to be extracted.
+        qualifiers: A string with additional search qualifiers (e.g. a shard of stars).
+        per_page: An integer representing the number of repositories per page.
+        limit: An integer representing the number of repositories to be extracted
+            from the search. Repositories after this position are ignored.
+    Returns:
+        A list of dictionaries, each one representing a repository. If the page
+        can not be extracted, an empty list is returned.
+    """
+
+    api_scraper = scraper.Create()
+    api_repositories_url = 'https://api.github.com/search/repositories'
+
+    print("Extracting repositories in page {} written in {}.".format(page, language))
+    parameters = {'q': ' '.join(['language:' + language, qualifiers]).strip(),
+                  'sort': 'stars', 'order': 'desc', 'page': page, 'per_page': per_page}
+    response = api_scraper.request(api_repositories_url, parameters)
+
+    try:
+        repositories = response['items']
+
+        if limit is not None:
+            repositories = repositories[:max(0, limit - (page - 1) * per_page)]
+
+        # Some projects received from API have a None value for the language
+        # parameter instead of their respective language, so in such cases
+        # we manually update the repository's language.
+
+        for repository in repositories:
+            repository['language'] = language
+
+        return repositories
+
+    except:
+        logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+        logging.warning('It was impossible to scrap the repositories page {} of {} in scrap.py.'.format(page, language))
+        logging.exception(response)
 
-            except:
-                logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
-                logging.warning('It was impossible to scrap the repositories page {} of {} in scrap.py.'.format(page, language))
-                logging.exception(response)
-            
-    return repositories
+    return []
 
-def scrap_documentation_file(owner, name, filename):
+def scrap_documentation_file(owner, name, filename, download_content=True):
     """Scraps a documentation file of a repository hosted on GitHub.
 
     Args:
         owner: String representing the organization or user owner of the repository.
         name: String representing the repository name.
         filename: The name of the documentation file that will be extracted.
+        download_content: Boolean defining if the content of the file is downloaded.
+            If False, only the description of the file is extracted, so it can be
+            validated before downloading the content (see scrap_documentation_content).
     Returns:
-        A dictionary containing three values: the name of the extracted file, 
+        A dictionary containing four values: the name of the extracted file, 
         the description of this file (represented by the 'description' key),
-        and the content of the file (represented by the 'content' key). If
-        one of the last two values are not found in the API, None is returned.
+        the content of the file (represented by the 'content' key) and the
+        repository the file belongs to (represented by the 'repository' key).
+        If the description or the content are not found in the API, None is
+        returned for them.
     """
 
     api_scraper = scraper.Create()
-    documentation_file = {'filename': filename, 'content': None, 'description': None}
+    documentation_file = {'filename': filename, 'content': None, 'description': None,
+                          'repository': '{}/{}'.format(owner, name)}
 
     # In some community profiles, the necessary values are missing, and we can
     # not predict it. For this reason, we need to check if all the keys and values
     # exist before performing the scraping of the documentation file.
 
     try:
-        print("Downloading {} file of {}/{}.".format(filename, owner, name))
+        print("Downloading the description of {} file of {}/{}.".format(filename, owner, name))
 
         # The community profile is used to get a documentation file of a repository. 
         # The definition of community profile is available at the API documentation:
@@ -95,12 +393,34 @@ def scrap_documentation_file(owner, name, filename):
         description_url = community_profile['files'][filename]['url']
         description = api_scraper.request(description_url)
         documentation_file['description'] = description
+    except:
+        logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
+        logging.warning('Impossible to download the {} documentation file from {}/{} in scrap.py.'.format(filename, owner, name))
+
+    if download_content and documentation_file['description'] is not None:
+        scrap_documentation_content(documentation_file)
+
+    return documentation_file
+
+def scrap_documentation_content(documentation_file):
+    """Downloads the content of a documentation file already described by GitHub API.
+
+    Args:
+        documentation_file: A dictionary in accordance with the scrap_documentation_file
+            output. Its 'content' key is updated with the downloaded content.
+    Returns:
+        The documentation_file dictionary.
+    """
 
-        download_url = description['download_url']
+    api_scraper = scraper.Create()
+
+    try:
+        print("Downloading {} file of {}.".format(documentation_file['filename'], documentation_file['repository']))
+        download_url = documentation_file['description']['download_url']
         content = api_scraper.request(download_url, file_type='text')
         documentation_file['content'] = content
     except:
         logging.basicConfig(filename='exceptions.log', level=logging.DEBUG)
-        logging.warning('Impossible to download the {} documentation file from {}/{} in scrap.py.'.format(filename, owner, name))
+        logging.warning('Impossible to download the {} documentation file from {} in scrap.py.'.format(documentation_file['filename'], documentation_file['repository']))
 
-    return documentation_file
\ No newline at end of file
+    return documentation_file
@@ -5,7 +5,35 @@ __author__ =  'Felipe Fronchetti'
 __contact__ = 'fronchetti@usp.br'
 
 import os
-from langdetect import detect
+import re
+import hashlib
+from collections import Counter, OrderedDict
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+# langdetect uses a random sampling of the text. Setting a seed makes
+# the language detected for the same content the same in every run.
+DetectorFactory.seed = 0
+
+# Instead of the whole content, the language is detected in a few windows
+# of characters (beginning, middle and end of the file), and the most
+# common language between them is used.
+LANGUAGE_WINDOW_SIZE = 2000
+LANGUAGE_WINDOWS = 3
+
+# Languages already detected by the process, indexed by the hash of the
+# content. When the cache is full, the least recently used one is discarded.
+LANGUAGE_CACHE_SIZE = 10000
+_languages_detected = OrderedDict()
+
+# langdetect has a fixed cost per call that dominates the validation of
+# small files. Contents written in (unaccented) Latin letters in which these
+# words are frequent (see ENGLISH_STOPWORDS_RATIO) are accepted as English
+# without calling it; the remaining contents are detected by langdetect.
+ENGLISH_STOPWORDS = frozenset(['the', 'and', 'of', 'you', 'your', 'for', 'this', 'that',
+                               'with', 'are', 'please', 'we', 'should', 'have', 'from'])
+ENGLISH_STOPWORDS_RATIO = 0.15
+WORD_PATTERN = re.compile(r'[^\W\d_]+')
 
 def validate_documentation(document):
     """Checks if the documentation file of a project meets the research set of requirements.
@@ -19,6 +47,12 @@ def validate_documentation(document):
     with documentation files that do not fit these requirements receive as output
     an invalidation flag with the respective reasons for their invalidation.
 
+    The filters are applied in two phases: the ones that only need the
+    description of the file returned by GitHub API (see validate_documentation_metadata)
+    and the ones that need its content (see validate_documentation_content). 
+    The content is only checked if the description is valid, so files rejected
+    in the first phase don't need to be downloaded.
+
     Args:
         document: Data of a documentation file of a project, in accordance with the 
             scrap_documentation_file method output.
@@ -30,9 +64,32 @@ def validate_documentation(document):
         will be an empty string. 
     """  
 
+    is_valid, reasons_for_invalidation = validate_documentation_metadata(document)
+
+    if is_valid:
+        is_valid, reasons_for_invalidation = validate_documentation_content(document)
+
+    return is_valid, reasons_for_invalidation
+
+def validate_documentation_metadata(document):
+    """Checks the requirements that only depend on the description of a documentation file.
+
+    The description returned by GitHub API contains the name and the size of
+    the file, so it is possible to check if the file is empty (i.e. size smaller
+    than 0.5kB) and written in Markdown before downloading its content.
+
+    Args:
+        document: Data of a documentation file of a project, in accordance with the 
+            scrap_documentation_file method output. The content is not required.
+    Returns:
+        A boolean value representing the invalidation flag is_valid and a string
+        containing the possible reasons for invalidation, in accordance with the
+        validate_documentation output.
+    """
+
     def check_if_is_complete(document):
         nonlocal is_valid
-        if document['content'] is None or document['description'] is None:
+        if document['description'] is None:
             is_valid = False
             reasons_for_invalidation.append(document['filename'] + " is missing.")
         else:
@@ -58,9 +115,46 @@ def validate_documentation(document):
             is_valid = False
             reasons_for_invalidation.append(document['filename'] + " is not in Markdown.")
 
+    is_valid = True # Flag that defines if the documentation file is valid
+    reasons_for_invalidation = [] # List of strings definining reasons for file invalidation
+
+    # First, we check if the description of the documentation file
+    # is available in the GitHub API.
+
+    check_if_is_complete(document)
+
+    # If it is available, we check if the documentation file
+    # is empty and written in Markdown.
+
+    if is_valid:
+        check_if_is_empty(document)
+        check_if_is_written_in_markdown(document)
+        
+    return is_valid, '\n'.join(reasons_for_invalidation)
+
+def validate_documentation_content(document, language=None):
+    """Checks the requirements that depend on the content of a documentation file.
+
+    Args:
+        document: Data of a documentation file of a project, in accordance with the 
+            scrap_documentation_file method output.
+        language: A string representing the language of the content, if it was
+            already detected (see validate_documentation_contents).
+    Returns:
+        A boolean value representing the invalidation flag is_valid and a string
+        containing the possible reasons for invalidation, in accordance with the
+        validate_documentation output.
+    """
+
+    def check_if_is_complete(document):
+        nonlocal is_valid
+        if document['content'] is None:
+            is_valid = False
+            reasons_for_invalidation.append(document['filename'] + " is missing.")
+
     def check_if_is_written_in_english(document):
         nonlocal is_valid
-        file_language = detect(document['content'])
+        file_language = language if language is not None else detect_language(document['content'])
 
         if file_language != 'en':
             is_valid = False
@@ -69,17 +163,135 @@ def validate_documentation(document):
     is_valid = True # Flag that defines if the documentation file is valid
     reasons_for_invalidation = [] # List of strings definining reasons for file invalidation
 
-    # First, we check if the data of the documentation file
-    # is available in the GitHub API.
-
     check_if_is_complete(document)
 
-    # If it is available, we check if the documentation file
-    # is empty, written in Markdown and in English.
-
     if is_valid:
-        check_if_is_empty(document)
-        check_if_is_written_in_markdown(document)
         check_if_is_written_in_english(document)
-        
-    return is_valid, '\n'.join(reasons_for_invalidation)
\ No newline at end of file
+
+    return is_valid, '\n'.join(reasons_for_invalidation)
+
+def validate_documentation_contents(documents):
+    """Checks the requirements that depend on the content of a batch of documentation files.
+
+    The languages of all contents are detected in one call (see detect_languages),
+    so identical contents (e.g. files copied from a template) are detected once.
+
+    Args:
+        documents: A list of documentation files, in accordance with the
+            scrap_documentation_file method output.
+    Returns:
+        A list of tuples (is_valid, reasons_for_invalidation), one per document,
+        in accordance with the validate_documentation_content output.
+    """
+
+    languages = iter(detect_languages([document['content'] for document in documents
+                                       if document['content'] is not None]))
+
+    return [validate_documentation_content(document, next(languages) if document['content'] is not None else None)
+            for document in documents]
+
+def detect_language(content):
+    """Detects the language of the content of a documentation file.
+
+    Running langdetect on the whole content of large files is slow, so the
+    language is detected in LANGUAGE_WINDOWS windows of LANGUAGE_WINDOW_SIZE
+    characters spread over the content, and the most common language between
+    them is returned (in case of a tie, the one of the first window). Contents
+    that are clearly written in English (see is_clearly_english) are not
+    passed to langdetect. The result is cached by the hash of the content (see LANGUAGE_CACHE_SIZE).
+
+    Args:
+        content: A string containing the content of a documentation file.
+    Returns:
+        A string representing the language code (e.g. 'en'), or 'unknown'
+        if no language can be detected.
+    """
+
+    return detect_languages([content])[0]
+
+def detect_languages(contents):
+    """Detects the language of a batch of documentation files.
+
+    Each distinct content is detected once (see detect_language), and the
+    languages are cached by the hash of the content (see LANGUAGE_CACHE_SIZE).
+
+    Args:
+        contents: A list of strings, each one containing the content of a
+            documentation file.
+    Returns:
+        A list of strings representing the language code of each content,
+        in accordance with the detect_language output.
+    """
+
+    content_hashes = [hashlib.sha1(content.encode('utf-8', errors='replace')).hexdigest() for content in contents]
+    languages = {}
+
+    for content_hash, content in zip(content_hashes, contents):
+        if content_hash in languages:
+            continue
+
+        if content_hash in _languages_detected:
+            _languages_detected.move_to_end(content_hash)
+            languages[content_hash] = _languages_detected[content_hash]
+            continue
+
+        if is_clearly_english(content):
+            languages[content_hash] = 'en'
+        else:
+            votes = Counter()
+
+            for window in sample_windows(content):
+                try:
+                    votes[detect(window)] += 1
+                except LangDetectException:
+                    # Windows without letters (e.g. code blocks) have no language.
+                    pass
+
+            languages[content_hash] = votes.most_common(1)[0][0] if votes else 'unknown'
+
+        _languages_detected[content_hash] = languages[content_hash]
+
+        if len(_languages_detected) > LANGUAGE_CACHE_SIZE:
+            _languages_detected.popitem(last=False)
+
+    return [languages[content_hash] for content_hash in content_hashes]
+
+def is_clearly_english(content):
+    """Checks if the first window of a content (see LANGUAGE_WINDOW_SIZE) is clearly
+    written in English, i.e. its letters are ASCII (accented and non-Latin letters are
+    left to langdetect) and at least ENGLISH_STOPWORDS_RATIO of its words are in
+    ENGLISH_STOPWORDS.
+
+    Args:
+        content: A string containing the content of a documentation file.
+    Returns:
+        A boolean value, True if the content is clearly written in English. False
+        means that the language must be detected by langdetect.
+    """
+
+    words = WORD_PATTERN.findall(content[:LANGUAGE_WINDOW_SIZE].lower())
+
+    if not words or not all(word.isascii() for word in words):
+        return False
+
+    return sum(word in ENGLISH_STOPWORDS for word in words) >= ENGLISH_STOPWORDS_RATIO * len(words)
+
+def sample_windows(content):
+    """Splits a content in windows of characters used to detect its language.
+
+    Args:
+        content: A string containing the content of a documentation file.
+    Returns:
+        A list of strings. If the content is smaller than the windows together,
+        the whole content is returned as a single window.
+    """
+
+    if len(content) <= LANGUAGE_WINDOW_SIZE * LANGUAGE_WINDOWS:
+        return [content]
+
+    # Windows start at the beginning of the content, and the
+    # last one ends exactly at the end of the content.
+    step = (len(content) - LANGUAGE_WINDOW_SIZE) // (LANGUAGE_WINDOWS - 1)
+    starts = [index * step for index in range(LANGUAGE_WINDOWS)]
+
+    return [content[start:start + LANGUAGE_WINDOW_SIZE] for start in starts]